@@ -1,4 +1,9 @@
 import abc
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+logger.addHandler(logging.NullHandler())
 
 
 class Receiver(abc.ABC):
@@ -12,10 +17,35 @@ class Receiver(abc.ABC):
 
 
 class Sender(abc.ABC):
+    # seconds prepare() may take, None for the startup default
+    ready_timeout: float | None = None
+    # time.monotonic() of startup and of the first frame delivered
+    started_at: float | None = None
+    first_delivery: float | None = None
+
     @abc.abstractmethod
     def __init__(self, *args, **kwargs):
         ...
 
+    async def prepare(self):
+        """
+        Opens connections before the receiver starts, so the first frames
+        don't wait on a handshake.  Nothing to do by default
+        """
+
+    def delivered(self):
+        """
+        Called for each frame sent on.  Reports time to the first frame
+        """
+        if self.first_delivery is not None:
+            return
+        self.first_delivery = time.monotonic()
+        if self.started_at is not None:
+            logger.info(
+                f"{self!r} delivered its first frame "
+                f"{(self.first_delivery - self.started_at) * 1000:.0f}ms after startup"
+            )
+
     @abc.abstractmethod
     async def send(self):
         ...
@@ -0,0 +1,414 @@
+"""
+Per-game summaries over a tree of FileWriter archives and frame stores.
+
+    ntcpycon-analytics recordings/ --format csv --output games.csv
+
+Files are analyzed in a process pool.  Results are cached per file, keyed
+by mtime and size, so reruns only decode new or changed archives.  With
+numpy installed each archive is decoded in bulk and games are summarized
+from the decoded columns; without it every frame is decoded on its own.
+"""
+from __future__ import annotations
+
+import argparse
+import concurrent.futures
+import csv
+import dataclasses
+import json
+import logging
+import os
+import pathlib
+import sys
+import typing
+
+import ntcpycon.binaryframe
+import ntcpycon.bulk
+import ntcpycon.delta_archive
+import ntcpycon.file_handler
+import ntcpycon.frame_store
+import ntcpycon.gzip_members
+
+BinaryFrame3 = ntcpycon.binaryframe.BinaryFrame3
+DeltaArchive = ntcpycon.delta_archive.DeltaArchive
+FrameStore = ntcpycon.frame_store.FrameStore
+iter_frames = ntcpycon.file_handler.iter_frames
+read_archive = ntcpycon.gzip_members.read_archive
+np = ntcpycon.bulk.np
+
+logger = logging.getLogger(__name__)
+logger.addHandler(logging.NullHandler())
+
+CACHE_FILENAME = ".ntcpycon-analytics.json"
+
+# bump when GameSummary changes so stale cache entries are recomputed
+CACHE_VERSION = 1
+
+PATTERNS = (
+    "*.bframes",
+    f"*{ntcpycon.frame_store.SUFFIX}",
+    f"*{ntcpycon.delta_archive.SUFFIX}",
+)
+
+# spawn DAS charge that lets a piece shift on its first frame
+DAS_CHARGED = 10
+
+ELAPSED_WRAP = 2**28
+
+
+@dataclasses.dataclass
+class GameSummary:
+    file: str
+    game_id: int
+    frames: int = 0
+    duration: float = 0.0
+    start_level: int = 0
+    level: int = 0
+    lines: int = 0
+    score: int = 0
+    singles: int = 0
+    doubles: int = 0
+    triples: int = 0
+    tetrises: int = 0
+    tetris_rate: float = 0.0
+    t: int = 0
+    j: int = 0
+    z: int = 0
+    o: int = 0
+    s: int = 0
+    l: int = 0
+    i: int = 0
+    pieces: int = 0
+    spawn_das_mean: float = 0.0
+    das_charged_rate: float = 0.0
+    # [level, lines, seconds into the game] for every level change
+    level_transitions: list = dataclasses.field(default_factory=list)
+
+
+class GameBuilder:
+    """
+    Accumulates the frames of one game
+    """
+
+    def __init__(self, file: str, first: BinaryFrame3):
+        self.summary = GameSummary(
+            file=file,
+            game_id=first.game_id,
+            start_level=first.level,
+        )
+        self.start = first.elapsed
+        self.last = first
+        self.spawn_das_total = 0
+        self.spawns = 0
+        self.charged = 0
+        self.summary.frames = 1
+
+    def add(self, frame: BinaryFrame3):
+        last = self.last
+        summary = self.summary
+        summary.frames += 1
+        if (cleared := frame.lines - last.lines) > 0:
+            if cleared == 1:
+                summary.singles += 1
+            elif cleared == 2:
+                summary.doubles += 1
+            elif cleared == 3:
+                summary.triples += 1
+            elif cleared == 4:
+                summary.tetrises += 1
+        if frame.level != last.level:
+            summary.level_transitions.append(
+                [frame.level, frame.lines, round(self.seconds(frame), 3)]
+            )
+        if piece_total(frame) > piece_total(last):
+            self.spawns += 1
+            self.spawn_das_total += frame.cur_piece_das
+            self.charged += frame.cur_piece_das >= DAS_CHARGED
+        self.last = frame
+
+    def seconds(self, frame: BinaryFrame3) -> float:
+        return ((frame.elapsed - self.start) % ELAPSED_WRAP) / 1000
+
+    def finish(self) -> GameSummary:
+        last = self.last
+        summary = self.summary
+        summary.duration = round(self.seconds(last), 3)
+        summary.level = last.level
+        summary.lines = last.lines
+        summary.score = last.score
+        for piece in PIECES:
+            setattr(summary, piece, getattr(last, piece))
+        summary.pieces = piece_total(last)
+        if last.lines:
+            summary.tetris_rate = round(4 * summary.tetrises / last.lines, 4)
+        if self.spawns:
+            summary.spawn_das_mean = round(self.spawn_das_total / self.spawns, 2)
+            summary.das_charged_rate = round(self.charged / self.spawns, 4)
+        return summary
+
+
+def piece_total(frame: BinaryFrame3) -> int:
+    return frame.t + frame.j + frame.z + frame.o + frame.s + frame.l + frame.i
+
+
+PIECES = ("t", "j", "z", "o", "s", "l", "i")
+
+# decoded by analyze_bulk, everything but the playfield
+BULK_COLUMNS = (
+    "game_id",
+    "elapsed",
+    "lines",
+    "level",
+    "score",
+    "cur_piece_das",
+    *PIECES,
+)
+
+
+def iter_archive(filename: str) -> typing.Iterator[bytes | memoryview]:
+    if filename.endswith(ntcpycon.frame_store.SUFFIX):
+        with FrameStore(filename) as store:
+            yield from store
+    elif filename.endswith(ntcpycon.delta_archive.SUFFIX):
+        with DeltaArchive(filename) as archive:
+            yield from archive
+    else:
+        # files are already spread over the process pool
+        yield from iter_frames(filename, workers=1)
+
+
+def load_frames(filename: str):
+    """
+    Every version 3 frame of an archive as an (n, 73) uint8 array
+    """
+    if filename.endswith(ntcpycon.frame_store.SUFFIX):
+        with FrameStore(filename) as store:
+            data = bytes(store[:])
+    elif filename.endswith(ntcpycon.delta_archive.SUFFIX):
+        with DeltaArchive(filename) as archive:
+            data = b"".join(archive)
+    else:
+        # files are already spread over the process pool
+        data = read_archive(filename, workers=1)
+    return ntcpycon.bulk.from_bytes(data)
+
+
+def summarize_game(file: str, columns: dict, start: int, stop: int) -> GameSummary:
+    """
+    GameBuilder's summary of frames [start, stop), from decoded columns
+    """
+    game = {name: values[start:stop] for name, values in columns.items()}
+    lines = game["lines"].astype(np.int64)
+    level = game["level"]
+    elapsed = game["elapsed"].astype(np.int64)
+    summary = GameSummary(
+        file=file,
+        game_id=int(game["game_id"][0]),
+        frames=stop - start,
+        start_level=int(level[0]),
+    )
+
+    def seconds(index: int) -> float:
+        return int((elapsed[index] - elapsed[0]) % ELAPSED_WRAP) / 1000
+
+    cleared = np.diff(lines)
+    summary.singles = int(np.count_nonzero(cleared == 1))
+    summary.doubles = int(np.count_nonzero(cleared == 2))
+    summary.triples = int(np.count_nonzero(cleared == 3))
+    summary.tetrises = int(np.count_nonzero(cleared == 4))
+    for index in np.flatnonzero(level[1:] != level[:-1]) + 1:
+        summary.level_transitions.append(
+            [int(level[index]), int(lines[index]), round(seconds(index), 3)]
+        )
+    totals = sum(game[piece].astype(np.int64) for piece in PIECES)
+    spawn_das = game["cur_piece_das"][1:][np.diff(totals) > 0]
+    if len(spawn_das):
+        summary.spawn_das_mean = round(int(spawn_das.sum()) / len(spawn_das), 2)
+        summary.das_charged_rate = round(
+            int(np.count_nonzero(spawn_das >= DAS_CHARGED)) / len(spawn_das), 4
+        )
+
+    summary.duration = round(seconds(-1), 3)
+    summary.level = int(level[-1])
+    summary.lines = int(lines[-1])
+    summary.score = int(game["score"][-1])
+    for piece in PIECES:
+        setattr(summary, piece, int(game[piece][-1]))
+    summary.pieces = int(totals[-1])
+    if summary.lines:
+        summary.tetris_rate = round(4 * summary.tetrises / summary.lines, 4)
+    return summary
+
+
+def analyze_bulk(filename: str) -> list[GameSummary]:
+    """
+    analyze_file with the archive decoded in one go by ntcpycon.bulk
+    """
+    frames = load_frames(filename)
+    if not len(frames):
+        return []
+    columns = {name: ntcpycon.bulk.column(frames, name) for name in BULK_COLUMNS}
+    game_id = columns["game_id"]
+    starts = [0, *(np.flatnonzero(game_id[1:] != game_id[:-1]) + 1), len(frames)]
+    return [
+        summarize_game(filename, columns, int(start), int(stop))
+        for start, stop in zip(starts, starts[1:])
+    ]
+
+
+def analyze_file(filename: str) -> list[GameSummary]:
+    """
+    Splits an archive into games by game_id
+    """
+    if np is not None:
+        return analyze_bulk(filename)
+    games = []
+    builder: GameBuilder | None = None
+    skipped = 0
+    for payload in iter_archive(filename):
+        if payload[0] >> 5 != BinaryFrame3.VERSION:
+            skipped += 1
+            continue
+        frame = BinaryFrame3.from_payload(payload)
+        if builder is None or frame.game_id != builder.summary.game_id:
+            if builder:
+                games.append(builder.finish())
+            builder = GameBuilder(filename, frame)
+            continue
+        builder.add(frame)
+    if builder:
+        games.append(builder.finish())
+    if skipped:
+        logger.info(f"Skipped {skipped} frames older than version 3 in {filename}")
+    return games
+
+
+def analyze_worker(filename: str) -> tuple[str, list[dict] | None, str | None]:
+    try:
+        games = analyze_file(filename)
+    except Exception as exc:
+        return filename, None, f"{type(exc).__name__}: {exc!s}"
+    return filename, [dataclasses.asdict(game) for game in games], None
+
+
+def load_cache(filename: str) -> dict:
+    try:
+        with open(filename) as file:
+            cache = json.load(file)
+    except (OSError, ValueError):
+        return {}
+    if cache.get("version") != CACHE_VERSION:
+        return {}
+    return cache.get("files", {})
+
+
+def save_cache(filename: str, files: dict):
+    temporary = f"{filename}.tmp"
+    with open(temporary, "w") as file:
+        json.dump({"version": CACHE_VERSION, "files": files}, file)
+    os.replace(temporary, filename)
+
+
+def analyze_tree(
+    directory: str,
+    jobs: int | None = None,
+    cache_file: str | None = None,
+) -> list[GameSummary]:
+    root = pathlib.Path(directory)
+    paths = sorted(str(path) for pattern in PATTERNS for path in root.rglob(pattern))
+    cache = load_cache(cache_file) if cache_file else {}
+    files = {}
+    stale = []
+    for path in paths:
+        stat = os.stat(path)
+        key = [stat.st_mtime_ns, stat.st_size]
+        if (entry := cache.get(path)) and entry["key"] == key:
+            files[path] = entry
+        else:
+            files[path] = {"key": key, "games": []}
+            stale.append(path)
+    logger.info(f"{len(paths)} archives, {len(stale)} to analyze")
+
+    if stale:
+        workers = jobs or os.cpu_count() or 1
+        chunksize = max(1, len(stale) // (4 * workers))
+        with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as executor:
+            for path, games, error in executor.map(
+                analyze_worker, stale, chunksize=chunksize
+            ):
+                if error:
+                    logger.warning(f"Unable to analyze {path}: {error}")
+                    # retried on the next run
+                    del files[path]
+                    continue
+                files[path]["games"] = games
+
+    if cache_file:
+        save_cache(cache_file, files)
+    return [GameSummary(**game) for entry in files.values() for game in entry["games"]]
+
+
+def write_csv(games: list[GameSummary], file: typing.TextIO):
+    fields = [field.name for field in dataclasses.fields(GameSummary)]
+    writer = csv.DictWriter(file, fieldnames=fields)
+    writer.writeheader()
+    for game in games:
+        row = dataclasses.asdict(game)
+        row["level_transitions"] = ";".join(
+            f"{level}@{lines}/{seconds}s"
+            for level, lines, seconds in game.level_transitions
+        )
+        writer.writerow(row)
+
+
+def write_json(games: list[GameSummary], file: typing.TextIO):
+    json.dump([dataclasses.asdict(game) for game in games], file, indent=2)
+    file.write("\n")
+
+
+FORMATS = {
+    "csv": write_csv,
+    "json": write_json,
+}
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(
+        prog="ntcpycon-analytics",
+        description="Summarize every game in a tree of .bframes archives",
+    )
+    parser.add_argument("directory")
+    parser.add_argument("--format", choices=sorted(FORMATS), default="csv")
+    parser.add_argument("--output", help="write here instead of stdout")
+    parser.add_argument(
+        "--jobs", type=int, default=None, help="worker processes, default all cpus"
+    )
+    parser.add_argument(
+        "--cache",
+        default=None,
+        help=f"cache file, default <directory>/{CACHE_FILENAME}",
+    )
+    parser.add_argument("--no-cache", action="store_true")
+    args = parser.parse_args(argv)
+
+    if not os.path.isdir(args.directory):
+        sys.exit(f"{args.directory} is not a directory")
+    cache_file = None
+    if not args.no_cache:
+        cache_file = args.cache or os.path.join(args.directory, CACHE_FILENAME)
+
+    games = analyze_tree(args.directory, args.jobs, cache_file)
+    if args.output:
+        with open(args.output, "w", newline="") as file:
+            FORMATS[args.format](games, file)
+    else:
+        FORMATS[args.format](games, sys.stdout)
+    return 0
+
+
+def start_analytics():
+    logging.basicConfig(level=logging.INFO, format="{levelname}: {message}", style="{")
+    sys.exit(main())
+
+
+if __name__ == "__main__":
+    start_analytics()
@@ -0,0 +1,573 @@
+"""
+Micro benchmarks for the per-frame hot paths.
+
+    python -m ntcpycon.benchmark overlay
+    python -m ntcpycon.benchmark bulk
+    python -m ntcpycon.benchmark window --latency-ms 2 --drop-rate 0.01
+    python -m ntcpycon.benchmark relay --subscribers 500
+    python -m ntcpycon.benchmark archive --minutes 30
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import gzip
+import os
+import random
+import sys
+import tempfile
+import time
+
+from websockets.client import connect
+
+import ntcpycon.binaryframe
+import ntcpycon.bulk
+import ntcpycon.delta_archive
+import ntcpycon.edlink
+import ntcpycon.edsim
+import ntcpycon.file_handler
+import ntcpycon.gymmem
+import ntcpycon.harness
+import ntcpycon.relay
+
+BinaryFrame3 = ntcpycon.binaryframe.BinaryFrame3
+GymMemory = ntcpycon.gymmem.GymMemory
+ORIENTATION_TABLE = ntcpycon.gymmem.ORIENTATION_TABLE
+PIECE_ORIENTATION_TO_TILE_ID = ntcpycon.gymmem.PIECE_ORIENTATION_TO_TILE_ID
+BLANK_TILE = ntcpycon.gymmem.BLANK_TILE
+SPAWN_ORIENTATIONS = ntcpycon.gymmem.SPAWN_ORIENTATIONS
+ROTATIONS = ntcpycon.gymmem.ROTATIONS
+NTSC_FRAME_RATE = ntcpycon.gymmem.NTSC_FRAME_RATE
+EDLink = ntcpycon.edlink.EDLink
+SimulatedEverdrive = ntcpycon.edsim.SimulatedEverdrive
+SimulatedGame = ntcpycon.edsim.SimulatedGame
+ED2NTCFrame = ntcpycon.edlink.ED2NTCFrame
+FrameClock = ntcpycon.gymmem.FrameClock
+IDLE_MAX = ntcpycon.edlink.IDLE_MAX
+frame_key = ntcpycon.binaryframe.frame_key
+iter_frames = ntcpycon.file_handler.iter_frames
+WRITE_WAIT_LOOPS = ntcpycon.file_handler.WRITE_WAIT_LOOPS
+DeltaArchive = ntcpycon.delta_archive.DeltaArchive
+DeltaArchiveWriter = ntcpycon.delta_archive.DeltaArchiveWriter
+SpectatorRelay = ntcpycon.relay.SpectatorRelay
+free_port = ntcpycon.harness.free_port
+percentile = ntcpycon.harness.percentile
+
+
+def timed(func, *args) -> float:
+    start = time.perf_counter()
+    func(*args)
+    return time.perf_counter() - start
+
+
+def piece_sequence(pieces: int, seed: int = 0) -> list[tuple[int, int, int]]:
+    """
+    (orientation, x, y) for every frame of a run of pieces falling from the
+    spawn point, shifting and rotating on the way down like a player would.
+    """
+    rng = random.Random(seed)
+    frames = []
+    for _ in range(pieces):
+        spawn = rng.choice(SPAWN_ORIENTATIONS)
+        rotations = ROTATIONS[spawn]
+        rotation = rotations.index(spawn)
+        x = 5
+        target_x = rng.randint(1, 8)
+        landing = rng.randint(10, 19)
+        for y in range(0, landing):
+            # level 18ish gravity: 3 frames per row
+            for _ in range(3):
+                if x != target_x and rng.random() < 0.3:
+                    x += 1 if target_x > x else -1
+                if rng.random() < 0.05:
+                    rotation = (rotation + 1) % len(rotations)
+                frames.append((rotations[rotation], x, y))
+    return frames
+
+
+def legacy_overlay_piece(gym: GymMemory):
+    if gym.current_piece > 0x12:
+        return
+    for x_offset, y_offset in ORIENTATION_TABLE[gym.current_piece]:
+        index = (gym.tetrimino_y + y_offset) * 10 + gym.tetrimino_x + x_offset
+        if index >= 0 and index < 200:
+            gym._playfield[index] = PIECE_ORIENTATION_TO_TILE_ID[gym.current_piece]
+
+
+def legacy_overlay_lineclear_compact(gym: GymMemory):
+    ranges_by_row_y = {
+        0: (range(4, 5), range(5, 6)),
+        1: (range(3, 5), range(5, 7)),
+        2: (range(2, 5), range(5, 8)),
+        3: (range(1, 5), range(5, 9)),
+        4: (range(0, 5), range(5, 10)),
+    }
+    if gym.playstate != 4:
+        return
+    if gym.row_y > 4:
+        return
+    for row in gym.completed_rows:
+        if not row:
+            continue
+        offset = row * 10
+        for blank_range in ranges_by_row_y[gym.row_y]:
+            for blank in blank_range:
+                gym._playfield_buffer[offset + blank] = BLANK_TILE
+
+
+def bench_overlay(args) -> dict:
+    frames = piece_sequence(args.pieces, args.seed)
+    rng = random.Random(args.seed)
+    clears = []
+    for _ in range(max(1, len(frames) // 40)):
+        rows = sorted(rng.sample(range(10, 20), rng.randint(1, 4)))
+        rows += [0] * (4 - len(rows))
+        clears.extend((rows, row_y) for row_y in range(5))
+
+    def overlay(gym: GymMemory, method):
+        for piece, x, y in frames:
+            gym.current_piece = piece
+            gym.tetrimino_x = x
+            gym.tetrimino_y = y
+            method(gym)
+
+    def lineclear(gym: GymMemory, method):
+        gym.playstate = 4
+        for rows, row_y in clears:
+            (
+                gym.completed_row0,
+                gym.completed_row1,
+                gym.completed_row2,
+                gym.completed_row3,
+            ) = rows
+            gym.row_y = row_y
+            method(gym)
+
+    cases = {
+        "overlay_piece": (overlay, GymMemory.overlay_piece, legacy_overlay_piece),
+        "overlay_lineclear_compact": (
+            lineclear,
+            GymMemory.overlay_lineclear_compact,
+            legacy_overlay_lineclear_compact,
+        ),
+    }
+    results = {}
+    for name, (driver, current, legacy) in cases.items():
+        gym_current, gym_legacy = GymMemory(), GymMemory()
+        driver(gym_current, current)
+        driver(gym_legacy, legacy)
+        if (gym_current._playfield, gym_current._playfield_buffer) != (
+            gym_legacy._playfield,
+            gym_legacy._playfield_buffer,
+        ):
+            raise AssertionError(f"{name} differs from the legacy implementation")
+
+        calls = len(frames) if driver is overlay else len(clears)
+        current_time = min(
+            timed(driver, GymMemory(), current) for _ in range(args.repeat)
+        )
+        legacy_time = min(
+            timed(driver, GymMemory(), legacy) for _ in range(args.repeat)
+        )
+        results[name] = {
+            "calls": calls,
+            "current_ns": current_time / calls * 1e9,
+            "legacy_ns": legacy_time / calls * 1e9,
+        }
+    for name, result in results.items():
+        print(
+            f"{name:<28} {result['calls']:>8} calls  "
+            f"{result['current_ns']:8.0f} ns/call  "
+            f"(legacy {result['legacy_ns']:.0f} ns/call, "
+            f"{result['legacy_ns'] / result['current_ns']:.1f}x)",
+        )
+    return results
+
+
+def random_payloads(count: int, seed: int = 0) -> list[bytes]:
+    rng = random.Random(seed)
+    payloads = []
+    for _ in range(count):
+        frame = BinaryFrame3()
+        frame.game_id = rng.getrandbits(16)
+        frame.elapsed = rng.getrandbits(28)
+        frame.lines = rng.getrandbits(12)
+        frame.level = rng.getrandbits(8)
+        frame.score = rng.getrandbits(24)
+        frame.t, frame.j, frame.z, frame.o, frame.s, frame.l, frame.i = (
+            rng.getrandbits(10) for _ in range(7)
+        )
+        frame.playfield = rng.randbytes(50)
+        payloads.append(frame.payload)
+    return payloads
+
+
+def bench_bulk(args) -> dict:
+    bulk = ntcpycon.bulk
+    payloads = random_payloads(args.frames, args.seed)
+    data = b"".join(payloads)
+    frames = bulk.from_bytes(data)
+
+    decoded = bulk.decode(frames)
+    for index in range(0, len(payloads), max(1, len(payloads) // 1000)):
+        expected = BinaryFrame3.from_payload(payloads[index])
+        for name, _ in bulk.FIELDS:
+            if decoded[name][index] != getattr(expected, name):
+                raise AssertionError(f"bulk {name} differs at frame {index}")
+
+    def per_frame():
+        for payload in payloads:
+            BinaryFrame3.from_payload(payload)
+
+    cases = {
+        "from_payload": per_frame,
+        "decode": lambda: bulk.decode(frames),
+        "decode_no_playfield": lambda: bulk.decode(frames, playfield=False),
+        "column_score": lambda: bulk.column(frames, "score"),
+    }
+    results = {}
+    for name, func in cases.items():
+        best = min(timed(func) for _ in range(args.repeat))
+        results[name] = {"frames": len(payloads), "frames_per_s": len(payloads) / best}
+        print(f"{name:<28} {len(payloads) / best / 1e6:8.2f} M frames/s")
+    return results
+
+
+class LatencyProbe(EDLink):
+    """
+    Records how long after the simulated game drew each frame it was
+    decoded, and which frames of a game in progress were missed
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.latencies: list[float] = []
+        self.frames = 0
+        self.play_frames = 0
+        self.play_missed = 0
+
+    def check_frame(
+        self, frame: bytes, frame_options=ntcpycon.edlink.CompactOptions
+    ) -> bool:
+        last = self._last_frame_counter
+        if not super().check_frame(frame, frame_options):
+            return False
+        self.frames += 1
+        counter = int.from_bytes(frame[frame_options.FC_LOC], "little")
+        # game_start of a compact frame; menus are left out
+        if not frame[6]:
+            return True
+        if last:
+            self.play_missed += (counter - last - 1) & 0xFFFF
+        self.play_frames += 1
+        drawn = (
+            self.everdrive.start
+            + (counter - self.everdrive.frame_offset) / NTSC_FRAME_RATE
+        )
+        self.latencies.append(time.monotonic() - drawn)
+        return True
+
+
+# frames per second adaptive polling may fall behind fixed polling in play
+PLAY_FPS_TOLERANCE = 0.3
+
+
+async def run_link(args, window: int | None, adaptive_polling: bool = False) -> dict:
+    device = SimulatedEverdrive(
+        latency=args.latency_ms / 1000, drop_rate=args.drop_rate, seed=args.seed
+    )
+    link = LatencyProbe(
+        [], device=device, window=window, adaptive_polling=adaptive_polling
+    )
+    task = asyncio.create_task(link.receive())
+    await asyncio.sleep(args.duration)
+    task.cancel()
+    try:
+        await task
+    except asyncio.CancelledError:
+        pass
+    latencies = sorted(link.latencies)
+    frames = link.frames
+    return {
+        "fps": frames / args.duration,
+        # share of the frames drawn during a game that were decoded
+        "play_fps": NTSC_FRAME_RATE
+        * link.play_frames
+        / max(1, link.play_frames + link.play_missed),
+        "usb_ops_per_frame": (device.requests + device.writes) / max(1, frames),
+        "p50_ms": latencies[len(latencies) // 2] * 1000 if latencies else 0.0,
+        "p99_ms": latencies[int(len(latencies) * 0.99)] * 1000 if latencies else 0.0,
+        "lost": link.counters["lost_frames"],
+        "retransmits": link.counters["retransmit_requests"],
+    }
+
+
+def bench_window(args) -> dict:
+    results = {}
+    # the windowed link always polls at a fixed rate, so request/response is
+    # compared on the same scheduler; adaptive polling is shown for reference
+    for name, window, adaptive_polling in (
+        ("request_response", None, False),
+        ("request_adaptive", None, True),
+        (f"window_{args.window}", args.window, False),
+    ):
+        result = asyncio.run(run_link(args, window, adaptive_polling))
+        results[name] = result
+        print(
+            f"{name:<20} {result['fps']:6.1f} fps  "
+            f"in play {result['play_fps']:6.2f} fps  "
+            f"{result['usb_ops_per_frame']:5.2f} USB ops/frame  "
+            f"p50 {result['p50_ms']:5.1f}ms  p99 {result['p99_ms']:5.1f}ms  "
+            f"lost {result['lost']}  retransmits {result['retransmits']}"
+        )
+    # backing off is only for menus; in a game adaptive polling must not miss
+    # frames the fixed scheduler gets.  Only on a clean link: a simulated
+    # drop loses the frame whenever it hits the first request for it, which
+    # most adaptive requests are
+    fixed = results["request_response"]["play_fps"]
+    adaptive = results["request_adaptive"]["play_fps"]
+    if not args.drop_rate and adaptive < fixed - PLAY_FPS_TOLERANCE:
+        raise AssertionError(
+            f"adaptive polling dropped to {adaptive:.2f} fps in play, "
+            f"fixed polling got {fixed:.2f}"
+        )
+    return results
+
+
+class TimedRelay(SpectatorRelay):
+    """
+    Records what each publish costs and when each frame went out
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.publish_times: list[float] = []
+        self.published: dict[int, float] = {}
+
+    def publish(self, message: bytes, now: float | None = None):
+        start = time.perf_counter()
+        super().publish(message, now)
+        end = time.perf_counter()
+        self.publish_times.append(end - start)
+        self.published[BinaryFrame3.from_payload(message).score] = start
+
+
+async def relay_viewer(port: int, fps: float | None, arrivals: list, ready):
+    uri = f"ws://127.0.0.1:{port}/" + (f"?fps={fps}" if fps else "")
+    async with connect(uri, compression=None) as websocket:
+        ready()
+        async for message in websocket:
+            arrivals.append((time.perf_counter(), message))
+
+
+async def run_relay(args) -> dict:
+    port = free_port()
+    relay = TimedRelay(port)
+    sender = asyncio.create_task(relay.send())
+    await asyncio.sleep(0.1)
+
+    connected = asyncio.Event()
+    count = 0
+
+    def ready():
+        nonlocal count
+        count += 1
+        if count == args.subscribers:
+            connected.set()
+
+    # every third viewer is a low priority 30 fps one
+    arrivals: list[list] = [[] for _ in range(args.subscribers)]
+    rates = [30.0 if index % 3 == 2 else None for index in range(args.subscribers)]
+    viewers = []
+    for index in range(args.subscribers):
+        viewers.append(
+            asyncio.create_task(
+                relay_viewer(port, rates[index], arrivals[index], ready)
+            )
+        )
+        if index % 50 == 49:
+            await asyncio.sleep(0.05)
+    await asyncio.wait_for(connected.wait(), 30)
+
+    frames = int(args.duration * NTSC_FRAME_RATE)
+    start = time.perf_counter()
+    for sequence in range(frames):
+        frame = BinaryFrame3()
+        frame.score = sequence
+        frame.elapsed = sequence
+        await relay.queue.put(frame.payload)
+        delay = start + (sequence + 1) / NTSC_FRAME_RATE - time.perf_counter()
+        await asyncio.sleep(max(0.0, delay))
+    # the viewers share this process, enough of them slow the source down
+    elapsed = time.perf_counter() - start
+    await asyncio.sleep(0.5)
+    await relay.queue.put(None)
+    await sender
+    for viewer in viewers:
+        viewer.cancel()
+    await asyncio.gather(*viewers, return_exceptions=True)
+
+    latencies = []
+    received = {None: [], 30.0: []}
+    for rate, viewer_arrivals in zip(rates, arrivals):
+        received[rate].append(len(viewer_arrivals))
+        for arrived, payload in viewer_arrivals[1:]:
+            score = BinaryFrame3.from_payload(payload).score
+            if (published := relay.published.get(score)) is not None:
+                latencies.append(arrived - published)
+    publish_times = relay.publish_times
+    return {
+        "subscribers": args.subscribers,
+        "frames": frames,
+        "fps_source": frames / elapsed,
+        "deliveries_per_s": relay.deliveries / elapsed,
+        "fps_full": sum(received[None]) / max(1, len(received[None])) / elapsed,
+        "fps_low": sum(received[30.0]) / max(1, len(received[30.0])) / elapsed,
+        "publish_p50_us": percentile(publish_times, 50) * 1e6,
+        "publish_p99_us": percentile(publish_times, 99) * 1e6,
+        "latency_p50_ms": percentile(latencies, 50) * 1000,
+        "latency_p99_ms": percentile(latencies, 99) * 1000,
+        "evicted": relay.evicted,
+    }
+
+
+def bench_relay(args) -> dict:
+    result = asyncio.run(run_relay(args))
+    print(
+        f"{result['subscribers']} viewers  source {result['fps_source']:5.1f} fps  "
+        f"{result['deliveries_per_s']:8.0f} deliveries/s  "
+        f"full {result['fps_full']:5.1f} fps  low {result['fps_low']:5.1f} fps"
+    )
+    print(
+        f"publish p50 {result['publish_p50_us']:7.1f}us  "
+        f"p99 {result['publish_p99_us']:7.1f}us per frame  "
+        f"({result['publish_p50_us'] / result['subscribers']:.2f}us per viewer)"
+    )
+    print(
+        f"delivery p50 {result['latency_p50_ms']:5.2f}ms  "
+        f"p99 {result['latency_p99_ms']:5.2f}ms  evicted {result['evicted']}"
+    )
+    return result
+
+
+def recorded_payloads(minutes: float, seed: int = 0) -> list[bytes]:
+    """
+    The frames a sender would record from a simulated game: repeats are
+    dropped except for a keepalive every IDLE_MAX
+    """
+    game = SimulatedGame(random.Random(seed))
+    gym = GymMemory(_clock=FrameClock())
+    keepalive = round(IDLE_MAX * NTSC_FRAME_RATE)
+    payloads = []
+    last_key = None
+    since = 0
+    for _ in range(round(minutes * 60 * NTSC_FRAME_RATE)):
+        game.step()
+        gym.update_from_edlink(ED2NTCFrame(game.full_frame()))
+        payload = BinaryFrame3.from_gym_memory(gym).payload
+        key = frame_key(payload)
+        since += 1
+        if key == last_key and since < keepalive:
+            continue
+        last_key = key
+        since = 0
+        payloads.append(payload)
+    return payloads
+
+
+def bench_archive(args) -> dict:
+    payloads = recorded_payloads(args.minutes, args.seed)
+    raw = b"".join(payloads)
+    results = {"frames": len(payloads), "raw_bytes": len(raw)}
+    with tempfile.TemporaryDirectory() as directory:
+        gzip_name = os.path.join(directory, "archive.bframes")
+        delta_name = os.path.join(directory, "archive.dframes")
+        # a gzip member per WRITE_WAIT_LOOPS frames, as FileWriter writes them
+        with open(gzip_name, "wb") as file:
+            for start in range(0, len(payloads), WRITE_WAIT_LOOPS):
+                file.write(
+                    gzip.compress(b"".join(payloads[start : start + WRITE_WAIT_LOOPS]))
+                )
+        writer = DeltaArchiveWriter(delta_name)
+        encode = timed(lambda: [writer.write(payload) for payload in payloads])
+        writer.close()
+
+        with DeltaArchive(delta_name) as archive:
+            if list(archive) != payloads:
+                raise AssertionError("delta archive doesn't round trip")
+            results["gzip_bytes"] = os.path.getsize(gzip_name)
+            results["gzip_level9_bytes"] = len(gzip.compress(raw, 9))
+            results["delta_bytes"] = os.path.getsize(delta_name)
+            results["encode_frames_per_s"] = len(payloads) / encode
+
+            def read_gzip():
+                for _ in iter_frames(gzip_name, workers=1):
+                    pass
+
+            def read_delta():
+                with DeltaArchive(delta_name) as archive:
+                    for _ in archive:
+                        pass
+
+            rng = random.Random(args.seed)
+            seeks = [rng.randrange(len(payloads)) for _ in range(1000)]
+
+            def seek_delta():
+                for index in seeks:
+                    archive._cached = None
+                    archive[index]
+
+            for name, func in (
+                ("gzip", read_gzip),
+                ("delta", read_delta),
+                ("seek", seek_delta),
+            ):
+                best = min(timed(func) for _ in range(args.repeat))
+                count = len(seeks) if name == "seek" else len(payloads)
+                results[f"{name}_frames_per_s"] = count / best
+    print(
+        f"{len(payloads)} frames ({args.minutes:g} minutes)  raw {len(raw)} B  "
+        f"gzip {results['gzip_bytes']} B  "
+        f"(one member {results['gzip_level9_bytes']} B)  "
+        f"delta {results['delta_bytes']} B  "
+        f"({results['gzip_bytes'] / results['delta_bytes']:.1f}x smaller, "
+        f"{results['gzip_level9_bytes'] / results['delta_bytes']:.1f}x)"
+    )
+    print(
+        f"read gzip {results['gzip_frames_per_s'] / 1e3:8.0f} k frames/s  "
+        f"delta {results['delta_frames_per_s'] / 1e3:8.0f} k frames/s  "
+        f"encode {results['encode_frames_per_s'] / 1e3:6.0f} k frames/s  "
+        f"random seek {1e6 / results['seek_frames_per_s']:6.0f}us"
+    )
+    return results
+
+
+BENCHMARKS = {
+    "overlay": bench_overlay,
+    "bulk": bench_bulk,
+    "window": bench_window,
+    "relay": bench_relay,
+    "archive": bench_archive,
+}
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m ntcpycon.benchmark")
+    parser.add_argument("name", choices=sorted(BENCHMARKS))
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--pieces", type=int, default=2000)
+    parser.add_argument("--frames", type=int, default=200000)
+    parser.add_argument("--duration", type=float, default=5.0)
+    parser.add_argument("--latency-ms", type=float, default=2.0)
+    parser.add_argument("--drop-rate", type=float, default=0.0)
+    parser.add_argument("--window", type=int, default=8)
+    parser.add_argument("--subscribers", type=int, default=300)
+    parser.add_argument("--minutes", type=float, default=10.0)
+    args = parser.parse_args(argv)
+    BENCHMARKS[args.name](args)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
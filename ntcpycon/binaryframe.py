@@ -34,61 +34,33 @@ class BinaryFrame3:
         self.cur_piece = 2**3 - 1
         self.cur_piece_das = 2**5 - 1
 
+    def __repr__(self):
+        fields = ", ".join(f"{name}={value!r}" for name, value in vars(self).items())
+        return f"{type(self).__name__}({fields})"
+
     @classmethod
     def from_gym_memory(cls, gym: GymMemory) -> BinaryFrame3:
         result = cls()
         result.t = gym.stats_t
-        logger.debug(f"{result.t=}")
-
         result.j = gym.stats_j
-        logger.debug(f"{result.j=}")
-
         result.z = gym.stats_z
-        logger.debug(f"{result.z=}")
-
         result.o = gym.stats_o
-        logger.debug(f"{result.o=}")
-
         result.s = gym.stats_s
-        logger.debug(f"{result.s=}")
-
         result.l = gym.stats_l
-        logger.debug(f"{result.l=}")
-
         result.i = gym.stats_i
-        logger.debug(f"{result.i=}")
-
         result.elapsed = gym.elapsed
-        logger.debug(f"{result.elapsed=}")
-
         result.game_id = gym.game_id
-        logger.debug(f"{result.game_id=}")
-
         result.level = gym.level
-        logger.debug(f"{result.level=}")
-
         result.lines = gym.lines
-        logger.debug(f"{result.lines=}")
-
         result.score = gym.score
-        logger.debug(f"{result.score=}")
-
         result.preview = gym.next_piece_id
-        logger.debug(f"{result.preview=}")
-
         result.playfield = gym.compressed
-        logger.debug(f"{result.playfield=}")
-
         # das trainer stats
         result.instant_das = gym.autorepeat_x
-        logger.debug(f"{result.instant_das=}")
-
         result.cur_piece = gym.current_piece_id
-        logger.debug(f"{result.cur_piece=}")
-
         result.cur_piece_das = gym.spawn_autorepeat_x
-        logger.debug(f"{result.cur_piece_das=}")
-
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("%r", result)
         return result
 
     @classmethod
@@ -96,47 +68,49 @@ class BinaryFrame3:
         result = cls()
         stats = ocr_payload.stats
         result.t = stats["T"]
-        logger.debug(f"{result.t=}")
-
         result.j = stats["J"]
-        logger.debug(f"{result.j=}")
-
         result.z = stats["Z"]
-        logger.debug(f"{result.z=}")
-
         result.o = stats["O"]
-        logger.debug(f"{result.o=}")
-
         result.s = stats["S"]
-        logger.debug(f"{result.s=}")
-
         result.l = stats["L"]
-        logger.debug(f"{result.l=}")
-
         result.i = stats["I"]
-        logger.debug(f"{result.i=}")
-
         result.elapsed = ocr_payload.time
-        logger.debug(f"{result.elapsed=}")
-
         result.game_id = ocr_payload.gameid
-        logger.debug(f"{result.game_id=}")
-
         result.level = ocr_payload.level
-        logger.debug(f"{result.level=}")
-
         result.lines = ocr_payload.lines
-        logger.debug(f"{result.lines=}")
-
         result.score = ocr_payload.score
-        logger.debug(f"{result.score=}")
-
         result.preview = ocr_payload.preview
-        logger.debug(f"{result.preview=}")
-
         result.playfield = ocr_payload.field_bytes
-        logger.debug(f"{result.playfield=}")
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("%r", result)
+        return result
 
+    @classmethod
+    def from_payload(cls, payload: bytes) -> BinaryFrame3:
+        """
+        Inverse of payload
+        """
+        if len(payload) != 73 or payload[0] >> 5 != cls.VERSION:
+            raise ValueError(f"Not a version {cls.VERSION} frame: {payload[:1].hex()}")
+        result = cls()
+        result.game_id = (payload[1] << 8) | payload[2]
+        result.elapsed = int.from_bytes(payload[3:7], "big") >> 4
+        result.lines = ((payload[6] & 0x0F) << 8) | payload[7]
+        result.level = payload[8]
+        result.score = int.from_bytes(payload[9:12], "big")
+        result.instant_das = payload[12] >> 3
+        result.preview = payload[12] & 0b111
+        result.cur_piece_das = payload[13] >> 3
+        result.cur_piece = payload[13] & 0b111
+        stats = int.from_bytes(payload[14:23], "big") >> 2
+        result.i = stats & 0x3FF
+        result.l = (stats >> 10) & 0x3FF
+        result.s = (stats >> 20) & 0x3FF
+        result.o = (stats >> 30) & 0x3FF
+        result.z = (stats >> 40) & 0x3FF
+        result.j = (stats >> 50) & 0x3FF
+        result.t = (stats >> 60) & 0x3FF
+        result.playfield = payload[23:]
         return result
 
     @property
@@ -177,7 +151,6 @@ class BinaryFrame3:
     @property
     def payload(self):
         _payload = bytearray(73)
-        logger.debug(len(_payload))
         _payload[0] = ((self.VERSION & 0b111) << 5) | ((self.GAME_TYPE & 0b11) << 3)
 
         _payload[1] = (self.game_id & 0xFF00) >> 8
@@ -204,3 +177,12 @@ class BinaryFrame3:
         _payload[14:23] = self.stats
         _payload[23:] = self.playfield
         return bytes(_payload)
+
+
+def frame_key(payload: bytes) -> bytes:
+    """
+    The frame without its 28 bit ctime (the nibbles after the version byte
+    and game id).  Two frames with the same key only differ in when they
+    were taken, e.g. the keepalives receivers send while nothing changes.
+    """
+    return payload[:3] + bytes([payload[6] & 0x0F]) + payload[7:]
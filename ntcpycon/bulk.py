@@ -0,0 +1,218 @@
+"""
+Vectorized decoding of version 3 frame archives with numpy.
+
+    frames = load_raw("example.bframes")   # (n, 73) uint8
+    decoded = decode(frames)               # structured array, one row per frame
+    scores = column(frames, "score")       # just the score series
+
+numpy is optional: pip install ntcpycon[bulk]
+"""
+from __future__ import annotations
+
+import gzip
+import logging
+import sys
+
+import ntcpycon.binaryframe
+import ntcpycon.file_handler
+
+try:
+    import numpy as np
+except ImportError:  # only needed for bulk decoding
+    np = None
+
+BinaryFrame3 = ntcpycon.binaryframe.BinaryFrame3
+FRAME_SIZE_BY_VERSION = ntcpycon.file_handler.FRAME_SIZE_BY_VERSION
+
+logger = logging.getLogger(__name__)
+logger.addHandler(logging.NullHandler())
+
+FRAME_SIZE = FRAME_SIZE_BY_VERSION[BinaryFrame3.VERSION]
+
+PLAYFIELD_OFFSET = 23
+PLAYFIELD_CELLS = 200
+
+_TILES = None
+
+FIELDS = (
+    ("game_id", "u2"),
+    ("elapsed", "u4"),
+    ("lines", "u2"),
+    ("level", "u1"),
+    ("score", "u4"),
+    ("instant_das", "u1"),
+    ("preview", "u1"),
+    ("cur_piece_das", "u1"),
+    ("cur_piece", "u1"),
+    ("t", "u2"),
+    ("j", "u2"),
+    ("z", "u2"),
+    ("o", "u2"),
+    ("s", "u2"),
+    ("l", "u2"),
+    ("i", "u2"),
+)
+
+
+def require_numpy():
+    if np is None:
+        sys.exit("numpy is required for bulk decoding.  pip install ntcpycon[bulk]")
+
+
+def frame_dtype(playfield: bool = True):
+    require_numpy()
+    fields = list(FIELDS)
+    if playfield:
+        fields.append(("playfield", "u1", (PLAYFIELD_CELLS,)))
+    return np.dtype(fields)
+
+
+def from_bytes(data: bytes):
+    """
+    (n, 73) uint8 view of the version 3 frames in an uncompressed stream.
+    Frames of other versions are skipped
+    """
+    require_numpy()
+    buffer = np.frombuffer(data, dtype=np.uint8)
+    if len(buffer) % FRAME_SIZE == 0:
+        frames = buffer.reshape(-1, FRAME_SIZE)
+        if np.all(frames[:, 0] >> 5 == BinaryFrame3.VERSION):
+            return frames
+
+    # mixed versions: find the v3 frame offsets the slow way
+    offsets = []
+    offset = 0
+    while offset < len(data):
+        version = data[offset] >> 5
+        if version not in FRAME_SIZE_BY_VERSION:
+            raise ValueError(f"Invalid version {version} at offset {offset}")
+        length = FRAME_SIZE_BY_VERSION[version]
+        if offset + length > len(data):
+            logger.warning(f"Ignoring truncated frame at offset {offset}")
+            break
+        if version == BinaryFrame3.VERSION:
+            offsets.append(offset)
+        offset += length
+    logger.info(
+        f"Skipped {(len(data) - len(offsets) * FRAME_SIZE)} bytes of other versions"
+    )
+    index = np.asarray(offsets, dtype=np.intp)[:, None] + np.arange(FRAME_SIZE)
+    return buffer[index]
+
+
+def load_raw(filename: str):
+    """
+    Every version 3 frame in a FileWriter archive as an (n, 73) uint8 array
+    """
+    with open(filename, "rb") as file:
+        return from_bytes(gzip.decompress(file.read()))
+
+
+def _u(frames, index: int, dtype: str):
+    return frames[:, index].astype(dtype)
+
+
+def _game_id(frames):
+    return _u(frames, 1, "u2") << 8 | frames[:, 2]
+
+
+def _elapsed(frames):
+    return (
+        _u(frames, 3, "u4") << 20
+        | _u(frames, 4, "u4") << 12
+        | _u(frames, 5, "u4") << 4
+        | frames[:, 6] >> 4
+    )
+
+
+def _lines(frames):
+    return (_u(frames, 6, "u2") & 0x0F) << 8 | frames[:, 7]
+
+
+def _level(frames):
+    return frames[:, 8].copy()
+
+
+def _score(frames):
+    return _u(frames, 9, "u4") << 16 | _u(frames, 10, "u4") << 8 | frames[:, 11]
+
+
+def _instant_das(frames):
+    return frames[:, 12] >> 3
+
+
+def _preview(frames):
+    return frames[:, 12] & 0b111
+
+
+def _cur_piece_das(frames):
+    return frames[:, 13] >> 3
+
+
+def _cur_piece(frames):
+    return frames[:, 13] & 0b111
+
+
+def _stat(index: int, shift: int):
+    """
+    10 bit piece stat that starts `shift` bits into byte `index`
+    """
+
+    def extract(frames):
+        pair = _u(frames, index, "u2") << 8 | frames[:, index + 1]
+        return (pair >> (6 - shift)) & 0x3FF
+
+    return extract
+
+
+def _playfield(frames):
+    global _TILES
+    if _TILES is None:
+        # the 4 two bit tiles packed into every possible byte
+        shifts = np.array([6, 4, 2, 0], dtype=np.uint8)
+        _TILES = (np.arange(256, dtype=np.uint8)[:, None] >> shifts) & 0b11
+    packed = frames[:, PLAYFIELD_OFFSET : PLAYFIELD_OFFSET + 50]
+    return np.take(_TILES, packed, axis=0).reshape(len(frames), PLAYFIELD_CELLS)
+
+
+COLUMNS = {
+    "game_id": _game_id,
+    "elapsed": _elapsed,
+    "lines": _lines,
+    "level": _level,
+    "score": _score,
+    "instant_das": _instant_das,
+    "preview": _preview,
+    "cur_piece_das": _cur_piece_das,
+    "cur_piece": _cur_piece,
+    # stats are 7 x 10 bits packed from byte 14
+    "t": _stat(14, 0),
+    "j": _stat(15, 2),
+    "z": _stat(16, 4),
+    "o": _stat(17, 6),
+    "s": _stat(19, 0),
+    "l": _stat(20, 2),
+    "i": _stat(21, 4),
+    "playfield": _playfield,
+}
+
+
+def column(frames, name: str):
+    """
+    One decoded field for every frame, without decoding anything else
+    """
+    require_numpy()
+    if name not in COLUMNS:
+        raise ValueError(f"column must be one of: {', '.join(COLUMNS)}")
+    return COLUMNS[name](frames)
+
+
+def decode(frames, playfield: bool = True):
+    """
+    Structured array with one row per frame and a column per BinaryFrame3
+    field.  The playfield is unpacked to 200 tile values per frame
+    """
+    result = np.empty(len(frames), dtype=frame_dtype(playfield))
+    for name in result.dtype.names:
+        result[name] = COLUMNS[name](frames)
+    return result
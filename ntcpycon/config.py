@@ -4,60 +4,257 @@ import sys
 import yaml
 
 import ntcpycon.abstract
+import ntcpycon.control
+import ntcpycon.delta_archive
 import ntcpycon.edlink
+import ntcpycon.edrecord
+import ntcpycon.edsim
 import ntcpycon.file_handler
+import ntcpycon.frame_store
 import ntcpycon.pcap_replay
+import ntcpycon.replay_buffer
 import ntcpycon.nestrisocr
+import ntcpycon.passthrough
+import ntcpycon.profiling
+import ntcpycon.relay
+import ntcpycon.stabilize
+import ntcpycon.trace
 import ntcpycon.ws_sender
 
 
 WSSender = ntcpycon.ws_sender.WSSender
 NESTrisOCRServer = ntcpycon.nestrisocr.NESTrisOCRServer
+OCRRoute = ntcpycon.nestrisocr.OCRRoute
 PCapReplay = ntcpycon.pcap_replay.PCapReplay
+PassthroughReceiver = ntcpycon.passthrough.PassthroughReceiver
 FileWriter = ntcpycon.file_handler.FileWriter
 FileReceiver = ntcpycon.file_handler.FileReceiver
+FrameStoreWriter = ntcpycon.frame_store.FrameStoreWriter
+FrameStoreReceiver = ntcpycon.frame_store.FrameStoreReceiver
+DeltaArchiveWriter = ntcpycon.delta_archive.DeltaArchiveWriter
+DeltaArchiveReceiver = ntcpycon.delta_archive.DeltaArchiveReceiver
 EDLink = ntcpycon.edlink.EDLink
+EDLinkReplay = ntcpycon.edlink.EDLinkReplay
+SimulatedEverdrive = ntcpycon.edsim.SimulatedEverdrive
+ReplayBuffer = ntcpycon.replay_buffer.ReplayBuffer
+SpectatorRelay = ntcpycon.relay.SpectatorRelay
+TRACER = ntcpycon.trace.TRACER
+CONTROL = ntcpycon.control.CONTROL
+PROFILER = ntcpycon.profiling.PROFILER
 
 
-def get_senders(
-    senders_dict: dict,
-):
-    senders = []
-    for websocket in senders_dict.get("websockets", []):
-        uri = websocket.get("uri")
+def sender_specs(senders_dict: dict) -> list[tuple[str, dict]]:
+    """
+    (kind, settings) for each sender in a senders section
+    """
+    specs = []
+    for websocket in senders_dict.get("websockets") or []:
+        specs.append(("websockets", websocket or {}))
+    for kind in (
+        "local_file",
+        "frame_store",
+        "delta_archive",
+        "replay_buffer",
+        "relay",
+    ):
+        if spec := senders_dict.get(kind):
+            specs.append((kind, spec if isinstance(spec, dict) else {}))
+    return specs
+
+
+def get_sender(kind: str, spec: dict):
+    if kind == "websockets":
+        uri = spec.get("uri")
         if not uri:
             sys.exit("uri must be specified for websocket")
-        no_verify = websocket.get("no_verify", False)
-        senders.append(WSSender(uri, no_verify))
+        no_verify = spec.get("no_verify", False)
+        compression = spec.get("compression", "default")
+        if compression not in ntcpycon.ws_sender.COMPRESSION:
+            sys.exit(
+                f"compression must be one of: {', '.join(ntcpycon.ws_sender.COMPRESSION)}"
+            )
+        return WSSender(
+            uri,
+            no_verify,
+            compression=compression,
+            compression_level=spec.get("compression_level", 6),
+            ping_interval=spec.get("ping_interval"),
+            adaptive=spec.get("adaptive", False),
+            rtt_limit=spec.get("rtt_limit_ms", 250) / 1000,
+            buffer_limit=spec.get("buffer_limit", 16384),
+            ready_timeout=spec.get("ready_timeout"),
+        )
 
-    if local_file := senders_dict.get("local_file"):
-        filename = local_file.get("filename")
+    elif kind == "local_file":
+        filename = spec.get("filename")
         if not filename:
             sys.exit("filename must be specified to read local_file")
-        overwrite = local_file.get("overwrite", False)
-        senders.append(FileWriter(filename, overwrite))
+        overwrite = spec.get("overwrite", False)
+        return FileWriter(filename, overwrite)
+
+    elif kind == "frame_store":
+        filename = spec.get("filename")
+        if not filename:
+            sys.exit("filename must be specified to write frame_store")
+        overwrite = spec.get("overwrite", False)
+        return FrameStoreWriter(filename, overwrite)
+
+    elif kind == "delta_archive":
+        filename = spec.get("filename")
+        if not filename:
+            sys.exit("filename must be specified to write delta_archive")
+        return DeltaArchiveWriter(
+            filename,
+            spec.get("overwrite", False),
+            keyframe_interval=spec.get(
+                "keyframe_interval", ntcpycon.delta_archive.KEYFRAME_INTERVAL
+            ),
+            flush_interval=spec.get(
+                "flush_interval", ntcpycon.delta_archive.FLUSH_INTERVAL
+            ),
+        )
+
+    elif kind == "replay_buffer":
+        minutes = spec.get("minutes", 5)
+        if not minutes or minutes <= 0:
+            sys.exit("minutes must be positive for replay_buffer")
+        return ReplayBuffer(
+            minutes,
+            directory=spec.get("directory", "."),
+            prefix=spec.get("prefix", "clip"),
+        )
 
-    if not senders:
+    elif kind == "relay":
+        port = spec.get("port")
+        if not port:
+            sys.exit("port must be specified for relay")
+        return SpectatorRelay(
+            port,
+            host=spec.get("host", "127.0.0.1"),
+            buffer_limit=spec.get("buffer_limit", 65536),
+            max_subscribers=spec.get("max_subscribers", 1000),
+        )
+
+    sys.exit(f"Unknown sender {kind}")
+
+
+def get_senders(
+    senders_dict: dict,
+    required: bool = True,
+):
+    senders = [get_sender(kind, spec) for kind, spec in sender_specs(senders_dict)]
+
+    if not senders and required:
         sys.exit(f"At least one sender must be specified in config file")
 
     return senders
 
 
+def get_ocr_routes(
+    routes_dict: dict,
+) -> tuple[list, list]:
+    """
+    Routes for ocr_server and the senders they feed
+    """
+    routes = []
+    senders = []
+    for name, route in (routes_dict or {}).items():
+        if not isinstance(route, dict) or not route.get("senders"):
+            sys.exit(f"senders must be specified for ocr_server route {name}")
+        route_senders = get_senders(route["senders"])
+        senders.extend(route_senders)
+        routes.append(
+            OCRRoute(
+                str(name),
+                [sender.queue for sender in route_senders],
+                addresses=route.get("addresses"),
+                ports=route.get("ports"),
+            )
+        )
+    return routes, senders
+
+
+def get_stabilize(stabilize_dict: dict | None) -> dict | None:
+    """
+    OCRStabilizer arguments from an ocr_server stabilize section
+    """
+    if not stabilize_dict:
+        return None
+    latency = stabilize_dict.get("latency", ntcpycon.stabilize.DEFAULT_LATENCY)
+    fields = stabilize_dict.get("fields") or {}
+    for name, value in [("latency", latency), *fields.items()]:
+        if not isinstance(value, int) or value < 0:
+            sys.exit(f"stabilize {name} must be a whole number of frames")
+    if set(fields) - set(ntcpycon.stabilize.FIELDS):
+        sys.exit(
+            f"stabilize fields must be some of: {', '.join(ntcpycon.stabilize.FIELDS)}"
+        )
+    method = stabilize_dict.get("method", "majority")
+    if method not in ntcpycon.stabilize.METHODS:
+        sys.exit(
+            f"stabilize method must be one of: {', '.join(ntcpycon.stabilize.METHODS)}"
+        )
+    return {"latency": latency, "method": method, "fields": fields}
+
+
 def get_receiver(
     queues: list,
     receiver: dict,
+    routes: list | None = None,
 ):
     if ocr_server := receiver.get("ocr_server", {}):
         port = ocr_server.get("port")
         if not port:
             sys.exit("port must be specified to start tcp server")
-        return NESTrisOCRServer(queues, port)
+        return NESTrisOCRServer(
+            queues, port, routes, stabilize=get_stabilize(ocr_server.get("stabilize"))
+        )
 
     elif (edlink := receiver.get("edlink", {})) or "edlink" in receiver.keys():
-        launch = False
-        if edlink:
-            launch = edlink.get("launch")
-        return EDLink(queues, launch=launch)
+        edlink = edlink or {}
+        device = None
+        if simulate := edlink.get("simulate"):
+            simulate = simulate if isinstance(simulate, dict) else {}
+            device = SimulatedEverdrive(
+                latency=simulate.get("latency_ms", 0) / 1000,
+                throughput=simulate.get("throughput"),
+                drop_rate=simulate.get("drop_rate", 0.0),
+                short_read_rate=simulate.get("short_read_rate", 0.0),
+                corrupt_rate=simulate.get("corrupt_rate", 0.0),
+                hang_rate=simulate.get("hang_rate", 0.0),
+                hang_time=simulate.get("hang_time", 5.0),
+                seed=simulate.get("seed"),
+            )
+        return EDLink(
+            queues,
+            launch=edlink.get("launch", False),
+            clock=edlink.get("clock", "frame_counter"),
+            pacing=edlink.get("pacing", False),
+            pacing_depth=edlink.get("pacing_depth", 2),
+            adaptive_polling=edlink.get("adaptive_polling", True),
+            record=edlink.get("record"),
+            overwrite=edlink.get("overwrite", False),
+            record_flush_interval=edlink.get(
+                "record_flush_interval", ntcpycon.edrecord.FLUSH_INTERVAL
+            ),
+            device=device,
+            timeout=edlink.get("timeout", 0.5),
+            watchdog=edlink.get("watchdog", 2.0),
+            window=edlink.get("window"),
+            ack_every=edlink.get("ack_every", 4),
+            frame_mode=edlink.get("frame_mode", "compact"),
+        )
+
+    elif edlink_replay := receiver.get("edlink_replay", {}):
+        filename = edlink_replay.get("filename")
+        if not filename:
+            sys.exit("filename must be specified to read edlink_replay")
+        return EDLinkReplay(
+            queues,
+            filename,
+            realtime=edlink_replay.get("realtime", True),
+            clock=edlink_replay.get("clock", "frame_counter"),
+        )
 
     elif local_file := receiver.get("local_file", {}):
         filename = local_file.get("filename")
@@ -65,6 +262,31 @@ def get_receiver(
             sys.exit("filename must be specified to read local_file")
         return FileReceiver(queues, filename)
 
+    elif frame_store := receiver.get("frame_store", {}):
+        filename = frame_store.get("filename")
+        if not filename:
+            sys.exit("filename must be specified to read frame_store")
+        return FrameStoreReceiver(queues, filename, game=frame_store.get("game"))
+
+    elif delta_archive := receiver.get("delta_archive", {}):
+        filename = delta_archive.get("filename")
+        if not filename:
+            sys.exit("filename must be specified to read delta_archive")
+        return DeltaArchiveReceiver(
+            queues, filename, start=delta_archive.get("start", 0)
+        )
+
+    elif passthrough := receiver.get("passthrough", {}):
+        port = passthrough.get("port")
+        if not port:
+            sys.exit("port must be specified for passthrough")
+        return PassthroughReceiver(
+            queues,
+            port,
+            protocol=passthrough.get("protocol", "tcp"),
+            host=passthrough.get("host"),
+        )
+
     elif packet_capture := receiver.get("packet_capture"):
         filename = packet_capture.get("filename")
         dst = packet_capture.get("dst")
@@ -96,30 +318,69 @@ def set_logging(debug: bool):
     logger.addHandler(streamhandler)
 
 
-def get_receiver_and_senders():
+def set_tracing(trace_dict: dict):
+    if not trace_dict:
+        return
+    if not (filename := trace_dict.get("filename")):
+        sys.exit("filename must be specified to trace")
+    sample = trace_dict.get("sample", 1)
+    if not isinstance(sample, int) or sample < 1:
+        sys.exit("trace sample must be a whole number of frames")
+    TRACER.configure(filename, sample)
+
+
+def set_control(control_dict: dict):
+    if not control_dict:
+        return
+    signals = control_dict.get("signals")
+    if signals is not None and not isinstance(signals, dict):
+        sys.exit("control signals must map signal names to commands")
+    CONTROL.configure(
+        port=control_dict.get("port"),
+        host=control_dict.get("host", "127.0.0.1"),
+        signals=signals,
+    )
+
+
+def set_profiling(profile_dict: dict):
+    summary_interval = profile_dict.get("summary_interval")
+    if summary_interval is not None and (
+        not isinstance(summary_interval, (int, float)) or summary_interval <= 0
+    ):
+        sys.exit("profile summary_interval must be a positive number of seconds")
+    PROFILER.configure(
+        directory=profile_dict.get("directory", "profiles"),
+        summary_interval=summary_interval,
+        top=profile_dict.get("top", 5),
+    )
+    PROFILER.install()
+
+
+def get_config_file() -> str:
     usage = f"ntcpycon <config file>"
     if len(sys.argv) < 2:
         sys.exit(usage)
     elif sys.argv[1].startswith("-h") or sys.argv[1].startswith("--h"):
         sys.exit(usage)
+    return sys.argv[1]
 
-    config_file = sys.argv[1]
+
+def load_config(config_file: str) -> dict:
     try:
         with open(config_file) as file:
             config = yaml.safe_load(file)
     except Exception as exc:
         sys.exit(f"Unable to load config: {type(exc).__name__}: {exc!s}")
+    if not isinstance(config, dict):
+        sys.exit(f"Unable to load config: {config_file} is not a mapping")
+    return config
 
-    senders_dict = config.get("senders", {})
-    receiver_dict = config.get("receiver", {})
-    debug_bool = config.get("debug", False)
-
-    set_logging(debug_bool)
-
-    senders = get_senders(senders_dict)
-
-    queues = [sender.queue for sender in senders]
-
-    receiver = get_receiver(queues, receiver_dict)
 
-    return receiver, senders
+def configure(config: dict):
+    """
+    Process wide settings: logging, tracing, control and profiling
+    """
+    set_logging(config.get("debug", False))
+    set_tracing(config.get("trace", {}))
+    set_control(config.get("control", {}))
+    set_profiling(config.get("profile") or {})
@@ -1,26 +1,19 @@
 import asyncio
-import sys
 
-import ntcpycon.abstract
 import ntcpycon.config
+import ntcpycon.reload
 
-Receiver = ntcpycon.abstract.Receiver
-Sender = ntcpycon.abstract.Sender
-
-get_receiver_and_senders = ntcpycon.config.get_receiver_and_senders
-
-
-async def connect(receiver: Receiver, senders: list[Sender]):
-    if not receiver or not senders:
-        sys.exit("Cannot connect without receiver and at least one sender")
-    jobs = [s.send() for s in senders]
-    jobs.append(receiver.receive())
-    await asyncio.gather(*jobs)
+get_config_file = ntcpycon.config.get_config_file
+load_config = ntcpycon.config.load_config
+configure = ntcpycon.config.configure
+Supervisor = ntcpycon.reload.Supervisor
 
 
 def start_connect():
     try:
-        receiver, senders = get_receiver_and_senders()
-        asyncio.run(connect(receiver=receiver, senders=senders))
+        config_file = get_config_file()
+        config = load_config(config_file)
+        configure(config)
+        asyncio.run(Supervisor(config_file, config).run())
     except KeyboardInterrupt:
         print("Exiting")
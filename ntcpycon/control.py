@@ -0,0 +1,136 @@
+"""
+Local control commands.
+
+Components register named commands on CONTROL.  They can be run by
+connecting to the control port and sending one command per line, e.g.
+
+    echo "clip 120" | nc 127.0.0.1 3339
+
+or by sending a signal mapped to a command (SIGUSR1 runs "clip",
+SIGHUP runs "reload" and SIGUSR2 runs "profile" by default).  Each
+command answers with a single line.
+"""
+from __future__ import annotations
+
+import asyncio
+import logging
+import signal
+import typing
+
+logger = logging.getLogger(__name__)
+logger.addHandler(logging.NullHandler())
+
+DEFAULT_HOST = "127.0.0.1"
+
+DEFAULT_SIGNALS = {
+    "SIGUSR1": "clip",
+    "SIGHUP": "reload",
+    "SIGUSR2": "profile",
+}
+
+# longest command line accepted from a client
+LINE_MAX = 1024
+
+Handler = typing.Callable[[list[str]], typing.Awaitable[str]]
+
+
+class Control:
+    def __init__(self):
+        self.commands: dict[str, tuple[Handler, str]] = {}
+        self.host = DEFAULT_HOST
+        self.port: int | None = None
+        self.signals = dict(DEFAULT_SIGNALS)
+        self.register("help", self.help, "list commands")
+
+    def __repr__(self):
+        host = self.host
+        port = self.port
+        commands = list(self.commands)
+        return f"{type(self).__name__}({host=}, {port=}, {commands=})"
+
+    def configure(
+        self,
+        port: int | None = None,
+        host: str = DEFAULT_HOST,
+        signals: dict[str, str] | None = None,
+    ):
+        self.port = port
+        self.host = host
+        if signals is not None:
+            self.signals = dict(signals)
+
+    def register(self, name: str, handler: Handler, help: str = ""):
+        if name in self.commands:
+            logger.warning(f"Replacing control command {name}")
+        self.commands[name] = (handler, help)
+
+    def unregister(self, name: str):
+        self.commands.pop(name, None)
+
+    async def help(self, args: list[str]) -> str:
+        return "; ".join(
+            f"{name}: {help}" if help else name
+            for name, (_, help) in sorted(self.commands.items())
+        )
+
+    async def run(self, line: str) -> str:
+        name, *args = line.split() or [""]
+        if name not in self.commands:
+            return f"error: unknown command {name!r}"
+        handler, _ = self.commands[name]
+        try:
+            return await handler(args)
+        except Exception as exc:
+            logger.error(f"Control command {line!r} failed: {exc!s}")
+            return f"error: {type(exc).__name__}: {exc!s}"
+
+    async def client_handler(
+        self,
+        client_reader: asyncio.StreamReader,
+        client_writer: asyncio.StreamWriter,
+    ):
+        try:
+            while line := await client_reader.readline():
+                command = line[:LINE_MAX].decode(errors="replace").strip()
+                if not command:
+                    continue
+                logger.info(f"Control command: {command}")
+                reply = await self.run(command)
+                client_writer.write(reply.encode() + b"\n")
+                await client_writer.drain()
+        except (ConnectionError, ValueError):
+            # disconnected, or a line longer than LINE_MAX
+            pass
+        finally:
+            client_writer.close()
+
+    def on_signal(self, name: str, command: str):
+        async def run():
+            logger.info(f"{name}: {await self.run(command)}")
+
+        asyncio.ensure_future(run())
+
+    def install_signals(self):
+        loop = asyncio.get_running_loop()
+        for name, command in self.signals.items():
+            if not (signum := getattr(signal, name, None)):
+                logger.warning(f"{name} isn't available on this platform")
+                continue
+            try:
+                loop.add_signal_handler(signum, self.on_signal, name, command)
+            except (NotImplementedError, RuntimeError) as exc:
+                logger.warning(f"Unable to handle {name}: {exc!s}")
+
+    async def serve(self):
+        self.install_signals()
+        if not self.port:
+            return
+        server = await asyncio.start_server(
+            self.client_handler, self.host, self.port, limit=LINE_MAX
+        )
+        logger.info(f"Control server listening on {self.host}:{self.port}")
+        async with server:
+            await server.serve_forever()
+
+
+CONTROL = Control()
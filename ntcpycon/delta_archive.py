@@ -0,0 +1,539 @@
+"""
+Delta encoded frame archive.
+
+Consecutive version 3 frames barely differ, so instead of compressing raw
+records each frame is stored as the bytes that changed since the previous
+one.  <name> (conventionally .dframes) is MAGIC followed by blocks:
+
+4   compressed size (little endian)
+4   frames in the block (little endian)
+    zlib stream of records
+
+Every block starts with a keyframe, so blocks decode on their own.  The
+records are:
+
+KEY     tag, then the 73 byte frame
+DELTA   tag, elapsed change (zigzag varint), 10 byte mask of the bytes that
+        changed (little endian, bit n is byte n), then those bytes xor
+        their previous value
+REPEAT  tag, count (varint), then count elapsed changes (zigzag varints)
+        for frames that only differ from the previous one in elapsed
+
+Elapsed advances on every frame, so it is kept out of the xor and stored
+as a difference.  An idle frame is then an exact repeat.
+
+<name>.blocks indexes the blocks for seeking, one record per block:
+
+8   offset of the block (little endian)
+4   first frame of the block (little endian)
+
+The index is rebuilt from the block headers if it is missing or behind.
+
+DeltaArchiveWriter keeps the block in progress in memory.  It is written
+after keyframe_interval frames, or once its first frame is flush_interval
+seconds old, so a crash loses at most flush_interval seconds of frames.
+
+Convert a FileWriter archive with
+`python -m ntcpycon.delta_archive input.bframes output.dframes`.
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import bisect
+import logging
+import os
+import struct
+import sys
+import time
+import typing
+import zlib
+
+import ntcpycon.abstract
+import ntcpycon.binaryframe
+import ntcpycon.file_handler
+
+Receiver = ntcpycon.abstract.Receiver
+Sender = ntcpycon.abstract.Sender
+BinaryFrame3 = ntcpycon.binaryframe.BinaryFrame3
+iter_frames = ntcpycon.file_handler.iter_frames
+
+logger = logging.getLogger(__name__)
+logger.addHandler(logging.NullHandler())
+
+FRAME_SIZE = ntcpycon.file_handler.FRAME_SIZE_BY_VERSION[BinaryFrame3.VERSION]
+
+MAGIC = b"NTCD\x01"
+
+# conventional extension, e.g. for analytics to find archives
+SUFFIX = ".dframes"
+
+BLOCKS_SUFFIX = ".blocks"
+
+BLOCK_HEADER = struct.Struct("<II")
+
+BLOCK_RECORD = struct.Struct("<QI")
+
+KEY = 0
+DELTA = 1
+REPEAT = 2
+
+MASK_SIZE = (FRAME_SIZE + 7) // 8
+
+# frames per block.  Seeking decodes at most one block, a few ms; smaller
+# blocks compress worse as each zlib stream starts from scratch
+KEYFRAME_INTERVAL = 2400
+
+# seconds a live block is held before it is written even if short.  Bounds
+# what a crash loses; 600 frame blocks are about 17% bigger than full ones
+FLUSH_INTERVAL = 10.0
+
+# blocks are compressed once per keyframe interval, so level 9 is cheap
+COMPRESS_LEVEL = 9
+
+
+def elapsed_of(frame: bytes) -> int:
+    return int.from_bytes(frame[3:7], "big") >> 4
+
+
+def without_elapsed(frame: bytes) -> bytes:
+    """
+    The frame with its 28 bit elapsed zeroed, keeping the low nibble of
+    byte 6 (the top of lines)
+    """
+    return frame[:3] + bytes((0, 0, 0, frame[6] & 0x0F)) + frame[7:]
+
+
+def put_varint(value: int, out: bytearray):
+    while value >= 0x80:
+        out.append((value & 0x7F) | 0x80)
+        value >>= 7
+    out.append(value)
+
+
+def get_varint(data: bytes, offset: int) -> tuple[int, int]:
+    value = 0
+    shift = 0
+    while True:
+        byte = data[offset]
+        offset += 1
+        value |= (byte & 0x7F) << shift
+        if byte < 0x80:
+            return value, offset
+        shift += 7
+
+
+def zigzag(value: int) -> int:
+    return value << 1 if value >= 0 else (-value << 1) - 1
+
+
+def unzigzag(value: int) -> int:
+    return value >> 1 if not value & 1 else -((value + 1) >> 1)
+
+
+class DeltaEncoder:
+    """
+    Turns frames into blocks.  add() returns a finished block, header
+    included, every keyframe_interval frames; flush() returns the rest
+    """
+
+    def __init__(
+        self,
+        keyframe_interval: int = KEYFRAME_INTERVAL,
+        level: int = COMPRESS_LEVEL,
+    ):
+        self.keyframe_interval = max(1, keyframe_interval)
+        self.level = level
+        self.records = bytearray()
+        self.frames = 0
+        self._previous = b""
+        self._elapsed = 0
+        self._repeats: list[int] = []
+
+    def __repr__(self):
+        keyframe_interval = self.keyframe_interval
+        level = self.level
+        return f"{type(self).__name__}({keyframe_interval=}, {level=})"
+
+    def _end_run(self):
+        if not self._repeats:
+            return
+        self.records.append(REPEAT)
+        put_varint(len(self._repeats), self.records)
+        for change in self._repeats:
+            put_varint(change, self.records)
+        self._repeats.clear()
+
+    def add(self, frame: bytes) -> bytes | None:
+        if len(frame) != FRAME_SIZE or frame[0] >> 5 != BinaryFrame3.VERSION:
+            raise ValueError(f"Not a version {BinaryFrame3.VERSION} frame")
+        elapsed = elapsed_of(frame)
+        stripped = without_elapsed(frame)
+        change = zigzag(elapsed - self._elapsed)
+        records = self.records
+        if not self.frames:
+            records.append(KEY)
+            records += frame
+        elif stripped == self._previous:
+            self._repeats.append(change)
+        else:
+            self._end_run()
+            records.append(DELTA)
+            put_varint(change, records)
+            diff = (
+                int.from_bytes(stripped, "big") ^ int.from_bytes(self._previous, "big")
+            ).to_bytes(FRAME_SIZE, "big")
+            mask = 0
+            changed = bytearray()
+            for position, byte in enumerate(diff):
+                if byte:
+                    mask |= 1 << position
+                    changed.append(byte)
+            records += mask.to_bytes(MASK_SIZE, "little")
+            records += changed
+        self._previous = stripped
+        self._elapsed = elapsed
+        self.frames += 1
+        if self.frames >= self.keyframe_interval:
+            return self.flush()
+        return None
+
+    def flush(self) -> bytes | None:
+        if not self.frames:
+            return None
+        self._end_run()
+        compressed = zlib.compress(self.records, self.level)
+        block = BLOCK_HEADER.pack(len(compressed), self.frames) + compressed
+        self.records = bytearray()
+        self.frames = 0
+        return block
+
+
+def decode_block(compressed: bytes) -> list[bytes]:
+    """
+    Frames of one block, from the zlib stream after its header
+    """
+    data = zlib.decompress(compressed)
+    frames = []
+    offset = 0
+    frame = bytearray()
+    elapsed = 0
+    while offset < len(data):
+        tag = data[offset]
+        offset += 1
+        if tag == KEY:
+            frame = bytearray(data[offset : offset + FRAME_SIZE])
+            offset += FRAME_SIZE
+            elapsed = elapsed_of(frame)
+            frames.append(bytes(frame))
+            continue
+        if tag == REPEAT:
+            count, offset = get_varint(data, offset)
+            changes = []
+            for _ in range(count):
+                change, offset = get_varint(data, offset)
+                changes.append(change)
+        elif tag == DELTA:
+            change, offset = get_varint(data, offset)
+            changes = [change]
+            mask = int.from_bytes(data[offset : offset + MASK_SIZE], "little")
+            offset += MASK_SIZE
+            while mask:
+                low = mask & -mask
+                frame[low.bit_length() - 1] ^= data[offset]
+                offset += 1
+                mask ^= low
+        else:
+            raise ValueError(f"Unknown record {tag} in delta archive block")
+        for change in changes:
+            elapsed += unzigzag(change)
+            value = (elapsed << 4) | (frame[6] & 0x0F)
+            frame[3:7] = value.to_bytes(4, "big")
+            frames.append(bytes(frame))
+    return frames
+
+
+class DeltaArchive:
+    """
+    Random access to an archive written by DeltaArchiveWriter.  Reading a
+    frame decodes its block; the last block decoded is kept
+    """
+
+    def __init__(self, filename: str):
+        self.filename = filename
+        self.file = open(filename, "rb")
+        if self.file.read(len(MAGIC)) != MAGIC:
+            self.file.close()
+            raise ValueError(f"{filename} is not a delta archive")
+        self.blocks: list[tuple[int, int]] = []
+        self.frames = 0
+        self._starts: list[int] = []
+        self._cached: tuple[int, list[bytes]] | None = None
+        self.refresh()
+
+    def __repr__(self):
+        filename = self.filename
+        frames = self.frames
+        return f"{type(self).__name__}({filename=}, {frames=})"
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __len__(self) -> int:
+        return self.frames
+
+    def __getitem__(self, index: int) -> bytes:
+        if index < 0:
+            index += self.frames
+        if not 0 <= index < self.frames:
+            raise IndexError(f"frame {index} out of range")
+        block = bisect.bisect_right(self._starts, index) - 1
+        return self.block(block)[index - self._starts[block]]
+
+    def __iter__(self) -> typing.Iterator[bytes]:
+        return self.iter_from(0)
+
+    def iter_from(self, start: int) -> typing.Iterator[bytes]:
+        if start >= self.frames:
+            return
+        first = bisect.bisect_right(self._starts, start) - 1
+        skip = start - self._starts[first]
+        for block in range(first, len(self.blocks)):
+            frames = self.block(block)
+            yield from frames[skip:] if skip else frames
+            skip = 0
+
+    def block(self, block: int) -> list[bytes]:
+        if self._cached and self._cached[0] == block:
+            return self._cached[1]
+        offset, _ = self.blocks[block]
+        self.file.seek(offset)
+        size, _ = BLOCK_HEADER.unpack(self.file.read(BLOCK_HEADER.size))
+        frames = decode_block(self.file.read(size))
+        self._cached = (block, frames)
+        return frames
+
+    def refresh(self):
+        """
+        Picks up blocks appended since the archive was opened
+        """
+        end = os.fstat(self.file.fileno()).st_size
+        blocks = self._load_index(end)
+        offset = blocks[-1][0] if blocks else len(MAGIC)
+        first = blocks[-1][1] if blocks else 0
+        if blocks:
+            # the index may be behind the data, check from its last block
+            blocks.pop()
+        blocks.extend(self._scan(offset, first, end))
+        self.blocks = blocks
+        self._starts = [first for _, first in blocks]
+        self.frames = 0
+        if blocks:
+            offset, first = blocks[-1]
+            self.file.seek(offset)
+            _, count = BLOCK_HEADER.unpack(self.file.read(BLOCK_HEADER.size))
+            self.frames = first + count
+
+    def _load_index(self, end: int) -> list[tuple[int, int]]:
+        try:
+            with open(self.filename + BLOCKS_SUFFIX, "rb") as file:
+                data = file.read()
+        except OSError:
+            return []
+        usable = len(data) - len(data) % BLOCK_RECORD.size
+        blocks = [
+            (offset, first)
+            for offset, first in BLOCK_RECORD.iter_unpack(data[:usable])
+            if offset < end
+        ]
+        if blocks and blocks[0] != (len(MAGIC), 0):
+            logger.warning(f"Ignoring inconsistent {self.filename}{BLOCKS_SUFFIX}")
+            return []
+        return blocks
+
+    def _scan(self, offset: int, first: int, end: int) -> list[tuple[int, int]]:
+        """
+        Complete blocks from offset on, read from their headers
+        """
+        blocks = []
+        while offset + BLOCK_HEADER.size <= end:
+            self.file.seek(offset)
+            size, count = BLOCK_HEADER.unpack(self.file.read(BLOCK_HEADER.size))
+            if offset + BLOCK_HEADER.size + size > end:
+                # still being written
+                break
+            blocks.append((offset, first))
+            offset += BLOCK_HEADER.size + size
+            first += count
+        return blocks
+
+    def close(self):
+        self.file.close()
+
+
+class DeltaArchiveWriter(Sender):
+    def __init__(
+        self,
+        filename: str,
+        overwrite: bool = False,
+        keyframe_interval: int = KEYFRAME_INTERVAL,
+        flush_interval: float = FLUSH_INTERVAL,
+    ):
+        self.filename = filename
+        self.overwrite = overwrite
+        self.flush_interval = flush_interval
+        self.queue = asyncio.Queue()
+        self.encoder = DeltaEncoder(keyframe_interval)
+        self._block_started = 0.0
+        self.frames = 0
+        self.skipped = 0
+        self.written = 0
+
+        if os.path.exists(filename) and not overwrite:
+            sys.exit(f"{filename} exists and overwrite flag is not set")
+        self.file = open(filename, "wb")
+        self.file.write(MAGIC)
+        self.index = open(filename + BLOCKS_SUFFIX, "wb")
+        self.size = len(MAGIC)
+
+    def __repr__(self):
+        filename = self.filename
+        overwrite = self.overwrite
+        encoder = self.encoder
+        flush_interval = self.flush_interval
+        return (
+            f"{type(self).__name__}({filename=}, {overwrite=}, {encoder=}, "
+            f"{flush_interval=})"
+        )
+
+    def write_block(self, block: bytes | None):
+        if not block:
+            return
+        _, count = BLOCK_HEADER.unpack_from(block)
+        # block first so a reader never sees an index past the data
+        self.file.write(block)
+        self.file.flush()
+        self.index.write(BLOCK_RECORD.pack(self.size, self.written))
+        self.index.flush()
+        self.size += len(block)
+        self.written += count
+
+    def write(self, frame: bytes):
+        if len(frame) != FRAME_SIZE or frame[0] >> 5 != BinaryFrame3.VERSION:
+            self.skipped += 1
+            return
+        self.frames += 1
+        self.write_block(self.encoder.add(frame))
+
+    def close(self):
+        self.write_block(self.encoder.flush())
+        self.file.close()
+        self.index.close()
+
+    async def send(self):
+        try:
+            while True:
+                timeout = None
+                if self.flush_interval and self.encoder.frames:
+                    timeout = max(
+                        0.0,
+                        self._block_started + self.flush_interval - time.monotonic(),
+                    )
+                try:
+                    msg = await asyncio.wait_for(self.queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    # the block in progress is old enough to write, full or not
+                    self.write_block(self.encoder.flush())
+                    continue
+                if not msg:
+                    logger.info("Empty message received.  Breaking")
+                    break
+                if not self.encoder.frames:
+                    self._block_started = time.monotonic()
+                self.write(msg)
+                self.delivered()
+        finally:
+            self.close()
+            if self.skipped:
+                logger.warning(f"Skipped {self.skipped} frames that weren't version 3")
+            logger.info(
+                f"Stored {self.frames} frames in {self.size} bytes in {self.filename}"
+            )
+
+
+class DeltaArchiveReceiver(Receiver):
+    """
+    Replays a delta archive, optionally starting at a given frame
+    """
+
+    def __init__(
+        self,
+        queues: list[asyncio.Queue],
+        filename: str,
+        start: int = 0,
+    ):
+        self.queues = queues
+        self.filename = filename
+        self.start = start
+        try:
+            self.archive = DeltaArchive(filename)
+        except (OSError, ValueError) as exc:
+            sys.exit(f"Unable to open {filename}: {exc!s}")
+
+    def __repr__(self):
+        queues = self.queues
+        filename = self.filename
+        start = self.start
+        return f"{type(self).__name__}({queues=}, {filename=}, {start=})"
+
+    async def receive(self):
+        logger.info(f"Replaying {self.filename} from frame {self.start}")
+        with self.archive:
+            for payload in self.archive.iter_from(self.start):
+                for queue in self.queues:
+                    await queue.put(payload)
+        logger.info("End of delta archive reached")
+
+
+def convert(
+    source: str, destination: str, keyframe_interval: int = KEYFRAME_INTERVAL
+) -> tuple[int, int]:
+    """
+    Writes the version 3 frames of a FileWriter archive to a delta
+    archive.  Returns (frames, bytes written)
+    """
+    writer = DeltaArchiveWriter(destination, True, keyframe_interval)
+    try:
+        for frame in iter_frames(source):
+            writer.write(frame)
+    finally:
+        writer.close()
+    return writer.frames, writer.size
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(
+        prog="python -m ntcpycon.delta_archive",
+        description="Convert a .bframes archive to a delta archive",
+    )
+    parser.add_argument("source")
+    parser.add_argument("destination")
+    parser.add_argument("--keyframe-interval", type=int, default=KEYFRAME_INTERVAL)
+    args = parser.parse_args(argv)
+    if not args.destination.endswith(SUFFIX):
+        logger.warning(f"{args.destination} doesn't end in {SUFFIX}")
+    started = time.perf_counter()
+    frames, size = convert(args.source, args.destination, args.keyframe_interval)
+    source_size = os.path.getsize(args.source)
+    print(
+        f"{frames} frames: {source_size} -> {size} bytes "
+        f"({source_size / max(1, size):.1f}x) in {time.perf_counter() - started:.1f}s"
+    )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,24 +1,79 @@
 from __future__ import annotations
 import asyncio
+import collections
+import concurrent.futures
 import logging
 import sys
 import time
 
-import edlinkn8
 import ntcpycon.abstract
 import ntcpycon.gymmem
 import ntcpycon.binaryframe
+import ntcpycon.edrecord
+import ntcpycon.edwindow
+import ntcpycon.pacer
+import ntcpycon.trace
+
+try:
+    import edlinkn8
+except ImportError:  # only needed to talk to a cartridge
+    edlinkn8 = None
 
 Receiver = ntcpycon.abstract.Receiver
 GymMemory = ntcpycon.gymmem.GymMemory
 BinaryFrame3 = ntcpycon.binaryframe.BinaryFrame3
+OutputPacer = ntcpycon.pacer.OutputPacer
+RawRecorder = ntcpycon.edrecord.RawRecorder
+RecordedEverdrive = ntcpycon.edrecord.RecordedEverdrive
+TruncatedRecording = ntcpycon.edrecord.TruncatedRecording
+WindowedLink = ntcpycon.edwindow.WindowedLink
+backlog = ntcpycon.edwindow.backlog
+CLOCKS = ntcpycon.gymmem.CLOCKS
+NTSC_FRAME_RATE = ntcpycon.gymmem.NTSC_FRAME_RATE
+TRACER = ntcpycon.trace.TRACER
+ENCODED = ntcpycon.trace.ENCODED
+RECEIVED = ntcpycon.trace.RECEIVED
 
 logger = logging.getLogger(__name__)
 
 IDLE_MAX = 0.25
 
+FRAME_INTERVAL = 1 / NTSC_FRAME_RATE
+
+# playstates where nothing on screen is moving
+IDLE_PLAYSTATES = (0, 3, 10)
+
+# consecutive idle polls outside a game before backing off
+IDLE_GRACE = 30
+
+# longest gap between polls while idle.  A change of playstate is only
+# seen on the next poll, so this is also how late play can be picked up
+IDLE_POLL_MAX = FRAME_INTERVAL
+
+# shortest gap between polls once backing off
+RETRY_DELAY = FRAME_INTERVAL / 8
+
+# poll slightly ahead of the expected frame so the phase can't drift late
+POLL_LEAD = 0.001
+
+CPU_REPORT_INTERVAL = 30
+
 CMD_SEND_STATS = 0x42
 
+FULL_FOOTER = b"\xaa\xaa"
+
+# seconds to wait on one request/response before giving up on it
+USB_TIMEOUT = 0.5
+
+# seconds without a valid frame before the device link is reset
+WATCHDOG_TIMEOUT = 2.0
+
+FRAME_MODES = ("compact", "full", "adaptive")
+
+# frames after a full frame before adaptive mode asks for another.  Two
+# cycles of compact playfield chunks, enough for the chunks to catch up
+FULL_FRAME_COOLDOWN = 20
+
 
 class ED2NTCCompactFrame:
     def __init__(self, frame: bytes):
@@ -171,6 +226,12 @@ class CompactOptions:
     FRAME = ED2NTCCompactFrame
     UPDATE = "update_from_edlink_compact"
 
+    @staticmethod
+    def valid(frame: bytes) -> bool:
+        header = int.from_bytes(frame[0:2], "little")
+        footer = int.from_bytes(frame[62:64], "little")
+        return header ^ footer == 0xFFFF
+
 
 class Options:
     REQUEST = 0x42
@@ -179,8 +240,269 @@ class Options:
     FRAME = ED2NTCFrame
     UPDATE = "update_from_edlink"
 
+    @staticmethod
+    def valid(frame: bytes) -> bool:
+        return frame[235:237] == FULL_FOOTER
+
+
+class FrameModeSelector:
+    """
+    Picks the frame type of each request.  compact and full always ask for
+    the same type.  adaptive asks for compact frames and for a single full
+    frame after a dropped frame, when a game starts or when the compact
+    playfield is stale, so the playfield is right again without waiting
+    for a coherent cycle of chunks.  Reports USB bytes per second by type.
+    """
+
+    def __init__(self, mode: str = "compact", interval: float = CPU_REPORT_INTERVAL):
+        if mode not in FRAME_MODES:
+            sys.exit(f"frame_mode must be one of: {', '.join(FRAME_MODES)}")
+        self.mode = mode
+        self.interval = interval
+        self.full_pending = False
+        self.reasons: collections.Counter[str] = collections.Counter()
+        self.bytes: collections.Counter[str] = collections.Counter()
+        self.responses: collections.Counter[str] = collections.Counter()
+        self._cooldown = 0
+        self._since = time.monotonic()
 
-options = CompactOptions
+    def __repr__(self):
+        mode = self.mode
+        return f"{type(self).__name__}({mode=})"
+
+    def next(self):
+        if self.mode == "full":
+            return Options
+        if self.full_pending:
+            self.full_pending = False
+            self._cooldown = FULL_FRAME_COOLDOWN
+            return Options
+        return CompactOptions
+
+    def request_full(self, reason: str):
+        if self.mode != "adaptive" or self.full_pending or self._cooldown:
+            return
+        self.full_pending = True
+        self.reasons[reason] += 1
+
+    def frame(self):
+        if self._cooldown:
+            self._cooldown -= 1
+
+    def add(self, frame_options, received: int):
+        name = frame_options.UPDATE
+        # one request byte, then the response
+        self.bytes[name] += 1 + received
+        self.responses[name] += 1
+        now = time.monotonic()
+        if (elapsed := now - self._since) < self.interval:
+            return
+        usage = ", ".join(
+            f"{'full' if name == Options.UPDATE else 'compact'} "
+            f"{self.bytes[name] / elapsed:.0f} B/s ({self.responses[name] / elapsed:.1f} responses/s)"
+            for name in sorted(self.bytes)
+        )
+        reasons = f".  Full frames for {dict(self.reasons)}" if self.reasons else ""
+        logger.info(f"USB {usage}{reasons}")
+        self.bytes.clear()
+        self.responses.clear()
+        self.reasons.clear()
+        self._since = now
+
+
+class StreamValidator:
+    """
+    Turns whatever receive_data returned into whole, valid frames.
+
+    Bytes are buffered until a frame's worth is available.  A frame that
+    fails its header/footer check is not passed on: the buffer is scanned
+    for the next offset that holds a valid frame and everything before it
+    is discarded.  Short reads simply wait for the rest of the frame.
+    """
+
+    def __init__(self, options=CompactOptions):
+        self.options = options
+        self.buffer = bytearray()
+        self.counters: collections.Counter[str] = collections.Counter()
+
+    def __repr__(self):
+        counters = dict(self.counters)
+        return f"{type(self).__name__}({counters=})"
+
+    def feed(self, data: bytes) -> list[bytes]:
+        frame_options = self.options
+        size = frame_options.SIZE
+        if not data:
+            return []
+        if len(data) % size:
+            self.counters["short_reads"] += 1
+        self.buffer.extend(data)
+        frames = []
+        while len(self.buffer) >= size:
+            if frame_options.valid(self.buffer[:size]):
+                frames.append(bytes(self.buffer[:size]))
+                del self.buffer[:size]
+                continue
+            self.counters["bad_frames"] += 1
+            for offset in range(1, len(self.buffer) - size + 1):
+                if frame_options.valid(self.buffer[offset : offset + size]):
+                    break
+            else:
+                # keep what could still be the start of a frame
+                offset = len(self.buffer) - size + 1
+            self.counters["resyncs"] += 1
+            self.counters["discarded_bytes"] += offset
+            del self.buffer[:offset]
+        return frames
+
+    @property
+    def errors(self) -> int:
+        return self.counters["short_reads"] + self.counters["bad_frames"]
+
+    def clear(self):
+        self.counters["discarded_bytes"] += len(self.buffer)
+        self.buffer.clear()
+
+    def switch(self, options):
+        """
+        Expect frames of another type.  A partial frame of the old type
+        can't be completed any more
+        """
+        if options is not self.options:
+            self.clear()
+            self.options = options
+
+
+class PollScheduler:
+    """
+    Decides how long to wait before the next request to the cartridge.
+
+    In a game, polls are locked to the NES frame cadence: requests are
+    scheduled one frame minus POLL_LEAD apart, counted from the schedule
+    rather than from when the last request actually went out, so sleep
+    overshoot can't cancel the lead.  The phase creeps earlier until a
+    request lands before the frame is ready.  From then on the link is
+    polled back to back until the frame arrives, never waiting past it,
+    and the request that finds it anchors the schedule just after the frame
+    boundary again.  Only outside a game (game_start clear), after
+    IDLE_GRACE polls in an idle playstate, the gap doubles each poll up to
+    IDLE_POLL_MAX, one frame, so a change of playstate or game_start is
+    still seen within a frame and drops straight back to the frame cadence.
+    """
+
+    def __init__(
+        self,
+        interval: float = FRAME_INTERVAL,
+        idle_max: float = IDLE_POLL_MAX,
+    ):
+        self.interval = interval
+        self.idle_max = idle_max
+        self.idle_polls = 0
+        self.backoff = 0.0
+        self._last_state: tuple[int, int] | None = None
+        self._due: float | None = None
+        self._missed = False
+
+    def __repr__(self):
+        interval = self.interval
+        idle_max = self.idle_max
+        return f"{type(self).__name__}({interval=}, {idle_max=})"
+
+    def next_delay(
+        self,
+        playstate: int,
+        game_start: int,
+        new_frame: bool,
+        polled_at: float,
+    ) -> float:
+        state = (playstate, game_start)
+        if state != self._last_state:
+            self.idle_polls = 0
+        self._last_state = state
+
+        if playstate in IDLE_PLAYSTATES and not game_start:
+            self.idle_polls += 1
+        else:
+            self.idle_polls = 0
+
+        if self.idle_polls > IDLE_GRACE:
+            self.backoff = min(self.idle_max, max(RETRY_DELAY, self.backoff * 2))
+            self._due = None
+            return self.backoff
+        self.backoff = 0.0
+
+        if not new_frame:
+            # the frame is due any moment
+            self._missed = True
+            return 0.0
+        now = time.monotonic()
+        if self._missed or self._due is None or self._due < now - self.interval:
+            # just after the frame boundary, or lost track of it
+            self._due = polled_at
+        self._missed = False
+        self._due += self.interval - POLL_LEAD
+        return max(0.0, self._due - now)
+
+
+class FixedPollScheduler:
+    """
+    Polls as fast as the link allows
+    """
+
+    backoff = 0.0
+
+    def __repr__(self):
+        return f"{type(self).__name__}()"
+
+    def next_delay(self, *args) -> float:
+        return 0.0
+
+
+class CpuMeter:
+    """
+    Host CPU time spent on one console, reported as a share of one core
+    """
+
+    def __init__(self, interval: float = CPU_REPORT_INTERVAL):
+        self.interval = interval
+        self.cpu_percent = 0.0
+        self._cpu = 0.0
+        self._polls = 0
+        self._frames = 0
+        self._since = time.monotonic()
+
+    def add(self, cpu_seconds: float, new_frame: bool):
+        self._cpu += cpu_seconds
+        self._polls += 1
+        self._frames += new_frame
+        now = time.monotonic()
+        if (wall := now - self._since) < self.interval:
+            return
+        self.cpu_percent = self._cpu / wall * 100
+        logger.info(
+            f"Host CPU {self.cpu_percent:.1f}% of a core.  "
+            f"{self._polls / wall:.1f} polls/s, {self._frames / wall:.1f} frames/s"
+        )
+        self._cpu = 0.0
+        self._polls = 0
+        self._frames = 0
+        self._since = now
+
+
+def close_device(device):
+    """
+    Closes the port under a device so a read blocked on it returns.  Called
+    from the loop thread while the worker may be stuck in that read
+    """
+    closers = [device]
+    if not hasattr(device, "close"):
+        # edlinkn8.Everdrive keeps its serial port in an attribute
+        closers = [value for value in vars(device).values() if hasattr(value, "close")]
+    for closer in closers:
+        try:
+            closer.close()
+        except Exception as exc:
+            logger.warning(f"Closing {device!r}: {type(exc).__name__}: {exc!s}")
 
 
 class EDLink(Receiver):
@@ -188,11 +510,64 @@ class EDLink(Receiver):
         self,
         queues: list[asyncio.Queue],
         launch: bool = False,
+        clock: str = "frame_counter",
+        pacing: bool = False,
+        pacing_depth: int = 2,
+        adaptive_polling: bool = True,
+        record: str | None = None,
+        overwrite: bool = False,
+        record_flush_interval: float = ntcpycon.edrecord.FLUSH_INTERVAL,
+        device=None,
+        timeout: float | None = USB_TIMEOUT,
+        watchdog: float = WATCHDOG_TIMEOUT,
+        window: int | None = None,
+        ack_every: int = ntcpycon.edwindow.ACK_EVERY,
+        frame_mode: str = "compact",
     ):
         self.queues = queues
         self.launch = launch
-        self.everdrive = edlinkn8.Everdrive()
+        if clock not in CLOCKS:
+            sys.exit(f"clock must be one of: {', '.join(CLOCKS)}")
+        self.clock = clock
+        self.pacer = OutputPacer(queues, depth=pacing_depth) if pacing else None
+        self.cpu_meter = CpuMeter()
+        self.recorder = (
+            RawRecorder(record, overwrite, record_flush_interval) if record else None
+        )
+        self.validator = StreamValidator()
+        self.mode = FrameModeSelector(frame_mode)
+        self.window = None
+        if window and frame_mode != "compact":
+            sys.exit("frame_mode must be compact to use a window")
+        if window:
+            self.window = WindowedLink(window, ack_every, self.validator.counters)
+        if adaptive_polling and not self.window:
+            self.scheduler = PollScheduler()
+        else:
+            # pushed frames arrive when they're ready, reads just wait for them
+            self.scheduler = FixedPollScheduler()
+        self.timeout = timeout
+        self.watchdog = watchdog
+        self._debug = False
+        # every device call runs on this one thread
+        self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=1)
+        self._pending: asyncio.Future | None = None
+        # frame options the pending transaction was submitted with
+        self._pending_options = CompactOptions
+        # reopening the device after a reset, when that timed out
+        self._reopening: asyncio.Future | None = None
+        self.device_factory = None
+        if device is None:
+            if edlinkn8 is None:
+                sys.exit("python-edlinkn8 is required for edlink.  See INSTALL.md")
+            self.device_factory = edlinkn8.Everdrive
+            device = self.device_factory()
+        self.everdrive = device
         if launch:
+            if self.device_factory is None:
+                sys.exit(
+                    "launch needs an Everdrive, not a simulated or recorded device"
+                )
             # todo:  clean this
             gym = edlinkn8.NesRom.from_file("TetrisGYM/ed2ntc.nes")
             try:
@@ -204,46 +579,315 @@ class EDLink(Receiver):
     def __repr__(self):
         queues = self.queues
         everdrive = self.everdrive
-        return f"{type(self).__name__}({queues=}, {everdrive=})"
+        clock = self.clock
+        pacer = self.pacer
+        scheduler = self.scheduler
+        recorder = self.recorder
+        window = self.window
+        mode = self.mode
+        return f"{type(self).__name__}({queues=}, {everdrive=}, {clock=}, {pacer=}, {scheduler=}, {recorder=}, {window=}, {mode=})"
 
     async def receive(self):
-        loop = asyncio.get_running_loop()
-        _last_frame_counter = 0
-        _last_frame_sent = ()
-        _last_frame_sent_when = time.time()
-        gym = GymMemory()
+        pacer_task = asyncio.create_task(self.pacer.run()) if self.pacer else None
+        try:
+            await self.receive_frames()
+        finally:
+            if pacer_task:
+                pacer_task.cancel()
+            if self.recorder:
+                self.recorder.close()
+            if self.window:
+                self.window.report()
+                # back to request/response for whoever connects next
+                self.executor.submit(
+                    self.everdrive.write_fifo, bytearray(self.window.stop_message())
+                )
+
+    def transact(self, frame_options=CompactOptions) -> tuple[bytes, float]:
+        """
+        One request/response with the cartridge.  Runs in the executor and
+        returns the frame with the CPU time this thread spent on it
+        """
+        cpu_start = time.thread_time()
+        self.everdrive.write_fifo(bytearray([frame_options.REQUEST]))
+        frame = self.everdrive.receive_data(frame_options.SIZE)
+        return frame, time.thread_time() - cpu_start
+
+    def transact_windowed(self, frame_options=CompactOptions) -> tuple[bytes, float]:
+        """
+        Windowed push version of transact.  Sends any acknowledgement that
+        is due, waits for the next pushed frame and drains the frames
+        queued behind it in one more read
+        """
+        cpu_start = time.thread_time()
+        if message := self.window.message():
+            self.everdrive.write_fifo(bytearray(message))
+        data = self.everdrive.receive_data(frame_options.SIZE)
+        if (
+            len(data) == frame_options.SIZE
+            and frame_options.valid(data)
+            and (queued := backlog(data))
+        ):
+            queued = min(queued, self.window.window)
+            data += self.everdrive.receive_data(frame_options.SIZE * queued)
+        self.counters["window_reads"] += 1
+        return data, time.thread_time() - cpu_start
+
+    @property
+    def counters(self) -> collections.Counter[str]:
+        return self.validator.counters
+
+    def note_failure(self, failure: str):
+        if self._failed_at is None:
+            self._failed_at = time.monotonic()
+        logger.warning(f"USB {failure}.  {dict(self.counters)}")
+
+    async def reset_link(self):
+        """
+        Closes the device, which makes a hung read return, then reopens it
+        on the same worker thread once that read has come back
+        """
+        self.counters["resets"] += 1
+        logger.warning(f"No valid frame for {self.watchdog}s.  Resetting device link")
+        self._last_valid = time.monotonic()
+        close_device(self.everdrive)
+        if self._pending:
+            await asyncio.wait({self._pending}, timeout=self.watchdog)
+            if not self._pending.done():
+                # a second thread on the same port would race the stuck one
+                logger.error("USB read still stuck after closing the device")
+                return
+            if exc := self._pending.exception():
+                logger.info(f"Hung read ended with {type(exc).__name__}: {exc!s}")
+            self._pending = None
+        self.validator.clear()
+        if self.window:
+            self.window.reset()
+        if self.device_factory:
+            future = self._reopening
+            if future is None:
+                loop = asyncio.get_running_loop()
+                future = loop.run_in_executor(self.executor, self.device_factory)
+            done, _ = await asyncio.wait({future}, timeout=self.watchdog)
+            if not done:
+                self._reopening = future
+                logger.error("Reopening the device timed out")
+            else:
+                self.reopened(future)
+        self._last_valid = time.monotonic()
 
-        while True:
-            await loop.run_in_executor(
-                None, self.everdrive.write_fifo, bytearray([options.REQUEST])
+    def reopened(self, future: asyncio.Future):
+        self._reopening = None
+        if exc := future.exception():
+            logger.error(f"Unable to reopen device: {type(exc).__name__}: {exc!s}")
+        else:
+            self.everdrive = future.result()
+
+    async def poll(self, frame_options=CompactOptions) -> tuple[bytes, float]:
+        """
+        One transaction on the worker thread.  Device calls all stay on
+        that thread: a transaction that times out is left pending and
+        waited on again by the next poll instead of being raced by a new one
+        """
+        if self._reopening:
+            # the device comes back before anything else runs on its thread
+            done, _ = await asyncio.wait({self._reopening}, timeout=self.timeout)
+            if not done:
+                self.counters["timeouts"] += 1
+                self.note_failure("timeout reopening the device")
+                return b"", 0.0
+            self.reopened(self._reopening)
+        future = self._pending
+        if future is None:
+            loop = asyncio.get_running_loop()
+            future = loop.run_in_executor(
+                self.executor,
+                self.transact_windowed if self.window else self.transact,
+                frame_options,
             )
-            frame = await loop.run_in_executor(
-                None, self.everdrive.receive_data, options.SIZE
+        # not wait_for, which can swallow a cancel arriving as the read
+        # completes and leave the receiver polling forever
+        done, _ = await asyncio.wait({future}, timeout=self.timeout)
+        if not done:
+            if future is not self._pending:
+                self._pending = future
+                self._pending_options = frame_options
+            self.counters["timeouts"] += 1
+            self.note_failure("timeout")
+            return b"", 0.0
+        self._pending = None
+        try:
+            return future.result()
+        except EOFError:
+            raise
+        except Exception as exc:
+            self.counters["errors"] += 1
+            self.note_failure(f"error {type(exc).__name__}: {exc!s}")
+        return b"", 0.0
+
+    def response_options(self, data: bytes, requested):
+        """
+        Frame type of a response, normally what was asked for
+        """
+        return requested
+
+    def check_frame(self, frame: bytes, frame_options=CompactOptions) -> bool:
+        """
+        Frame drop/error detection.  Returns False for a repeat of the last frame
+        """
+        fc = int.from_bytes(frame[frame_options.FC_LOC], "little")
+        if fc == self._last_frame_counter:
+            if self._debug:
+                logger.debug(f"Frame {fc} received twice")
+            return False
+        if (_last_fc_nrmlzed := ((self._last_frame_counter + 1) & 0xFFFF)) != fc:
+            dropped = (fc - _last_fc_nrmlzed) & 0xFFFF
+            # skipped on purpose while the scheduler is backing off
+            log = logger.debug if self.scheduler.backoff else logger.warning
+            log(
+                f'dropped {dropped} frame{"s" if dropped>1 else ""}.  {_last_fc_nrmlzed} to {(fc-1) & 0xFFFF}'
             )
-            logger.debug(f"Received {len(frame)} bytes from ed")
-
-            # frame drop/error detection
-            if len(frame) == options.SIZE:
-                fc = int.from_bytes(frame[options.FC_LOC], "little")
-                if (_last_fc_nrmlzed := ((_last_frame_counter + 1) & 0xFFFF)) != fc:
-                    logger.warning(
-                        f'dropped {fc-_last_fc_nrmlzed} frame{"s" if fc-_last_fc_nrmlzed>1 else ""}.  {_last_frame_counter+1} to {fc-1}'
-                    )
-                _last_frame_counter = fc
+            self.mode.request_full("drop")
+        self._last_frame_counter = fc
+        return True
+
+    async def publish(self, bframe: BinaryFrame3):
+        now = time.time()
+        compare_data = bframe.compare_data
+        if (compare_data == self._last_frame_sent) and (
+            now - self._last_frame_sent_when < IDLE_MAX
+        ):
+            if self._debug:
+                logger.debug("Skipping transmit of frame")
+            return
+        self._last_frame_sent_when = now
+        self._last_frame_sent = compare_data
+        payload = bframe.payload
+        if TRACER.enabled:
+            TRACER.event(ENCODED, len(payload))
+            TRACER.queued(payload)
+        if self.pacer:
+            self.pacer.put(payload)
+            return
+        for queue in self.queues:
+            await queue.put(payload)
+
+    async def receive_frames(self):
+        self._last_valid = time.monotonic()
+        self._failed_at: float | None = None
+        self._last_frame_counter = 0
+        self._last_frame_sent = ()
+        self._last_frame_sent_when = time.time()
+        self._debug = logger.isEnabledFor(logging.DEBUG)
+        gym = GymMemory(_clock=CLOCKS[self.clock]())
+        game_id = gym.game_id
+        delay = 0.0
+
+        while True:
+            if delay:
+                await asyncio.sleep(delay)
+            polled_at = time.monotonic()
+            if self._pending:
+                # still waiting on a timed out transaction, which answers
+                # what was asked for then
+                frame_options = self._pending_options
             else:
-                logger.warning(f"Invalid frame length: {len(frame)}")
+                frame_options = self.mode.next()
+            try:
+                data, cpu_used = await self.poll(frame_options)
+            except TruncatedRecording as exc:
+                logger.warning(f"{exc!s}.  Replay stopped at the truncation")
+                break
+            except EOFError as exc:
+                logger.info(f"{exc!s}.  Replay complete")
+                break
+            cpu_start = time.thread_time()
+            if self._debug:
+                logger.debug(f"Received {len(data)} bytes from ed")
+            if self.recorder and data:
+                self.recorder.write(data)
+
+            frame_options = self.response_options(data, frame_options)
+            self.validator.switch(frame_options)
+            errors = self.validator.errors
+            frames = self.validator.feed(data)
+            if self.validator.errors != errors:
+                self.note_failure("invalid data")
+            if self.window:
+                if not data:
+                    self.window.stalled()
+                frames = [frame for frame in frames if self.window.accept(frame)]
+                self.window.maybe_report()
+            self.mode.add(frame_options, len(data))
+
+            new_frame = False
+            now = time.monotonic()
+            if frames:
+                self._last_valid = now
+                if self._failed_at is not None:
+                    recovery = (now - self._failed_at) * 1000
+                    logger.info(f"USB link recovered after {recovery:.1f}ms")
+                    self._failed_at = None
+            elif now - self._last_valid > self.watchdog:
+                await self.reset_link()
+
+            for frame in frames:
+                if not self.check_frame(frame, frame_options):
+                    continue
+                new_frame = True
+                if TRACER.enabled:
+                    TRACER.frame()
+                    TRACER.event(RECEIVED, len(frame))
+                edframe = frame_options.FRAME(frame)
+                getattr(gym, frame_options.UPDATE)(edframe)
+                self.mode.frame()
+                if gym.game_id != game_id:
+                    game_id = gym.game_id
+                    if gym.game_start:
+                        self.mode.request_full("new_game")
+                elif gym.playfield_stale:
+                    self.mode.request_full("stale")
+                await self.publish(BinaryFrame3.from_gym_memory(gym))
+
+            delay = self.scheduler.next_delay(
+                gym.playstate,
+                gym.game_start,
+                new_frame,
+                polled_at,
+            )
+            cpu_used += time.thread_time() - cpu_start
+            self.cpu_meter.add(cpu_used, new_frame)
 
-            edframe = options.FRAME(frame)
-            getattr(gym, options.UPDATE)(edframe)
-            bframe = BinaryFrame3.from_gym_memory(gym)
+        for queue in self.queues:
+            await queue.put(None)
 
-            now = time.time()
-            if (bframe.compare_data == _last_frame_sent) and (
-                now - _last_frame_sent_when < IDLE_MAX
-            ):
-                logger.debug(f"Skipping transmit of frame")
-                continue
-            _last_frame_sent_when = now
-            _last_frame_sent = bframe.compare_data
-            for queue in self.queues:
-                await queue.put(bframe.payload)
+
+class EDLinkReplay(EDLink):
+    """
+    Feeds a raw recording through the EDLink decode pipeline
+    """
+
+    def __init__(
+        self,
+        queues: list[asyncio.Queue],
+        filename: str,
+        realtime: bool = True,
+        clock: str = "frame_counter",
+    ):
+        try:
+            open(filename)
+        except OSError:
+            sys.exit(f"Unable to open {filename}")
+        super().__init__(
+            queues,
+            clock=clock,
+            adaptive_polling=False,
+            device=RecordedEverdrive(filename, realtime),
+            # gaps in the recording are not link failures
+            timeout=None,
+            watchdog=float("inf"),
+        )
+
+    def response_options(self, data: bytes, requested):
+        # recordings of adaptive sessions mix both frame types
+        return Options if len(data) == Options.SIZE else CompactOptions
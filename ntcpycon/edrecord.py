@@ -0,0 +1,166 @@
+"""
+Raw Everdrive session recordings.
+
+A recording is a gzip stream that starts with MAGIC and is followed by one
+record per USB frame:
+
+4   microseconds since the previous record (little endian)
+2   frame length (little endian)
+n   frame exactly as returned by receive_data
+
+RecordedEverdrive plays a recording back through the same interface as
+edlinkn8.Everdrive so the rest of EDLink can't tell the difference.
+"""
+from __future__ import annotations
+
+import gzip
+import logging
+import struct
+import sys
+import time
+import typing
+
+logger = logging.getLogger(__name__)
+logger.addHandler(logging.NullHandler())
+
+MAGIC = b"EDR\x01"
+
+RECORD_HEADER = struct.Struct("<IH")
+
+DELTA_MAX = 2**32 - 1
+
+# seconds between flushes of the gzip stream, so a crash loses at most this
+# much of the recording
+FLUSH_INTERVAL = 10.0
+
+
+class TruncatedRecording(EOFError):
+    """
+    The recording stops partway, e.g. the recorder didn't get to close it
+    """
+
+
+class RawRecorder:
+    def __init__(
+        self,
+        filename: str,
+        overwrite: bool = False,
+        flush_interval: float = FLUSH_INTERVAL,
+    ):
+        self.filename = filename
+        self.overwrite = overwrite
+        self.flush_interval = flush_interval
+        self.records = 0
+        try:
+            open(filename, "rb")
+            exists = True
+        except OSError:
+            exists = False
+        if exists and not overwrite:
+            sys.exit(f"{filename} exists and overwrite flag is not set")
+        self.file = gzip.open(filename, "wb")
+        self.file.write(MAGIC)
+        self._last: float | None = None
+        self._flushed: float | None = None
+
+    def __repr__(self):
+        filename = self.filename
+        overwrite = self.overwrite
+        flush_interval = self.flush_interval
+        return f"{type(self).__name__}({filename=}, {overwrite=}, {flush_interval=})"
+
+    def write(self, frame: bytes, received_at: float | None = None):
+        if received_at is None:
+            received_at = time.monotonic()
+        if self._last is None:
+            self._last = self._flushed = received_at
+        delta = min(DELTA_MAX, max(0, int((received_at - self._last) * 1_000_000)))
+        self._last = received_at
+        self.file.write(RECORD_HEADER.pack(delta, len(frame)))
+        self.file.write(frame)
+        self.records += 1
+        if self.flush_interval and received_at - self._flushed >= self.flush_interval:
+            # a sync flush ends on a byte boundary, so everything written so
+            # far can be read back even if the trailer never is
+            self.file.flush()
+            self._flushed = received_at
+
+    def close(self):
+        self.file.close()
+        logger.info(f"Recorded {self.records} frames to {self.filename}")
+
+
+def iter_records(filename: str) -> typing.Iterator[tuple[float, bytes]]:
+    """
+    Yields (seconds since the first frame, frame) for every record.  Raises
+    TruncatedRecording after the last whole record of a cut off recording
+    """
+    records = 0
+    with gzip.open(filename, "rb") as file:
+        if file.read(len(MAGIC)) != MAGIC:
+            raise ValueError(f"{filename} is not an Everdrive recording")
+        elapsed = 0
+        try:
+            while header := file.read(RECORD_HEADER.size):
+                if len(header) < RECORD_HEADER.size:
+                    break
+                delta, length = RECORD_HEADER.unpack(header)
+                frame = file.read(length)
+                if len(frame) < length:
+                    break
+                elapsed += delta
+                records += 1
+                yield elapsed / 1_000_000, frame
+            else:
+                return
+        except EOFError:
+            # gzip raises this when the stream ends without its trailer
+            pass
+    raise TruncatedRecording(f"{filename} is truncated after {records} records")
+
+
+class RecordedEverdrive:
+    """
+    Stands in for edlinkn8.Everdrive and answers every request with the next
+    recorded frame, either at the original pace or as fast as possible.
+    Raises EOFError when the recording is exhausted, TruncatedRecording if
+    it was cut off.
+    """
+
+    def __init__(
+        self,
+        filename: str,
+        realtime: bool = True,
+    ):
+        self.filename = filename
+        self.realtime = realtime
+        self.records = iter_records(filename)
+        self._start: float | None = None
+
+    def __repr__(self):
+        filename = self.filename
+        realtime = self.realtime
+        return f"{type(self).__name__}({filename=}, {realtime=})"
+
+    def write_fifo(self, data: bytes):
+        ...
+
+    def load_game(self, rom):
+        ...
+
+    def close(self):
+        # reads of a recording never block
+        ...
+
+    def receive_data(self, size: int) -> bytes:
+        try:
+            elapsed, frame = next(self.records)
+        except StopIteration:
+            raise EOFError(f"End of {self.filename}") from None
+        if self.realtime:
+            now = time.monotonic()
+            if self._start is None:
+                self._start = now - elapsed
+            if (delay := self._start + elapsed - now) > 0:
+                time.sleep(delay)
+        return frame
@@ -0,0 +1,490 @@
+"""
+Simulated Everdrive running TetrisGYM (ed2ntc).
+
+SimulatedEverdrive implements the parts of edlinkn8.Everdrive that EDLink
+uses.  A small game simulation advances at the NES frame rate on the host
+clock and every request is answered with a compact or full frame built from
+its state.  USB latency, a throughput cap, dropped frames, short reads,
+corrupt headers and hung reads can be dialed in to load test EDLink without a cartridge.
+
+Acknowledgements from ntcpycon.edwindow switch it to the windowed push
+protocol: compact frames are kept as they are drawn and pushed to the
+host within the window, and drop_rate then loses frames in transit so the
+host has to ask for them again.
+"""
+from __future__ import annotations
+
+import collections
+import logging
+import random
+import threading
+import time
+
+import ntcpycon.edlink
+import ntcpycon.edwindow
+import ntcpycon.gymmem
+
+CompactOptions = ntcpycon.edlink.CompactOptions
+Options = ntcpycon.edlink.Options
+BLANK_TILE = ntcpycon.gymmem.BLANK_TILE
+NTSC_FRAME_RATE = ntcpycon.gymmem.NTSC_FRAME_RATE
+ORIENTATION_TABLE = ntcpycon.gymmem.ORIENTATION_TABLE
+ORIENTATION_TO_ID = ntcpycon.gymmem.ORIENTATION_TO_ID
+PIECE_ORIENTATION_TO_TILE_ID = ntcpycon.gymmem.PIECE_ORIENTATION_TO_TILE_ID
+SPAWN_ORIENTATIONS = ntcpycon.gymmem.SPAWN_ORIENTATIONS
+ROTATIONS = ntcpycon.gymmem.ROTATIONS
+parse_ack = ntcpycon.edwindow.parse_ack
+BACKLOG_INDEX = ntcpycon.edwindow.BACKLOG_INDEX
+START = ntcpycon.edwindow.START
+STOP = ntcpycon.edwindow.STOP
+RETRANSMIT = ntcpycon.edwindow.RETRANSMIT
+
+logger = logging.getLogger(__name__)
+logger.addHandler(logging.NullHandler())
+
+MESSAGE_HEADER = 0xA55A
+MESSAGE_FOOTER = 0xFFFF ^ MESSAGE_HEADER
+FULL_FOOTER = b"\xaa\xaa"
+
+HIDDEN_PIECE = 0x13
+
+# frames per row by level
+GRAVITY = [48, 43, 38, 33, 28, 23, 18, 13, 8, 6, 5, 5, 5, 4, 4, 4, 3, 3, 3]
+GRAVITY += [2] * 10
+
+LINE_SCORES = [0, 40, 100, 300, 1200]
+
+START_LEVELS = [0, 9, 12, 15, 18, 19]
+
+# frames between horizontal shifts
+SHIFT_FRAMES = 6
+
+# frames spent on the game over and menu screens
+GAME_OVER_FRAMES = 120
+MENU_FRAMES = 120
+
+# gameState (the NES gameMode) in the level menu and during a game
+MENU_GAME_STATE = 3
+PLAY_GAME_STATE = 4
+
+# pushed frames the simulated game keeps for retransmits
+PUSH_HISTORY = 64
+
+# longest a read waits for a pushed frame before returning nothing
+PUSH_WAIT = 0.5
+
+
+def hybrid_bcd(value: int) -> tuple[int, int]:
+    """
+    Inverse of GymMemory._hybrid_bcd_convert.  Returns (hi, lo)
+    """
+    value %= 10000
+    hundreds, rest = divmod(value, 100)
+    return hundreds, (rest // 10) << 4 | rest % 10
+
+
+class SimulatedGame:
+    """
+    Just enough Tetris to produce realistic ed2ntc frames: pieces fall at
+    level speed, shift towards the lowest landing spot, lock, clear lines
+    with the row_y animation, score, level up and top out.
+    """
+
+    def __init__(self, rng: random.Random):
+        self.rng = rng
+        self.frame_counter = 0
+        self.game_start = 0
+        self.game_state = MENU_GAME_STATE
+        self.game_mode_state = 0
+        self.playstate = 0
+        self.timer = 0
+        self.active_frames = 0
+        self.playfield = bytearray([BLANK_TILE] * 200)
+        self.level = 0
+        self.lines = 0
+        self.score = 0
+        self.stats = [0] * 7
+        self.current_piece = HIDDEN_PIECE
+        self.next_piece = rng.choice(SPAWN_ORIENTATIONS)
+        self.tetrimino_x = 5
+        self.tetrimino_y = 0
+        self.autorepeat_x = 0
+        self.target = (self.next_piece, 5)
+        self.row_y = 0
+        self.completed_rows = [0, 0, 0, 0]
+
+    def collides(self, orientation: int, x: int, y: int) -> bool:
+        for x_offset, y_offset in ORIENTATION_TABLE[orientation]:
+            column = x + x_offset
+            row = y + y_offset
+            if column < 0 or column > 9 or row > 19:
+                return True
+            if row >= 0 and self.playfield[row * 10 + column] != BLANK_TILE:
+                return True
+        return False
+
+    def landing(self, orientation: int, x: int) -> int:
+        y = 0
+        while not self.collides(orientation, x, y + 1):
+            y += 1
+        return y
+
+    def new_game(self):
+        self.playfield[:] = bytes([BLANK_TILE] * 200)
+        self.level = self.rng.choice(START_LEVELS)
+        self.lines = 0
+        self.score = 0
+        self.stats = [0] * 7
+        self.game_start = 1
+        self.game_state = PLAY_GAME_STATE
+        self.game_mode_state = 4
+        self.spawn()
+
+    def spawn(self):
+        self.current_piece = self.next_piece
+        self.next_piece = self.rng.choice(SPAWN_ORIENTATIONS)
+        self.tetrimino_x = 5
+        self.tetrimino_y = 0
+        self.timer = 0
+        self.active_frames = 0
+        self.stats[ORIENTATION_TO_ID[self.current_piece]] += 1
+        if self.collides(self.current_piece, 5, 0):
+            self.playstate = 10
+            return
+        # aim for the lowest landing spot, ties broken at random
+        options = []
+        for orientation in ROTATIONS[self.current_piece]:
+            for x in range(10):
+                if self.collides(orientation, x, 0):
+                    continue
+                options.append(
+                    (self.landing(orientation, x), self.rng.random(), orientation, x)
+                )
+        _, _, orientation, x = max(options, default=(0, 0, self.current_piece, 5))
+        self.target = (orientation, x)
+        self.playstate = 1
+
+    def lock(self):
+        tile = PIECE_ORIENTATION_TO_TILE_ID[self.current_piece]
+        for x_offset, y_offset in ORIENTATION_TABLE[self.current_piece]:
+            row = self.tetrimino_y + y_offset
+            if row >= 0:
+                self.playfield[row * 10 + self.tetrimino_x + x_offset] = tile
+        self.current_piece = HIDDEN_PIECE
+
+    def full_rows(self) -> list[int]:
+        return [
+            row
+            for row in range(20)
+            if BLANK_TILE not in self.playfield[row * 10 : row * 10 + 10]
+        ]
+
+    def step_active(self):
+        orientation, x = self.target
+        self.active_frames += 1
+        shift = not self.active_frames % SHIFT_FRAMES
+        if self.current_piece != orientation and shift:
+            if not self.collides(orientation, self.tetrimino_x, self.tetrimino_y):
+                self.current_piece = orientation
+        if self.tetrimino_x != x:
+            self.autorepeat_x = min(16, self.autorepeat_x + 1)
+            if shift:
+                step = 1 if x > self.tetrimino_x else -1
+                if not self.collides(
+                    self.current_piece,
+                    self.tetrimino_x + step,
+                    self.tetrimino_y,
+                ):
+                    self.tetrimino_x += step
+        else:
+            self.autorepeat_x = 0
+        if self.timer >= GRAVITY[min(self.level, len(GRAVITY) - 1)]:
+            self.timer = 0
+            if self.collides(
+                self.current_piece, self.tetrimino_x, self.tetrimino_y + 1
+            ):
+                self.playstate = 2
+            else:
+                self.tetrimino_y += 1
+
+    def step(self):
+        """
+        Advance one NES frame
+        """
+        self.frame_counter = (self.frame_counter + 1) & 0xFFFF
+        self.timer += 1
+        if self.playstate == 1:
+            self.step_active()
+        elif self.playstate == 2:
+            self.lock()
+            self.playstate = 3
+        elif self.playstate == 3:
+            rows = self.full_rows()
+            self.completed_rows = (rows + [0, 0, 0, 0])[:4]
+            self.row_y = 0
+            self.playstate = 4 if rows else 5
+        elif self.playstate == 4:
+            if not self.frame_counter & 3:
+                self.row_y += 1
+            if self.row_y > 4:
+                self.clear_rows()
+                self.playstate = 5
+        elif self.playstate == 5:
+            self.playstate = 8
+        elif self.playstate == 8:
+            self.spawn()
+        elif self.playstate == 10:
+            if self.timer >= GAME_OVER_FRAMES:
+                self.playstate = 0
+                self.game_start = 0
+                self.game_state = MENU_GAME_STATE
+                self.game_mode_state = 0
+                self.timer = 0
+        elif self.timer >= MENU_FRAMES:
+            self.new_game()
+
+    def clear_rows(self):
+        rows = [row for row in self.completed_rows if row]
+        for row in rows:
+            del self.playfield[row * 10 : row * 10 + 10]
+            self.playfield[0:0] = bytes([BLANK_TILE] * 10)
+        self.score = min(999999, self.score + LINE_SCORES[len(rows)] * (self.level + 1))
+        self.lines += len(rows)
+        if self.lines >= (self.level + 1) * 10:
+            self.level += 1
+        self.completed_rows = [0, 0, 0, 0]
+
+    def stats_bytes(self) -> bytes:
+        result = bytearray()
+        for count in self.stats:
+            hi, lo = hybrid_bcd(count)
+            result.extend((lo, hi))
+        return bytes(result)
+
+    def compact_frame(self) -> bytes:
+        frame = bytearray(CompactOptions.SIZE)
+        frame[0:2] = MESSAGE_HEADER.to_bytes(2, "little")
+        frame[2:4] = self.frame_counter.to_bytes(2, "little")
+        frame[4] = self.game_mode_state
+        frame[5] = self.playstate
+        frame[6] = self.game_start
+        frame[7] = self.game_state
+        # data and playfield chunks take turns
+        frame[8] = self.frame_counter & 1
+        if frame[8]:
+            vram_row = (self.frame_counter >> 1) % 5 * 4
+            frame[9] = vram_row
+            frame[10:50] = self.playfield[vram_row * 10 : vram_row * 10 + 40]
+        else:
+            lines_hi, lines_lo = hybrid_bcd(self.lines)
+            frame[9] = self.row_y
+            frame[10:14] = bytes(self.completed_rows)
+            frame[14] = lines_lo
+            frame[15] = lines_hi
+            frame[16] = self.level
+            frame[17:21] = self.score.to_bytes(4, "little")
+            frame[21] = self.next_piece
+            frame[22] = self.current_piece
+            frame[23] = self.tetrimino_x
+            frame[24] = self.tetrimino_y
+            frame[25] = self.autorepeat_x
+            frame[26:40] = self.stats_bytes()
+        frame[62:64] = MESSAGE_FOOTER.to_bytes(2, "little")
+        return bytes(frame)
+
+    def full_frame(self) -> bytes:
+        frame = bytearray(Options.SIZE)
+        lines_hi, lines_lo = hybrid_bcd(self.lines)
+        frame[0] = (self.game_start << 4) | self.game_state
+        frame[1] = (self.game_mode_state << 4) | self.playstate
+        frame[2] = self.row_y
+        frame[3:7] = bytes(self.completed_rows)
+        frame[7] = lines_lo
+        frame[8] = lines_hi
+        frame[9] = self.level
+        frame[10:14] = self.score.to_bytes(4, "little")
+        frame[14] = self.next_piece
+        frame[15] = self.current_piece
+        frame[16] = self.tetrimino_x
+        frame[17] = self.tetrimino_y
+        frame[18:20] = self.frame_counter.to_bytes(2, "little")
+        frame[20] = self.autorepeat_x
+        frame[21:35] = self.stats_bytes()
+        frame[35:235] = self.playfield
+        frame[235:237] = FULL_FOOTER
+        return bytes(frame)
+
+
+class SimulatedEverdrive:
+    """
+    Stands in for edlinkn8.Everdrive.  Rates are probabilities per
+    receive_data call, latency is in seconds and throughput in bytes/second.
+    """
+
+    def __init__(
+        self,
+        latency: float = 0.0,
+        throughput: float | None = None,
+        drop_rate: float = 0.0,
+        short_read_rate: float = 0.0,
+        corrupt_rate: float = 0.0,
+        hang_rate: float = 0.0,
+        hang_time: float = 5.0,
+        seed: int | None = None,
+    ):
+        self.latency = latency
+        self.throughput = throughput
+        self.drop_rate = drop_rate
+        self.short_read_rate = short_read_rate
+        self.corrupt_rate = corrupt_rate
+        self.hang_rate = hang_rate
+        self.hang_time = hang_time
+        self.seed = seed
+        self.rng = random.Random(seed)
+        self.game = SimulatedGame(self.rng)
+        self.request: int | None = None
+        self.frame_offset = 0
+        self.start = time.monotonic()
+        self.requests = 0
+        self.writes = 0
+        self.dropped = 0
+        self.short_reads = 0
+        self.corrupted = 0
+        self.hangs = 0
+        self.push = False
+        self.window = 0
+        self.acked = 0
+        self.next_push = 0
+        self.history: collections.OrderedDict[int, bytes] = collections.OrderedDict()
+        self.retransmits = 0
+        self._closed = threading.Event()
+
+    def __repr__(self):
+        latency = self.latency
+        throughput = self.throughput
+        drop_rate = self.drop_rate
+        short_read_rate = self.short_read_rate
+        corrupt_rate = self.corrupt_rate
+        hang_rate = self.hang_rate
+        return f"{type(self).__name__}({latency=}, {throughput=}, {drop_rate=}, {short_read_rate=}, {corrupt_rate=}, {hang_rate=})"
+
+    def load_game(self, rom):
+        logger.info("Simulated Everdrive ignoring load_game")
+
+    def close(self):
+        """
+        Makes a hung read fail, as closing the port does for a cartridge.
+        The simulation carries on for the next request
+        """
+        self._closed.set()
+
+    def write_fifo(self, data: bytes):
+        self.writes += 1
+        if (ack := parse_ack(bytes(data))) is not None:
+            self.acknowledge(*ack)
+            return
+        self.request = data[0] if data else None
+
+    def acknowledge(self, received: int, expected: int, window: int, flags: int):
+        if flags & STOP:
+            self.push = False
+            return
+        if flags & START:
+            self.advance()
+            self.push = True
+            self.history.clear()
+            self.next_push = (self.game.frame_counter + 1) & 0xFFFF
+            self.acked = self.next_push
+            self.window = window
+            return
+        self.acked = expected
+        self.window = window
+        if flags & RETRANSMIT and expected in self.history:
+            self.retransmits += 1
+            self.next_push = expected
+
+    def advance(self):
+        target = int((time.monotonic() - self.start) * NTSC_FRAME_RATE)
+        target += self.frame_offset
+        while self.game.frame_counter != target & 0xFFFF:
+            self.game.step()
+            if self.push:
+                self.history[self.game.frame_counter] = self.game.compact_frame()
+                if len(self.history) > PUSH_HISTORY:
+                    self.history.popitem(last=False)
+
+    def sendable(self) -> int:
+        """
+        Frames drawn but not pushed yet that the window allows
+        """
+        behind = (self.game.frame_counter - self.next_push) & 0xFFFF < 0x8000
+        if behind and self.next_push not in self.history and self.history:
+            # fell out of the history, carry on from the oldest kept
+            self.next_push = next(iter(self.history))
+        queued = (self.game.frame_counter - self.next_push + 1) & 0xFFFF
+        in_flight = (self.next_push - self.acked) & 0xFFFF
+        return max(0, min(queued, self.window - in_flight))
+
+    def pushed_frames(self, size: int) -> bytes:
+        deadline = time.monotonic() + PUSH_WAIT
+        self.advance()
+        while not self.sendable():
+            if time.monotonic() >= deadline:
+                return b""
+            time.sleep(1 / NTSC_FRAME_RATE / 8)
+            self.advance()
+        frames = []
+        while len(frames) < size // CompactOptions.SIZE and self.sendable():
+            frame = self.history[self.next_push]
+            self.next_push = (self.next_push + 1) & 0xFFFF
+            if self.drop_rate and self.rng.random() < self.drop_rate:
+                self.dropped += 1
+                continue
+            frame = bytearray(frame)
+            frame[BACKLOG_INDEX] = min(self.sendable(), 0xFF)
+            frames.append(bytes(frame))
+        return b"".join(frames)
+
+    def receive_data(self, size: int) -> bytes:
+        self.requests += 1
+        delay = self.latency
+        if self.throughput:
+            delay += size / self.throughput
+        if self.hang_rate and self.rng.random() < self.hang_rate:
+            self.hangs += 1
+            delay += self.hang_time
+        if delay:
+            self._closed.clear()
+            if self._closed.wait(delay):
+                raise OSError("Simulated Everdrive closed during a read")
+
+        if self.push:
+            if not (frame := self.pushed_frames(size)):
+                return b""
+        else:
+            if self.drop_rate and self.rng.random() < self.drop_rate:
+                # the response for this frame never arrives, the next one does
+                self.dropped += 1
+                self.frame_offset += 1
+            self.advance()
+
+            if self.request == CompactOptions.REQUEST:
+                frame = self.game.compact_frame()
+            elif self.request == Options.REQUEST:
+                frame = self.game.full_frame()
+            else:
+                logger.warning(
+                    f"Simulated Everdrive got unknown request {self.request}"
+                )
+                return b""
+            self.request = None
+
+        if self.corrupt_rate and self.rng.random() < self.corrupt_rate:
+            self.corrupted += 1
+            frame = (
+                bytes([self.rng.randrange(256), self.rng.randrange(256)]) + frame[2:]
+            )
+        if self.short_read_rate and self.rng.random() < self.short_read_rate:
+            self.short_reads += 1
+            frame = frame[: self.rng.randrange(1, len(frame))]
+        return frame[:size]
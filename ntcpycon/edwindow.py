@@ -0,0 +1,213 @@
+"""
+Host side of the windowed push protocol between TetrisGYM (ed2ntc) and
+EDLink.
+
+Instead of answering one request per frame, the game pushes every compact
+frame as soon as it is drawn.  It may have up to `window` frames out that
+the host hasn't acknowledged; after that it holds new frames until an
+acknowledgement arrives.  Byte BACKLOG_INDEX of each pushed frame (padding
+in both compact frame types) says how many more frames are queued behind
+it, so a backlog is drained in one read.
+
+The host acknowledges every `ack_every` frames with a 16 byte to_game
+message:
+
+2   header 0xA55A (little endian)
+1   frames received since the last acknowledgement
+2   frame counter the host expects next (little endian)
+1   window
+1   flags: START enters push mode, STOP leaves it, RETRANSMIT resends
+    everything from the expected frame counter
+7   future
+2   trailer xor header = 0xFFFF
+
+Gaps are recovered go-back-N style: frames after a gap are discarded and
+a RETRANSMIT acknowledgement makes the game rewind to the missing frame.
+If the game no longer holds it, the frames are counted as lost after
+RETRANSMIT_PATIENCE windows and the stream carries on from where it is.
+"""
+from __future__ import annotations
+
+import collections
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+logger.addHandler(logging.NullHandler())
+
+MESSAGE_HEADER = 0xA55A
+MESSAGE_FOOTER = 0xFFFF ^ MESSAGE_HEADER
+
+ACK_SIZE = 16
+
+START = 0x01
+STOP = 0x02
+RETRANSMIT = 0x04
+
+WINDOW = 8
+
+ACK_EVERY = 4
+
+# frames queued behind this one, in the padding of a compact frame
+BACKLOG_INDEX = 61
+
+# frame counter in a compact frame
+FC_LOC = slice(2, 4)
+
+# windows of out of order frames to wait through for a retransmit
+RETRANSMIT_PATIENCE = 2
+
+REPORT_INTERVAL = 30
+
+
+def ack_message(received: int, expected: int, window: int, flags: int = 0) -> bytes:
+    message = bytearray(ACK_SIZE)
+    message[0:2] = MESSAGE_HEADER.to_bytes(2, "little")
+    message[2] = min(received, 0xFF)
+    message[3:5] = (expected & 0xFFFF).to_bytes(2, "little")
+    message[5] = window
+    message[6] = flags
+    message[14:16] = MESSAGE_FOOTER.to_bytes(2, "little")
+    return bytes(message)
+
+
+def parse_ack(message: bytes) -> tuple[int, int, int, int] | None:
+    """
+    (received, expected, window, flags), or None if it isn't an ack
+    """
+    if len(message) != ACK_SIZE:
+        return None
+    header = int.from_bytes(message[0:2], "little")
+    footer = int.from_bytes(message[14:16], "little")
+    if header != MESSAGE_HEADER or header ^ footer != 0xFFFF:
+        return None
+    expected = int.from_bytes(message[3:5], "little")
+    return message[2], expected, message[5], message[6]
+
+
+def backlog(frame: bytes) -> int:
+    return frame[BACKLOG_INDEX]
+
+
+class WindowedLink:
+    """
+    Sequencing, acknowledgements and counters for one pushed stream.
+    Frames go through accept() in arrival order; only the ones it returns
+    True for are new and in order
+    """
+
+    def __init__(
+        self,
+        window: int = WINDOW,
+        ack_every: int = ACK_EVERY,
+        counters: collections.Counter[str] | None = None,
+    ):
+        if not 1 <= window <= 0xFF:
+            raise ValueError("window must be between 1 and 255")
+        self.window = window
+        self.ack_every = max(1, min(ack_every, window))
+        self.counters = counters if counters is not None else collections.Counter()
+        self.reset()
+
+    def __repr__(self):
+        window = self.window
+        ack_every = self.ack_every
+        return f"{type(self).__name__}({window=}, {ack_every=})"
+
+    def reset(self):
+        """
+        Forget the stream, e.g. after the device link was reopened
+        """
+        self.expected: int | None = None
+        self.unacked = 0
+        self.started = False
+        self.retransmit_pending = False
+        self.ack_pending = False
+        self._waiting = 0
+        self._report_at = time.monotonic() + REPORT_INTERVAL
+
+    def message(self) -> bytes | None:
+        """
+        The to_game message due before the next read, if any
+        """
+        if not self.started:
+            self.started = True
+            self.counters["window_starts"] += 1
+            return ack_message(0, self.expected or 0, self.window, START)
+        if self.retransmit_pending:
+            self.retransmit_pending = False
+            self.counters["retransmit_requests"] += 1
+            return self._ack(RETRANSMIT)
+        if self.unacked >= self.ack_every or self.ack_pending:
+            return self._ack()
+        return None
+
+    def stalled(self):
+        """
+        Nothing arrived.  The last acknowledgement may have been lost with
+        the game waiting on it, so send another
+        """
+        if self.started:
+            self.ack_pending = True
+
+    def stop_message(self) -> bytes:
+        return ack_message(self.unacked, self.expected or 0, self.window, STOP)
+
+    def _ack(self, flags: int = 0) -> bytes:
+        message = ack_message(self.unacked, self.expected, self.window, flags)
+        self.counters["acks"] += 1
+        self.unacked = 0
+        self.ack_pending = False
+        return message
+
+    def accept(self, frame: bytes) -> bool:
+        fc = int.from_bytes(frame[FC_LOC], "little")
+        self.counters["pushed_frames"] += 1
+        if self.expected is None:
+            self.expected = fc
+        ahead = (fc - self.expected) & 0xFFFF
+        if ahead == 0:
+            self._advance()
+            return True
+        if ahead >= 0x8000:
+            # already had it, e.g. sent again after a retransmit
+            self.counters["duplicates"] += 1
+            return False
+        # gap in front of this frame.  Ask again if a retransmit was lost too
+        if self._waiting % self.window == 0:
+            self.retransmit_pending = True
+        self._waiting += 1
+        if self._waiting <= RETRANSMIT_PATIENCE * self.window:
+            self.counters["out_of_order"] += 1
+            return False
+        logger.warning(f"Frames {self.expected} to {(fc - 1) & 0xFFFF} lost")
+        self.counters["lost_frames"] += ahead
+        self.expected = fc
+        self._waiting = 0
+        self.retransmit_pending = False
+        self._advance()
+        return True
+
+    def _advance(self):
+        if self._waiting:
+            self.counters["recovered_gaps"] += 1
+            self._waiting = 0
+            self.retransmit_pending = False
+        self.expected = (self.expected + 1) & 0xFFFF
+        self.unacked += 1
+
+    def maybe_report(self):
+        if (now := time.monotonic()) < self._report_at:
+            return
+        self._report_at = now + REPORT_INTERVAL
+        self.report()
+
+    def report(self):
+        pushed = self.counters["pushed_frames"]
+        reads = self.counters["window_reads"]
+        logger.info(
+            f"Windowed link: {pushed} frames in {reads} reads, "
+            f"{self.counters['acks']} acks, "
+            f"{self.counters['retransmit_requests']} retransmits, "
+            f"{self.counters['lost_frames']} lost"
+        )
@@ -2,8 +2,11 @@ import asyncio
 import gzip
 import itertools
 import logging
+import os
 import sys
+import typing
 import ntcpycon.abstract
+import ntcpycon.gzip_members
 
 WRITE_WAIT_LOOPS = 500
 
@@ -12,6 +15,9 @@ logger.addHandler(logging.NullHandler())
 
 Receiver = ntcpycon.abstract.Receiver
 Sender = ntcpycon.abstract.Sender
+iter_archive = ntcpycon.gzip_members.iter_archive
+record_member = ntcpycon.gzip_members.record_member
+MEMBERS_SUFFIX = ntcpycon.gzip_members.MEMBERS_SUFFIX
 
 FRAME_SIZE_BY_VERSION = {
     1: 71,
@@ -20,6 +26,38 @@ FRAME_SIZE_BY_VERSION = {
 }
 
 
+def iter_frames(filename: str, workers: int | None = None) -> typing.Iterator[bytes]:
+    """
+    Every frame in a FileWriter archive.  Members are decompressed in
+    parallel unless workers is 1
+    """
+    yield from split_frames(iter_archive(filename, workers), filename)
+
+
+def split_frames(
+    chunks: typing.Iterable[bytes], filename: str
+) -> typing.Iterator[bytes]:
+    data = b""
+    for chunk in chunks:
+        data = data + chunk if data else chunk
+        offset = 0
+        while offset < len(data):
+            version = data[offset] >> 5
+            if version not in FRAME_SIZE_BY_VERSION:
+                raise ValueError(
+                    f"Invalid version in byte: {version} from {data[offset:offset + 1].hex()}"
+                )
+            length = FRAME_SIZE_BY_VERSION[version]
+            if offset + length > len(data):
+                break
+            yield data[offset : offset + length]
+            offset += length
+        # a frame split across members
+        data = data[offset:]
+    if data:
+        logger.warning(f"Truncated frame at end of {filename}")
+
+
 class FileReceiver(Receiver):
     def __init__(
         self,
@@ -39,24 +77,18 @@ class FileReceiver(Receiver):
         return f"{type(self).__name__}({queues=}, {filename=})"
 
     async def receive(self):
-        with gzip.GzipFile(
-            self.filename,
-            "rb",
-        ) as gzfile:
-            logger.info(f"Opening {self.filename}")
-            while True:
-                first = gzfile.read(1)
-                if not first:
-                    logger.info("End of file reached")
-                    break
-                version = int.from_bytes(first, "big") >> 5
-                if version not in FRAME_SIZE_BY_VERSION.keys():
-                    raise Exception (f"Invalid version in byte: {version} from {first.hex()}")
-                length = FRAME_SIZE_BY_VERSION[version]
-                payload = bytearray(first)
-                payload.extend(gzfile.read(length-1))
+        logger.info(f"Opening {self.filename}")
+        loop = asyncio.get_running_loop()
+        # members are inflated off the loop and replayed as soon as each is
+        # ready, about one member's worth of frames at a time
+        frames = iter_frames(self.filename)
+        while batch := await loop.run_in_executor(
+            None, list, itertools.islice(frames, WRITE_WAIT_LOOPS)
+        ):
+            for payload in batch:
                 for queue in self.queues:
-                    await queue.put(bytes(payload))
+                    await queue.put(payload)
+        logger.info("End of file reached")
 
 
 class FileWriter(Sender):
@@ -83,6 +115,7 @@ class FileWriter(Sender):
 
         # Blank out the file or establish it
         open(self.filename, "wb")
+        open(self.filename + MEMBERS_SUFFIX, "wb")
 
     def __repr__(self):
         filename = self.filename
@@ -94,6 +127,8 @@ class FileWriter(Sender):
         if not length:
             logger.warning("Unable to write empty buffer")
             return
+        # every write is a new gzip member; note where it starts
+        record_member(self.filename, os.path.getsize(self.filename))
         with gzip.GzipFile(self.filename, "ab") as gzfile:
             gzfile.write(self.buffer)
         logger.info(f"Successfully wrote {length} bytes to {self.filename}")
@@ -108,6 +143,7 @@ class FileWriter(Sender):
                     logger.info(f"Empty message received.  Breaking")
                     break
                 self.buffer += msg
+                self.delivered()
                 if not next(ticker):
                     self.write_buffer()
         finally:
@@ -0,0 +1,344 @@
+"""
+Uncompressed, fixed record frame store.
+
+<name> holds version 3 frames back to back, so frame N is at N * 73.
+<name>.idx is a side index of game boundaries, one record per game:
+
+4   first frame of the game (little endian)
+2   game id (little endian)
+
+Readers mmap the store and hand out zero copy memoryview slices.  The index
+is rebuilt from the frames if it is missing or behind, e.g. after a crash.
+FrameStoreWriter appends to an existing store, dropping a partly written
+last frame first.
+"""
+from __future__ import annotations
+
+import asyncio
+import logging
+import mmap
+import os
+import struct
+import sys
+import typing
+
+import ntcpycon.abstract
+import ntcpycon.binaryframe
+import ntcpycon.file_handler
+
+Receiver = ntcpycon.abstract.Receiver
+Sender = ntcpycon.abstract.Sender
+BinaryFrame3 = ntcpycon.binaryframe.BinaryFrame3
+
+logger = logging.getLogger(__name__)
+logger.addHandler(logging.NullHandler())
+
+FRAME_SIZE = ntcpycon.file_handler.FRAME_SIZE_BY_VERSION[BinaryFrame3.VERSION]
+
+# conventional extension, e.g. for analytics to find stores
+SUFFIX = ".frames"
+
+INDEX_SUFFIX = ".idx"
+
+INDEX_RECORD = struct.Struct("<IH")
+
+# frames written before flushing when the queue never runs dry
+FLUSH_FRAMES = 60
+
+
+class Game(typing.NamedTuple):
+    game_id: int
+    start: int
+    stop: int
+
+
+def game_id_of(frame: bytes | memoryview) -> int:
+    return (frame[1] << 8) | frame[2]
+
+
+class FrameStore:
+    """
+    Random access to a store written by FrameStoreWriter.  Call refresh()
+    to pick up frames appended since it was opened
+    """
+
+    def __init__(self, filename: str):
+        self.filename = filename
+        self.file = open(filename, "rb")
+        self.mmap: mmap.mmap | None = None
+        self.view = memoryview(b"")
+        # mappings replaced while slices of them were still in use
+        self._retired: list[mmap.mmap] = []
+        self.frames = 0
+        self._starts: list[tuple[int, int]] = []
+        self.refresh()
+
+    def __repr__(self):
+        filename = self.filename
+        frames = self.frames
+        return f"{type(self).__name__}({filename=}, {frames=})"
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __len__(self) -> int:
+        return self.frames
+
+    def __getitem__(self, index: int | slice) -> memoryview:
+        """
+        One frame, or a run of frames as a single contiguous view
+        """
+        if isinstance(index, slice):
+            start, stop, step = index.indices(self.frames)
+            if step != 1:
+                raise ValueError("FrameStore slices must be contiguous")
+            return self.view[start * FRAME_SIZE : max(start, stop) * FRAME_SIZE]
+        if index < 0:
+            index += self.frames
+        if not 0 <= index < self.frames:
+            raise IndexError(f"frame {index} out of range")
+        return self.view[index * FRAME_SIZE : (index + 1) * FRAME_SIZE]
+
+    def __iter__(self) -> typing.Iterator[memoryview]:
+        view = self.view
+        for offset in range(0, self.frames * FRAME_SIZE, FRAME_SIZE):
+            yield view[offset : offset + FRAME_SIZE]
+
+    def refresh(self):
+        size = os.fstat(self.file.fileno()).st_size
+        frames = size // FRAME_SIZE
+        if frames == self.frames and self.mmap is not None:
+            return
+        self._unmap()
+        if frames:
+            self.mmap = mmap.mmap(
+                self.file.fileno(), frames * FRAME_SIZE, access=mmap.ACCESS_READ
+            )
+            self.view = memoryview(self.mmap)
+        self.frames = frames
+        self._load_index()
+
+    def _load_index(self):
+        starts = []
+        try:
+            with open(self.filename + INDEX_SUFFIX, "rb") as file:
+                data = file.read()
+            usable = len(data) - len(data) % INDEX_RECORD.size
+            starts = [
+                (start, game_id)
+                for start, game_id in INDEX_RECORD.iter_unpack(data[:usable])
+                if start < self.frames
+            ]
+        except OSError:
+            pass
+        if self.frames and not starts:
+            starts = self._scan(0, None)
+        elif starts:
+            # the writer may not have flushed the index yet
+            last_start, last_id = starts[-1]
+            starts.extend(self._scan(last_start, last_id))
+        self._starts = starts
+
+    def _scan(self, start: int, game_id: int | None) -> list[tuple[int, int]]:
+        """
+        Game boundaries from frame `start` on, read from the frames themselves
+        """
+        begin = start * FRAME_SIZE
+        end = self.frames * FRAME_SIZE
+        high = self.mmap[begin + 1 : end : FRAME_SIZE]
+        low = self.mmap[begin + 2 : end : FRAME_SIZE]
+        starts = []
+        for offset, (hi, lo) in enumerate(zip(high, low)):
+            if (current := (hi << 8) | lo) != game_id:
+                starts.append((start + offset, current))
+                game_id = current
+        return starts
+
+    @property
+    def games(self) -> list[Game]:
+        games = []
+        for index, (start, game_id) in enumerate(self._starts):
+            if index + 1 < len(self._starts):
+                stop = self._starts[index + 1][0]
+            else:
+                stop = self.frames
+            games.append(Game(game_id, start, stop))
+        return games
+
+    def game(self, index: int) -> memoryview:
+        """
+        All frames of one game, by position in games (negative counts back)
+        """
+        game = self.games[index]
+        return self[game.start : game.stop]
+
+    def _unmap(self):
+        if self.mmap is not None:
+            self._retired.append(self.mmap)
+        try:
+            self.view.release()
+        except BufferError:
+            # exported directly, e.g. to numpy.  Goes with the mapping
+            pass
+        self.view = memoryview(b"")
+        self.mmap = None
+        self._close_retired()
+
+    def _close_retired(self):
+        """
+        Closes old mappings no slice refers to any more
+        """
+        in_use = []
+        for old in self._retired:
+            try:
+                old.close()
+            except BufferError:
+                in_use.append(old)
+        if in_use:
+            logger.debug(
+                f"{len(in_use)} old mappings of {self.filename} held by slices"
+            )
+        self._retired = in_use
+
+    def close(self):
+        self._unmap()
+        if self._retired:
+            logger.warning(
+                f"{len(self._retired)} mappings of {self.filename} stay open "
+                "until the slices handed out from them are released"
+            )
+        self.file.close()
+
+
+class FrameStoreWriter(Sender):
+    def __init__(
+        self,
+        filename: str,
+        overwrite: bool = False,
+    ):
+        self.filename = filename
+        self.overwrite = overwrite
+        self.queue = asyncio.Queue()
+        self.frames = 0
+        self.skipped = 0
+        self._game_id: int | None = None
+
+        if overwrite or not os.path.exists(filename):
+            self.file = open(filename, "wb")
+            self.index = open(filename + INDEX_SUFFIX, "wb")
+        else:
+            self.resume()
+
+    def resume(self):
+        """
+        Carries on after the frames already stored, with a fresh index
+        """
+        with open(self.filename, "r+b") as file:
+            first = file.read(1)
+            if first and first[0] >> 5 != BinaryFrame3.VERSION:
+                sys.exit(f"{self.filename} isn't a frame store")
+            size = os.fstat(file.fileno()).st_size
+            if size % FRAME_SIZE:
+                logger.warning(
+                    f"Dropping {size % FRAME_SIZE} bytes of a partial frame "
+                    f"at the end of {self.filename}"
+                )
+                file.truncate(size - size % FRAME_SIZE)
+        with FrameStore(self.filename) as store:
+            self.frames = len(store)
+            games = store.games
+        with open(self.filename + INDEX_SUFFIX, "wb") as index:
+            for game in games:
+                index.write(INDEX_RECORD.pack(game.start, game.game_id))
+        if games:
+            self._game_id = games[-1].game_id
+        self.file = open(self.filename, "ab")
+        self.index = open(self.filename + INDEX_SUFFIX, "ab")
+        logger.info(f"Appending to {self.filename} after {self.frames} frames")
+
+    def __repr__(self):
+        filename = self.filename
+        overwrite = self.overwrite
+        return f"{type(self).__name__}({filename=}, {overwrite=})"
+
+    def write(self, frame: bytes):
+        if len(frame) != FRAME_SIZE or frame[0] >> 5 != BinaryFrame3.VERSION:
+            self.skipped += 1
+            return
+        if (game_id := game_id_of(frame)) != self._game_id:
+            self.index.write(INDEX_RECORD.pack(self.frames, game_id))
+            self._game_id = game_id
+        self.file.write(frame)
+        self.frames += 1
+
+    def flush(self):
+        # frames first so a reader never sees an index past the data
+        self.file.flush()
+        self.index.flush()
+
+    async def send(self):
+        unflushed = 0
+        try:
+            while True:
+                msg = await self.queue.get()
+                if not msg:
+                    logger.info("Empty message received.  Breaking")
+                    break
+                self.write(msg)
+                self.delivered()
+                unflushed += 1
+                if self.queue.empty() or unflushed >= FLUSH_FRAMES:
+                    self.flush()
+                    unflushed = 0
+        finally:
+            self.flush()
+            self.file.close()
+            self.index.close()
+            if self.skipped:
+                logger.warning(f"Skipped {self.skipped} frames that weren't version 3")
+            logger.info(f"Stored {self.frames} frames in {self.filename}")
+
+
+class FrameStoreReceiver(Receiver):
+    """
+    Replays a frame store, optionally starting at a given game
+    """
+
+    def __init__(
+        self,
+        queues: list[asyncio.Queue],
+        filename: str,
+        game: int | None = None,
+    ):
+        self.queues = queues
+        self.filename = filename
+        self.game = game
+        try:
+            self.store = FrameStore(filename)
+        except OSError:
+            sys.exit(f"Unable to open {filename}")
+        if game is not None and not -len(self.store.games) <= game < len(
+            self.store.games
+        ):
+            sys.exit(f"{filename} has {len(self.store.games)} games")
+
+    def __repr__(self):
+        queues = self.queues
+        filename = self.filename
+        game = self.game
+        return f"{type(self).__name__}({queues=}, {filename=}, {game=})"
+
+    async def receive(self):
+        start = 0
+        if self.game is not None:
+            start = self.store.games[self.game].start
+        logger.info(f"Replaying {self.filename} from frame {start}")
+        with self.store:
+            for index in range(start, len(self.store)):
+                payload = bytes(self.store[index])
+                for queue in self.queues:
+                    await queue.put(payload)
+        logger.info("End of frame store reached")
@@ -69,6 +69,16 @@ RAM_TO_NTC_TILES[0xEF] = 0
 
 BLANK_TILE = 0xEF
 
+PLAYFIELD_ROWS = 20
+PLAYFIELD_WIDTH = 10
+PLAYFIELD_SIZE = PLAYFIELD_ROWS * PLAYFIELD_WIDTH
+CHUNK_ROWS = 4
+
+NTSC_FRAME_RATE = 60.0988
+
+# A bigger jump between two reads is a reset or a long stall, not lost frames
+FRAME_COUNTER_MAX_JUMP = 600
+
 ORIENTATION_TO_ID = [
     0,
     0,
@@ -137,6 +147,191 @@ ORIENTATION_TABLE = [
     [(-2, 0), (-1, 0), (0, 0), (1, 0)],  # I horizontal (spawn)
 ]
 
+# orientation ids pieces spawn in (T J Z O S L I), and the ones each rotates through
+SPAWN_ORIENTATIONS = [2, 7, 8, 10, 11, 14, 18]
+ROTATIONS = {
+    2: [0, 1, 2, 3],
+    7: [4, 5, 6, 7],
+    8: [8, 9],
+    10: [10],
+    11: [11, 12],
+    14: [13, 14, 15, 16],
+    18: [17, 18],
+}
+
+
+def piece_indexes(orientation: int, x: int, y: int) -> tuple[int, ...]:
+    indexes = []
+    for x_offset, y_offset in ORIENTATION_TABLE[orientation]:
+        index = (y + y_offset) * PLAYFIELD_WIDTH + x + x_offset
+        if 0 <= index < PLAYFIELD_SIZE:
+            indexes.append(index)
+    return tuple(indexes)
+
+
+# tetriminoX/tetriminoY outside of these fall back to piece_indexes
+OVERLAY_X_LIMIT = 16
+OVERLAY_Y_LIMIT = 24
+
+# PIECE_OVERLAY_INDEXES[orientation][y][x] -> playfield indexes to fill
+PIECE_OVERLAY_INDEXES = [
+    [
+        [piece_indexes(orientation, x, y) for x in range(OVERLAY_X_LIMIT)]
+        for y in range(OVERLAY_Y_LIMIT)
+    ]
+    for orientation in range(len(ORIENTATION_TABLE))
+]
+
+# The line clear animation blanks from the center out, one column each
+# side per step.  LINECLEAR_STEPS[row_y] -> (start, stop, blank tiles)
+LINECLEAR_STEPS = [
+    (4 - row_y, 6 + row_y, bytes([BLANK_TILE]) * (2 + 2 * row_y)) for row_y in range(5)
+]
+
+
+class FrameClock:
+    """
+    Derives elapsed milliseconds from the NES frame counter.
+
+    The 16 bit counter is unwrapped into a running frame total, so USB
+    polling jitter never reaches the timestamps.  When the counter goes
+    backwards or jumps more than FRAME_COUNTER_MAX_JUMP frames, the clock
+    re-anchors on time.monotonic() and keeps counting from there.  Elapsed
+    never decreases.
+    """
+
+    def __init__(self, rate: float = NTSC_FRAME_RATE):
+        self.rate = rate
+        self.resyncs = 0
+        self._start = time.monotonic()
+        self._anchor_ms = 0.0
+        self._frames = 0
+        self._last_frame_counter: int | None = None
+
+    def __repr__(self):
+        rate = self.rate
+        resyncs = self.resyncs
+        return f"{type(self).__name__}({rate=}, {resyncs=})"
+
+    def _reanchor(self):
+        now_ms = (time.monotonic() - self._start) * 1000
+        current_ms = self._anchor_ms + self._frames * 1000 / self.rate
+        self._anchor_ms = max(now_ms, current_ms)
+        self._frames = 0
+
+    def elapsed(self, frame_counter: int) -> int:
+        last = self._last_frame_counter
+        if last is None:
+            self._reanchor()
+        elif (delta := (frame_counter - last) & 0xFFFF) > FRAME_COUNTER_MAX_JUMP:
+            logger.info(f"Frame counter jumped {last} -> {frame_counter}.  Resyncing")
+            self.resyncs += 1
+            self._reanchor()
+        else:
+            self._frames += delta
+        self._last_frame_counter = frame_counter
+        return int(self._anchor_ms + self._frames * 1000 / self.rate)
+
+
+class MonotonicClock:
+    """
+    Host time since the first update.  Ignores the frame counter
+    """
+
+    def __init__(self):
+        self._start: float | None = None
+
+    def __repr__(self):
+        return f"{type(self).__name__}()"
+
+    def elapsed(self, frame_counter: int) -> int:
+        now = time.monotonic()
+        if self._start is None:
+            self._start = now
+        return int((now - self._start) * 1000)
+
+
+CLOCKS = {
+    "frame_counter": FrameClock,
+    "monotonic": MonotonicClock,
+}
+
+
+class PlayfieldAssembler:
+    """
+    Rebuilds the playfield from the 4 row chunks carried by compact frames.
+
+    Every row remembers the frame counter of the chunk that last wrote it.  A
+    playfield is only published when the chunk holding the last row arrives
+    and every row was written since the cycle began at vram row 0, with no
+    gap in the frame counter along the way.  Anything else is a torn field:
+    it is held back and the assembler is marked stale until the next
+    coherent cycle completes.
+    """
+
+    def __init__(self):
+        self.assembly = bytearray([BLANK_TILE] * PLAYFIELD_SIZE)
+        self.row_frame_counters = [-1] * PLAYFIELD_ROWS
+        self.cycle_start: int | None = None
+        self.last_frame_counter: int | None = None
+        self.torn = True
+        self.stale = False
+        self.published = 0
+        self.stale_count = 0
+
+    def __repr__(self):
+        published = self.published
+        stale_count = self.stale_count
+        return f"{type(self).__name__}({published=}, {stale_count=})"
+
+    def frame(self, frame_counter: int):
+        """
+        Called for every frame, chunk or not, to detect gaps in the counter
+        """
+        last = self.last_frame_counter
+        if last is not None and (frame_counter - last) & 0xFFFF > 1:
+            self.torn = True
+        self.last_frame_counter = frame_counter
+
+    def add_chunk(self, vram_row: int, chunk: bytes, frame_counter: int) -> bool:
+        """
+        Returns True when the chunk completes a coherent playfield
+        """
+        start = vram_row * PLAYFIELD_WIDTH
+        if start >= PLAYFIELD_SIZE:
+            return False
+        if not vram_row:
+            self.cycle_start = frame_counter
+            self.torn = False
+
+        end = min(start + CHUNK_ROWS * PLAYFIELD_WIDTH, PLAYFIELD_SIZE)
+        self.assembly[start:end] = chunk[: end - start]
+        last_row = end // PLAYFIELD_WIDTH
+        self.row_frame_counters[vram_row:last_row] = [frame_counter] * (
+            last_row - vram_row
+        )
+        if end < PLAYFIELD_SIZE:
+            return False
+
+        if self.coherent(frame_counter):
+            self.published += 1
+            self.stale = False
+            return True
+
+        self.stale_count += 1
+        self.stale = True
+        logger.debug(f"Holding back torn playfield at frame {frame_counter}")
+        return False
+
+    def coherent(self, frame_counter: int) -> bool:
+        if self.torn or self.cycle_start is None:
+            return False
+        cycle_age = (frame_counter - self.cycle_start) & 0xFFFF
+        for row_counter in self.row_frame_counters:
+            if row_counter < 0 or (frame_counter - row_counter) & 0xFFFF > cycle_age:
+                return False
+        return True
+
 
 @dataclasses.dataclass
 class GymMemory:
@@ -186,13 +381,19 @@ class GymMemory:
         default_factory=lambda: bytearray([BLANK_TILE] * 200)
     )
 
+    # rebuilds _playfield_buffer from compact frame chunks
+    _assembler: PlayfieldAssembler = dataclasses.field(
+        default_factory=PlayfieldAssembler
+    )
+
     _previous_state: dict = dataclasses.field(default_factory=dict)
 
     # derived:
-    _start_time: float = dataclasses.field(default_factory=lambda: time.time())
+    _clock: FrameClock | MonotonicClock = dataclasses.field(default_factory=FrameClock)
     elapsed: int = 0
     game_id: int = 0
     spawn_autorepeat_x: int = 0
+    playfield_stale: bool = False
 
     # unpacked:
     game_mode: int = 0
@@ -201,12 +402,10 @@ class GymMemory:
     playstate: int = 0
 
     def _general_update_start(self):
-        self.elapsed = int((time.time() - self._start_time) * 1000)
-        self._previous_state = {
-            k: v for k, v in dataclasses.asdict(self).items() if not k.startswith("_")
-        }
+        self._previous_state = {k: getattr(self, k) for k in STATE_FIELDS}
 
     def _general_update_finish_compact(self):
+        self.elapsed = self._clock.elapsed(self.frame_counter)
         if self.playstate == 8:
             self.spawn_autorepeat_x = self.autorepeat_x
 
@@ -218,6 +417,7 @@ class GymMemory:
         self.overlay_piece()
 
     def _general_update_finish(self):
+        self.elapsed = self._clock.elapsed(self.frame_counter)
         if self.playstate == 8:
             self.spawn_autorepeat_x = self.autorepeat_x
         if self.game_start != self._previous_state["game_start"]:
@@ -290,6 +490,7 @@ class GymMemory:
         self.stats_i_hi = edframe.stats[13]
 
         self._playfield_buffer[:] = edframe.playfield
+        self.playfield_stale = False
 
         self._general_update_finish()
 
@@ -304,13 +505,15 @@ class GymMemory:
         self.frame_counter_hi = edframe.frame_counter1
         self.frame_counter_lo = edframe.frame_counter0
 
+        self._assembler.frame(self.frame_counter)
         if edframe.frame_type:
-            for i, offset in enumerate(
-                range(edframe.vram_row * 10, edframe.vram_row * 10 + 40)
+            if self._assembler.add_chunk(
+                edframe.vram_row,
+                edframe.playfield_chunk,
+                self.frame_counter,
             ):
-                if offset >= 200:
-                    break
-                self._playfield_buffer[offset] = edframe.playfield_chunk[i]
+                self._playfield_buffer[:] = self._assembler.assembly
+            self.playfield_stale = self._assembler.stale
         else:
             self.row_y = edframe.row_y
             self.next_piece = edframe.next_piece
@@ -414,60 +617,44 @@ class GymMemory:
         return self._hybrid_bcd_convert(self.stats_i_hi, self.stats_i_lo)
 
     def overlay_piece(self):
-        if self.current_piece > 0x12:
-            logger.debug(f"Ignoring invisible orientation ID 0x13")
-            return
-        for x_offset, y_offset in ORIENTATION_TABLE[self.current_piece]:
-            index = (self.tetrimino_y + y_offset) * 10 + self.tetrimino_x + x_offset
-            if index >= 0 and index < 200:
-                self._playfield[index] = PIECE_ORIENTATION_TO_TILE_ID[
-                    self.current_piece
-                ]
-
-    def overlay_lineclear_compact(self):
-        ranges_by_row_y = {
-            0: (range(4, 5), range(5, 6)),
-            1: (range(3, 5), range(5, 7)),
-            2: (range(2, 5), range(5, 8)),
-            3: (range(1, 5), range(5, 9)),
-            4: (range(0, 5), range(5, 10)),
-        }
-        if self.playstate != 4:
+        piece = self.current_piece
+        if piece > 0x12:
+            logger.debug("Ignoring invisible orientation ID 0x13")
             return
+        x = self.tetrimino_x
+        y = self.tetrimino_y
+        if x < OVERLAY_X_LIMIT and y < OVERLAY_Y_LIMIT:
+            indexes = PIECE_OVERLAY_INDEXES[piece][y][x]
+        else:
+            indexes = piece_indexes(piece, x, y)
+        tile = PIECE_ORIENTATION_TO_TILE_ID[piece]
+        playfield = self._playfield
+        for index in indexes:
+            playfield[index] = tile
 
+    def _blank_completed_rows(self, playfield: bytearray):
         if self.row_y > 4:
             return
+        start, stop, blanks = LINECLEAR_STEPS[self.row_y]
+        for row in (
+            self.completed_row0,
+            self.completed_row1,
+            self.completed_row2,
+            self.completed_row3,
+        ):
+            if row and row < PLAYFIELD_ROWS:
+                offset = row * PLAYFIELD_WIDTH
+                playfield[offset + start : offset + stop] = blanks
 
-        for row in self.completed_rows:
-            if not row:
-                continue
-            offset = row * 10
-            for blank_range in ranges_by_row_y[self.row_y]:
-                for blank in blank_range:
-                    self._playfield_buffer[offset + blank] = BLANK_TILE
+    def overlay_lineclear_compact(self):
+        if self.playstate != 4:
+            return
+        self._blank_completed_rows(self._playfield_buffer)
 
     def overlay_lineclear(self):
-        ranges_by_row_y = {
-            0: (range(4, 5), range(5, 6)),
-            1: (range(3, 5), range(5, 7)),
-            2: (range(2, 5), range(5, 8)),
-            3: (range(1, 5), range(5, 9)),
-            4: (range(0, 5), range(5, 10)),
-        }
-
         if self.frame_counter & 3:
             return
-
-        if self.row_y > 4:
-            return
-
-        for row in self.completed_rows:
-            if not row:
-                continue
-            offset = row * 10
-            for blank_range in ranges_by_row_y[self.row_y]:
-                for blank in blank_range:
-                    self._playfield[offset + blank] = BLANK_TILE
+        self._blank_completed_rows(self._playfield)
 
     @property
     def compressed(self) -> bytearray:
@@ -480,3 +667,11 @@ class GymMemory:
                 | RAM_TO_NTC_TILES[self._playfield[i * 4 + 3]]
             )
         return _compressed
+
+
+# Public fields snapshotted before each update
+STATE_FIELDS = tuple(
+    field.name
+    for field in dataclasses.fields(GymMemory)
+    if not field.name.startswith("_")
+)
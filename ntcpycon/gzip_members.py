@@ -0,0 +1,200 @@
+"""
+Parallel decompression of multi-member gzip files.
+
+FileWriter appends a new gzip member every few hundred frames and records
+where each one starts in <name>.members (little endian 8 byte offsets).
+Members are independent, so they can be inflated on a thread pool.  zlib
+releases the GIL while it works, so threads are enough.
+
+Archives without a .members file are scanned for the gzip magic instead.
+Compressed data can contain the magic too, so every candidate is only a
+guess.  The output is assembled by walking members from offset 0 and only
+following where each member actually ends, so false candidates are never
+used.
+"""
+from __future__ import annotations
+
+import bisect
+import collections
+import concurrent.futures
+import logging
+import os
+import struct
+import typing
+import zlib
+
+logger = logging.getLogger(__name__)
+logger.addHandler(logging.NullHandler())
+
+MAGIC = b"\x1f\x8b\x08"
+
+MEMBERS_SUFFIX = ".members"
+
+MEMBER_RECORD = struct.Struct("<Q")
+
+# compressed bytes handed to each task
+TASK_BYTES = 1 << 20
+
+# gzip with header and trailer
+WBITS = 16 + zlib.MAX_WBITS
+
+
+def record_member(filename: str, offset: int):
+    with open(filename + MEMBERS_SUFFIX, "ab") as file:
+        file.write(MEMBER_RECORD.pack(offset))
+
+
+def recorded_members(filename: str, size: int) -> list[int] | None:
+    try:
+        with open(filename + MEMBERS_SUFFIX, "rb") as file:
+            data = file.read()
+    except OSError:
+        return None
+    usable = len(data) - len(data) % MEMBER_RECORD.size
+    offsets = [offset for (offset,) in MEMBER_RECORD.iter_unpack(data[:usable])]
+    if not offsets or offsets[0] != 0 or offsets != sorted(offsets):
+        logger.warning(f"Ignoring inconsistent {filename}{MEMBERS_SUFFIX}")
+        return None
+    return [offset for offset in offsets if offset < size]
+
+
+def scan_members(data: bytes) -> list[int]:
+    candidates = []
+    offset = data.find(MAGIC)
+    while offset >= 0:
+        candidates.append(offset)
+        offset = data.find(MAGIC, offset + 1)
+    return candidates
+
+
+def inflate_member(
+    view: memoryview, start: int, boundaries: list[int]
+) -> tuple[int, bytes] | None:
+    """
+    (end offset, data) of the member at start, or None if there isn't one.
+    Input is fed up to the next boundary at a time so a member is never
+    handed the rest of the file
+    """
+    decompressor = zlib.decompressobj(WBITS)
+    chunks = []
+    fed = start
+    index = bisect.bisect_right(boundaries, start)
+    try:
+        while not decompressor.eof:
+            if fed >= len(view):
+                return None
+            stop = boundaries[index] if index < len(boundaries) else len(view)
+            index += 1
+            chunks.append(decompressor.decompress(view[fed:stop]))
+            fed = stop
+    except zlib.error:
+        return None
+    return fed - len(decompressor.unused_data), b"".join(chunks)
+
+
+def inflate_region(
+    view: memoryview, boundaries: list[int], first: int, last: int
+) -> dict[int, tuple[int, bytes]]:
+    """
+    Members starting at the first boundary in [first, last) that decodes and
+    chaining on from there until past the region
+    """
+    region_end = boundaries[last] if last < len(boundaries) else len(view)
+    for candidate in boundaries[first:last]:
+        members = {}
+        offset = candidate
+        while offset < region_end:
+            if not (member := inflate_member(view, offset, boundaries)):
+                break
+            members[offset] = member
+            offset = member[0]
+        if members:
+            return members
+    return {}
+
+
+def regions(boundaries: list[int], size: int) -> list[tuple[int, int]]:
+    """
+    Runs of boundaries covering about TASK_BYTES each
+    """
+    result = []
+    first = 0
+    for index in range(1, len(boundaries) + 1):
+        end = boundaries[index] if index < len(boundaries) else size
+        if end - boundaries[first] >= TASK_BYTES or index == len(boundaries):
+            result.append((first, index))
+            first = index
+    return result
+
+
+def iter_members(
+    data: bytes, boundaries: list[int], workers: int | None = None
+) -> typing.Iterator[bytes]:
+    """
+    The contents of each member, in order, as soon as the pool has inflated
+    it.  Only a few regions are decompressed ahead of the consumer
+    """
+    view = memoryview(data)
+    members: dict[int, tuple[int, bytes]] = {}
+    pending = collections.deque()
+    if workers != 1 and len(boundaries) > 1:
+        pending.extend(regions(boundaries, len(data)))
+    # regions queued or running ahead of the member being yielded
+    ahead = 2 * (workers or os.cpu_count() or 1)
+    futures: collections.deque[concurrent.futures.Future] = collections.deque()
+    executor = concurrent.futures.ThreadPoolExecutor(max_workers=workers)
+
+    def submit():
+        while pending and len(futures) < ahead:
+            region = pending.popleft()
+            futures.append(executor.submit(inflate_region, view, boundaries, *region))
+
+    try:
+        offset = 0
+        while offset < len(data):
+            submit()
+            # regions are merged in file order, whichever finishes first
+            while offset not in members and futures:
+                members.update(futures.popleft().result())
+                submit()
+            member = members.pop(offset, None) or inflate_member(
+                view, offset, boundaries
+            )
+            if not member:
+                logger.warning(
+                    f"Ignoring {len(data) - offset} undecodable bytes at {offset}"
+                )
+                break
+            offset, chunk = member
+            yield chunk
+    finally:
+        for future in futures:
+            future.cancel()
+        executor.shutdown()
+
+
+def decompress(data: bytes, boundaries: list[int], workers: int | None = None) -> bytes:
+    return b"".join(iter_members(data, boundaries, workers))
+
+
+def iter_archive(filename: str, workers: int | None = None) -> typing.Iterator[bytes]:
+    """
+    The contents of every member, in order, one member at a time
+    """
+    with open(filename, "rb") as file:
+        data = file.read()
+    if not data:
+        return
+    if not data.startswith(MAGIC):
+        raise ValueError(f"{filename} is not a gzip file")
+    boundaries = recorded_members(filename, len(data))
+    if boundaries is None:
+        boundaries = scan_members(data)
+    yield from iter_members(data, boundaries, workers)
+
+
+def read_archive(filename: str, workers: int | None = None) -> bytes:
+    """
+    The concatenated contents of every member, in order
+    """
+    return b"".join(iter_archive(filename, workers))
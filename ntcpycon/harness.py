@@ -0,0 +1,295 @@
+"""
+Offline end-to-end latency harness.
+
+Runs a synthetic NESTrisOCR client, the real NESTrisOCRServer and WSSender,
+and a local websocket sink standing in for the NTC producer endpoint, all in
+one process.  Each synthetic frame carries a sequence number in its score so
+the sink can match it back to the moment it was written to the socket.
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import logging
+import random
+import socket
+import statistics
+import sys
+import time
+
+import websockets
+
+import ntcpycon.nestrisocr
+import ntcpycon.ws_sender
+
+NESTrisOCRServer = ntcpycon.nestrisocr.NESTrisOCRServer
+WSSender = ntcpycon.ws_sender.WSSender
+
+logger = logging.getLogger(__name__)
+logger.addHandler(logging.NullHandler())
+
+HOST = "127.0.0.1"
+
+# NOCRPayload masks the score to 21 bits
+SEQUENCE_MAX = 0x1F_FF_FF
+
+# Seconds to wait for in-flight frames after the client stops sending
+DRAIN_TIME = 0.5
+
+FPS_STEPS = [60, 120, 240, 480, 960, 1920, 3840]
+
+PIECES = "TJZOSLI"
+
+
+def free_port() -> int:
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+        sock.bind((HOST, 0))
+        return sock.getsockname()[1]
+
+
+def percentile(values: list[float], pct: float) -> float:
+    if not values:
+        return float("nan")
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def ocr_message(sequence: int, elapsed: float) -> bytes:
+    field = "".join(str((sequence + i) % 4) for i in range(200))
+    payload = {
+        "gameid": "1",
+        "preview": PIECES[sequence % len(PIECES)],
+        "lines": str(sequence % 300).zfill(3),
+        "level": str(sequence % 30).zfill(2),
+        "score": str(sequence).zfill(6),
+        "field": field,
+        "time": elapsed,
+    }
+    payload.update({piece: str(sequence % 256).zfill(3) for piece in PIECES})
+    data = json.dumps(payload).encode("utf-8")
+    return len(data).to_bytes(4, byteorder="little") + data
+
+
+class SyntheticOCRClient:
+    def __init__(
+        self,
+        port: int,
+        fps: float = 60.0,
+        jitter: float = 0.0,
+        seed: int | None = None,
+    ):
+        self.port = port
+        self.fps = fps
+        self.jitter = jitter
+        self.random = random.Random(seed)
+        self.sent_at: dict[int, float] = {}
+
+    def __repr__(self):
+        port = self.port
+        fps = self.fps
+        jitter = self.jitter
+        return f"{type(self).__name__}({port=}, {fps=}, {jitter=})"
+
+    async def run(self, duration: float):
+        _, writer = await asyncio.open_connection(HOST, self.port)
+        interval = 1 / self.fps
+        start = time.perf_counter()
+        sequence = 0
+        try:
+            while (scheduled := sequence * interval) < duration:
+                offset = self.random.uniform(-self.jitter, self.jitter) / 1000
+                delay = start + max(0.0, scheduled + offset) - time.perf_counter()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                sequence_id = sequence & SEQUENCE_MAX
+                writer.write(ocr_message(sequence_id, scheduled))
+                self.sent_at[sequence_id] = time.perf_counter()
+                await writer.drain()
+                sequence += 1
+            # keep the connection open while the pipeline drains
+            await asyncio.sleep(DRAIN_TIME)
+        finally:
+            writer.close()
+        return time.perf_counter() - start
+
+
+class WebSocketSink:
+    """
+    Stands in for the NTC producer endpoint.  Records arrival time by sequence.
+    """
+
+    def __init__(self, port: int):
+        self.port = port
+        self.received_at: dict[int, float] = {}
+
+    def __repr__(self):
+        port = self.port
+        return f"{type(self).__name__}({port=})"
+
+    @property
+    def uri(self) -> str:
+        return f"ws://{HOST}:{self.port}/ws/room/producer/harness"
+
+    async def handler(self, websocket, path=None):
+        async for message in websocket:
+            now = time.perf_counter()
+            if isinstance(message, str) or len(message) < 12:
+                continue
+            sequence = int.from_bytes(message[9:12], "big")
+            self.received_at.setdefault(sequence, now)
+
+    async def serve(self):
+        return await websockets.serve(self.handler, HOST, self.port)
+
+
+async def measure(
+    fps: float,
+    duration: float,
+    jitter: float = 0.0,
+    seed: int | None = None,
+) -> dict:
+    sink = WebSocketSink(free_port())
+    sink_server = await sink.serve()
+
+    sender = WSSender(sink.uri)
+    ocr_port = free_port()
+    server = NESTrisOCRServer([sender.queue], ocr_port)
+    client = SyntheticOCRClient(ocr_port, fps, jitter, seed)
+
+    tasks = [
+        asyncio.create_task(sender.send()),
+        asyncio.create_task(server.receive()),
+    ]
+    # let the server bind and the sender connect before sending
+    await asyncio.sleep(0.2)
+    try:
+        wall = await client.run(duration)
+    finally:
+        server.stopped = True
+        sender.stopped = True
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        sink_server.close()
+        await sink_server.wait_closed()
+
+    latencies = [
+        (sink.received_at[seq] - sent) * 1000
+        for seq, sent in client.sent_at.items()
+        if seq in sink.received_at
+    ]
+    sent = len(client.sent_at)
+    received = len(latencies)
+    return {
+        "target_fps": fps,
+        "achieved_fps": sent / max(wall - DRAIN_TIME, 1e-9),
+        "jitter_ms": jitter,
+        "sent": sent,
+        "received": received,
+        "lost": sent - received,
+        "p50_ms": percentile(latencies, 50),
+        "p90_ms": percentile(latencies, 90),
+        "p99_ms": percentile(latencies, 99),
+        "max_ms": max(latencies, default=float("nan")),
+        "mean_ms": statistics.fmean(latencies) if latencies else float("nan"),
+    }
+
+
+def sustainable(result: dict, max_p99: float, max_loss: float) -> bool:
+    if not result["sent"]:
+        return False
+    loss = result["lost"] / result["sent"]
+    return (
+        loss <= max_loss
+        and result["p99_ms"] <= max_p99
+        and result["achieved_fps"] >= result["target_fps"] * 0.95
+    )
+
+
+async def find_max_fps(
+    duration: float,
+    jitter: float,
+    max_p99: float,
+    max_loss: float,
+    seed: int | None = None,
+) -> tuple[float, list[dict]]:
+    best = 0.0
+    results = []
+    for fps in FPS_STEPS:
+        result = await measure(fps, duration, jitter, seed)
+        results.append(result)
+        if not sustainable(result, max_p99, max_loss):
+            break
+        best = fps
+    return best, results
+
+
+def format_result(result: dict) -> str:
+    return (
+        "{target_fps:>6.0f} fps (achieved {achieved_fps:7.1f}): "
+        "sent {sent:>6} lost {lost:>5} | "
+        "p50 {p50_ms:6.2f}ms p90 {p90_ms:6.2f}ms p99 {p99_ms:6.2f}ms "
+        "max {max_ms:6.2f}ms"
+    ).format(**result)
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(
+        prog="ntcpycon-harness",
+        description="Measure NESTrisOCRServer -> BinaryFrame3 -> WSSender latency offline",
+    )
+    parser.add_argument("--fps", type=float, default=60.0)
+    parser.add_argument("--jitter", type=float, default=2.0, help="+/- ms")
+    parser.add_argument("--duration", type=float, default=5.0, help="seconds")
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument(
+        "--sweep",
+        action="store_true",
+        help="find the max sustainable fps instead of measuring one rate",
+    )
+    parser.add_argument("--max-p99", type=float, default=50.0, help="ms")
+    parser.add_argument("--max-loss", type=float, default=0.001, help="ratio")
+    parser.add_argument(
+        "--min-fps",
+        type=float,
+        default=None,
+        help="exit non-zero if the sweep finds less than this",
+    )
+    parser.add_argument("--json", action="store_true", help="print results as json")
+    args = parser.parse_args(argv)
+
+    if args.sweep:
+        best, results = asyncio.run(
+            find_max_fps(
+                args.duration,
+                args.jitter,
+                args.max_p99,
+                args.max_loss,
+                args.seed,
+            ),
+        )
+    else:
+        results = [
+            asyncio.run(measure(args.fps, args.duration, args.jitter, args.seed)),
+        ]
+        best = args.fps if sustainable(results[0], args.max_p99, args.max_loss) else 0
+
+    if args.json:
+        print(json.dumps({"max_sustainable_fps": best, "results": results}, indent=2))
+    else:
+        for result in results:
+            print(format_result(result))
+        print(f"Max sustainable fps: {best:.0f}")
+
+    gate = args.min_fps if args.min_fps is not None else (0 if args.sweep else 1)
+    return 0 if best >= gate else 1
+
+
+def start_harness():
+    sys.exit(main())
+
+
+if __name__ == "__main__":
+    start_harness()
@@ -8,9 +8,15 @@ import time
 import ntcpycon.abstract
 import ntcpycon.nestrisocr
 import ntcpycon.binaryframe
+import ntcpycon.stabilize
+import ntcpycon.trace
 
 Receiver = ntcpycon.abstract.Receiver
 BinaryFrame3 = ntcpycon.binaryframe.BinaryFrame3
+OCRStabilizer = ntcpycon.stabilize.OCRStabilizer
+TRACER = ntcpycon.trace.TRACER
+ENCODED = ntcpycon.trace.ENCODED
+RECEIVED = ntcpycon.trace.RECEIVED
 
 logger = logging.getLogger(__name__)
 logger.addHandler(logging.NullHandler())
@@ -153,38 +159,190 @@ class NOCRPayload:
         return result
 
 
+class OCRRoute:
+    """
+    Where frames from matching connections go.  A connection is matched by
+    a handshake naming the route, the server port it connected to or its
+    source address, in that order
+    """
+
+    def __init__(
+        self,
+        name: str,
+        queues: list[asyncio.Queue],
+        addresses: list[str] | None = None,
+        ports: list[int] | None = None,
+    ):
+        self.name = name
+        self.queues = queues
+        self.addresses = list(addresses or [])
+        self.ports = list(ports or [])
+
+    def __repr__(self):
+        name = self.name
+        addresses = self.addresses
+        ports = self.ports
+        return f"{type(self).__name__}({name=}, {addresses=}, {ports=})"
+
+
+class OCRPipeline:
+    """
+    Decode and dedup state for one client connection
+    """
+
+    def __init__(
+        self,
+        peer: str,
+        route: OCRRoute | None,
+        stabilizer: OCRStabilizer | None = None,
+    ):
+        self.peer = peer
+        self.route = route
+        self.stabilizer = stabilizer
+        self.frame_count = 0
+        self.stopped = False
+        self._last_frame_sent = ()
+        self._last_frame_sent_when = time.time()
+        self._debug = logger.isEnabledFor(logging.DEBUG)
+
+    def __repr__(self):
+        peer = self.peer
+        route = self.route.name if self.route else None
+        return f"{type(self).__name__}({peer=}, {route=})"
+
+    def summary(self) -> str:
+        summary = f"{self.frame_count} frames"
+        if self.stabilizer:
+            summary += f", {self.stabilizer.report()}"
+        return summary
+
+    async def publish(self, payload: bytes):
+        if self._debug:
+            logger.debug(f"Received {len(payload)} bytes from {self.peer}")
+        if TRACER.enabled:
+            TRACER.frame()
+            TRACER.event(RECEIVED, len(payload))
+
+        nocrpayload = NOCRPayload(payload)
+        bframe = BinaryFrame3.from_nestris_ocr(nocrpayload)
+        if self.stabilizer:
+            self.stabilizer.stabilize(bframe)
+        now = time.time()
+        compare_data = bframe.compare_data
+        if (compare_data == self._last_frame_sent) and (
+            now - self._last_frame_sent_when < IDLE_MAX
+        ):
+            if self.stabilizer and self.stabilizer.raw_changed:
+                self.stabilizer.suppressed += 1
+            if self._debug:
+                logger.debug("Skipping transmit of frame")
+            return
+        self.frame_count += 1
+        self._last_frame_sent_when = now
+        self._last_frame_sent = compare_data
+        bpayload = bframe.payload
+        if TRACER.enabled:
+            TRACER.event(ENCODED, len(bpayload))
+            TRACER.queued(bpayload)
+        for queue in self.route.queues:
+            await queue.put(bpayload)
+
+
+def handshake_route(payload: bytes) -> str | None:
+    """
+    The route named by a {"route": "<name>"} handshake message
+    """
+    if not payload.startswith(b"{") or b'"route"' not in payload:
+        return None
+    try:
+        message = json.loads(payload)
+    except ValueError:
+        return None
+    if isinstance(message, dict) and isinstance(route := message.get("route"), str):
+        return route
+    return None
+
 
 class NESTrisOCRServer(Receiver):
     def __init__(
         self,
         queues: list[asyncio.Queue],
         port: int = 3338,
+        routes: list[OCRRoute] | None = None,
+        stabilize: dict | None = None,
     ):
         self.queues = queues
         self.port = port
+        self.routes = list(routes or [])
+        # OCRStabilizer arguments, one stabilizer per connection
+        self.stabilize = stabilize
         self.stopped = False
+        # queues may be filled in later by a config reload
+        self.default_route = OCRRoute("default", queues)
+        self.routes_by_name = {route.name: route for route in self.routes}
+        self.routes_by_port = {
+            route_port: route for route in self.routes for route_port in route.ports
+        }
+        self.routes_by_address = {
+            address: route for route in self.routes for address in route.addresses
+        }
+        self.pipelines: set[OCRPipeline] = set()
+        self.writers: set[asyncio.StreamWriter] = set()
 
     def __repr__(self):
         queues = self.queues
         port = self.port
-        return f"{type(self).__name__}({queues=}, {port=})"
+        routes = self.routes
+        stabilize = self.stabilize
+        return f"{type(self).__name__}({queues=}, {port=}, {routes=}, {stabilize=})"
 
     async def receive(self):
-        tcp_server = await asyncio.start_server(
-            self.handler,
-            port=self.port,
-        )
-        await tcp_server.serve_forever()
+        ports = [self.port]
+        ports.extend(port for port in self.routes_by_port if port != self.port)
+        tcp_servers = [
+            await asyncio.start_server(self.handler, port=port) for port in ports
+        ]
+        try:
+            await asyncio.gather(*(server.serve_forever() for server in tcp_servers))
+        finally:
+            # serve_forever leaves accepted connections open
+            for writer in self.writers:
+                writer.close()
+
+    def route_for(self, client_writer: asyncio.StreamWriter) -> OCRRoute | None:
+        sockname = client_writer.get_extra_info("sockname")
+        peername = client_writer.get_extra_info("peername")
+        if sockname and (route := self.routes_by_port.get(sockname[1])):
+            return route
+        if peername and (route := self.routes_by_address.get(peername[0])):
+            return route
+        return self.default_route if self.queues else None
 
     async def handler(
         self,
         client_reader: asyncio.StreamReader,
         client_writer: asyncio.StreamWriter,
     ):
-        await asyncio.gather(
-            self.write_handler(client_writer),
-            self.read_handler(client_reader),
+        peername = client_writer.get_extra_info("peername")
+        peer = f"{peername[0]}:{peername[1]}" if peername else "unknown"
+        stabilizer = (
+            OCRStabilizer(**self.stabilize) if self.stabilize is not None else None
         )
+        pipeline = OCRPipeline(peer, self.route_for(client_writer), stabilizer)
+        route_name = pipeline.route.name if pipeline.route else None
+        logger.info(f"OCR client {peer} connected, route {route_name}")
+        self.pipelines.add(pipeline)
+        self.writers.add(client_writer)
+        try:
+            await asyncio.gather(
+                self.write_handler(client_writer),
+                self.read_handler(client_reader, pipeline),
+            )
+        finally:
+            self.pipelines.discard(pipeline)
+            self.writers.discard(client_writer)
+            client_writer.close()
+            logger.info(f"OCR client {peer} disconnected after {pipeline.summary()}")
 
     async def write_handler(
         self,
@@ -195,20 +353,21 @@ class NESTrisOCRServer(Receiver):
     async def read_handler(
         self,
         client_reader: asyncio.StreamReader,
+        pipeline: OCRPipeline,
     ):
         ticker = itertools.cycle(range(INFO_CYCLE))
-        frame_count = 0
-        _last_frame_sent = ()
-        _last_frame_sent_when = time.time()
+        first = True
         while True:
             if not next(ticker):
-                logger.info(f"TCP Connection Open: Frame Receive Count: {frame_count}")
-            if self.stopped:
+                logger.info(
+                    f"TCP Connection Open: {pipeline.peer} Frame Receive Count: {pipeline.summary()}"
+                )
+            if self.stopped or pipeline.stopped:
                 break
             try:
                 payload_lengthb = await client_reader.read(4)
                 if not payload_lengthb:
-                    continue
+                    break
                 # https://github.com/alex-ong/NESTrisOCR/blob/488beeb30e596ccd0548152e241e1c6f772e717b/nestris_ocr/network/tcp_client.py#L56
                 payload_length = int.from_bytes(payload_lengthb, byteorder="little")
                 if payload_length > EXPECTED_MAX:
@@ -226,21 +385,21 @@ class NESTrisOCRServer(Receiver):
                     logger.debug("Carrying on")
                     continue
                 payload = await client_reader.read(payload_length)
-                logger.debug(f"Received {len(payload)} bytes")
-
-                nocrpayload = NOCRPayload(payload)
-                bframe = BinaryFrame3.from_nestris_ocr(nocrpayload)
-                now = time.time()
-                if (bframe.compare_data == _last_frame_sent) and (
-                    now - _last_frame_sent_when < IDLE_MAX
-                ):
-                    logger.debug(f"Skipping transmit of frame")
-                    continue
-                frame_count += 1
-                _last_frame_sent_when = now
-                _last_frame_sent = bframe.compare_data
-                for queue in self.queues:
-                    await queue.put(bframe.payload)
+                if first:
+                    first = False
+                    if (name := handshake_route(payload)) is not None:
+                        if not (route := self.routes_by_name.get(name)):
+                            logger.warning(
+                                f"{pipeline.peer} asked for unknown route {name}"
+                            )
+                            break
+                        logger.info(f"{pipeline.peer} routed to {name} by handshake")
+                        pipeline.route = route
+                        continue
+                if not pipeline.route:
+                    logger.warning(f"No route for {pipeline.peer}.  Closing")
+                    break
+                await pipeline.publish(payload)
 
             except Exception as exc:
                 logger.error(f"{type(exc).__name__}: {exc!s}")
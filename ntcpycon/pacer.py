@@ -0,0 +1,73 @@
+from __future__ import annotations
+
+import asyncio
+import collections
+import logging
+
+import ntcpycon.gymmem
+
+NTSC_FRAME_RATE = ntcpycon.gymmem.NTSC_FRAME_RATE
+
+logger = logging.getLogger(__name__)
+logger.addHandler(logging.NullHandler())
+
+INFO_CYCLE = 50000
+
+
+class OutputPacer:
+    """
+    Releases frames to the sender queues at an even cadence.
+
+    Frames that arrive early wait for their slot, frames that arrive late go
+    out immediately and the schedule re-anchors on them.  At most `depth`
+    frames are held; past that the oldest is dropped so the added latency
+    stays bounded.
+    """
+
+    def __init__(
+        self,
+        queues: list[asyncio.Queue],
+        rate: float = NTSC_FRAME_RATE,
+        depth: int = 2,
+    ):
+        self.queues = queues
+        self.rate = rate
+        self.depth = max(1, depth)
+        self.interval = 1 / rate
+        self.buffer: collections.deque[bytes] = collections.deque()
+        self.ready = asyncio.Event()
+        self.released = 0
+        self.dropped = 0
+
+    def __repr__(self):
+        rate = self.rate
+        depth = self.depth
+        return f"{type(self).__name__}({rate=}, {depth=})"
+
+    def put(self, payload: bytes):
+        self.buffer.append(payload)
+        if len(self.buffer) > self.depth:
+            self.buffer.popleft()
+            self.dropped += 1
+        self.ready.set()
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        next_release = loop.time()
+        while True:
+            if not self.buffer:
+                self.ready.clear()
+                await self.ready.wait()
+            now = loop.time()
+            if next_release > now:
+                await asyncio.sleep(next_release - now)
+            elif now - next_release > self.interval:
+                # fell behind or idle, start the cadence over from here
+                next_release = now
+            payload = self.buffer.popleft()
+            for queue in self.queues:
+                await queue.put(payload)
+            self.released += 1
+            next_release += self.interval
+            if not self.released % INFO_CYCLE:
+                logger.info(f"Paced {self.released} frames.  Dropped {self.dropped}")
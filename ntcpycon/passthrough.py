@@ -0,0 +1,194 @@
+"""
+Ingest of ready made NTC binary frames.
+
+Producers that already speak the binary frame format connect over plain
+TCP (frames back to back, all of the version of the first one) or to a
+local websocket server (one frame per binary message).  Frames are
+validated against FRAME_SIZE_BY_VERSION and the header byte and forwarded
+untouched, with the same keepalive dedup as the other receivers.  A TCP
+producer that sends an invalid header is out of step and disconnected.
+"""
+from __future__ import annotations
+
+import asyncio
+import collections
+import logging
+import sys
+import time
+
+from websockets.exceptions import ConnectionClosed
+from websockets.server import serve
+
+import ntcpycon.abstract
+import ntcpycon.binaryframe
+import ntcpycon.file_handler
+import ntcpycon.trace
+
+Receiver = ntcpycon.abstract.Receiver
+BinaryFrame3 = ntcpycon.binaryframe.BinaryFrame3
+frame_key = ntcpycon.binaryframe.frame_key
+FRAME_SIZE_BY_VERSION = ntcpycon.file_handler.FRAME_SIZE_BY_VERSION
+TRACER = ntcpycon.trace.TRACER
+RECEIVED = ntcpycon.trace.RECEIVED
+
+logger = logging.getLogger(__name__)
+logger.addHandler(logging.NullHandler())
+
+IDLE_MAX = 0.25
+
+# unused low bits of the header byte, after version and game type
+HEADER_RESERVED = 0b111
+
+PROTOCOLS = ("tcp", "websocket")
+
+# seconds between per-connection reports
+REPORT_INTERVAL = 60
+
+
+class PassthroughConnection:
+    """
+    Validation and dedup state for one producer
+    """
+
+    def __init__(self, peer: str, queues: list[asyncio.Queue]):
+        self.peer = peer
+        self.queues = queues
+        self.counters: collections.Counter[str] = collections.Counter()
+        self._last_key = b""
+        self._last_sent_when = 0.0
+        self._report_at = time.monotonic() + REPORT_INTERVAL
+
+    def __repr__(self):
+        peer = self.peer
+        return f"{type(self).__name__}({peer=})"
+
+    def valid(self, payload: bytes) -> bool:
+        version = payload[0] >> 5 if payload else 0
+        if (
+            FRAME_SIZE_BY_VERSION.get(version) != len(payload)
+            or payload[0] & HEADER_RESERVED
+        ):
+            self.counters["invalid"] += 1
+            return False
+        return True
+
+    async def publish(self, payload: bytes):
+        if TRACER.enabled:
+            TRACER.frame()
+            TRACER.event(RECEIVED, len(payload))
+        self.counters["received"] += 1
+        now = time.monotonic()
+        # only v3 has a known ctime to ignore; older versions compare whole
+        key = frame_key(payload) if payload[0] >> 5 == BinaryFrame3.VERSION else payload
+        if key == self._last_key and now - self._last_sent_when < IDLE_MAX:
+            self.counters["deduplicated"] += 1
+            return
+        self._last_key = key
+        self._last_sent_when = now
+        self.counters["forwarded"] += 1
+        if TRACER.enabled:
+            TRACER.queued(payload)
+        for queue in self.queues:
+            await queue.put(payload)
+        if now >= self._report_at:
+            self._report_at = now + REPORT_INTERVAL
+            self.report()
+
+    def report(self):
+        counters = ", ".join(f"{name} {count}" for name, count in self.counters.items())
+        logger.info(f"{self.peer}: {counters}")
+
+
+class PassthroughReceiver(Receiver):
+    def __init__(
+        self,
+        queues: list[asyncio.Queue],
+        port: int = 3350,
+        protocol: str = "tcp",
+        host: str | None = None,
+    ):
+        self.queues = queues
+        self.port = port
+        if protocol not in PROTOCOLS:
+            sys.exit(f"protocol must be one of: {', '.join(PROTOCOLS)}")
+        self.protocol = protocol
+        self.host = host
+        self.connections: set[PassthroughConnection] = set()
+        self.writers: set[asyncio.StreamWriter] = set()
+
+    def __repr__(self):
+        queues = self.queues
+        port = self.port
+        protocol = self.protocol
+        return f"{type(self).__name__}({queues=}, {port=}, {protocol=})"
+
+    async def receive(self):
+        logger.info(f"Accepting binary frames over {self.protocol} on {self.port}")
+        if self.protocol == "websocket":
+            async with serve(self.ws_handler, self.host, self.port):
+                await asyncio.Future()
+            return
+        tcp_server = await asyncio.start_server(
+            self.tcp_handler, host=self.host, port=self.port
+        )
+        try:
+            await tcp_server.serve_forever()
+        finally:
+            # serve_forever leaves accepted connections open
+            for writer in self.writers:
+                writer.close()
+
+    def connected(self, peername) -> PassthroughConnection:
+        peer = f"{peername[0]}:{peername[1]}" if peername else "unknown"
+        connection = PassthroughConnection(peer, self.queues)
+        self.connections.add(connection)
+        logger.info(f"Binary frame producer {peer} connected")
+        return connection
+
+    def disconnected(self, connection: PassthroughConnection):
+        self.connections.discard(connection)
+        connection.report()
+        logger.info(f"Binary frame producer {connection.peer} disconnected")
+
+    async def tcp_handler(
+        self,
+        client_reader: asyncio.StreamReader,
+        client_writer: asyncio.StreamWriter,
+    ):
+        connection = self.connected(client_writer.get_extra_info("peername"))
+        self.writers.add(client_writer)
+        try:
+            payload = await client_reader.readexactly(1)
+            version = payload[0] >> 5
+            if length := FRAME_SIZE_BY_VERSION.get(version):
+                payload += await client_reader.readexactly(length - 1)
+            # frames are back to back, so every one after the first is
+            # read whole and must be the same version
+            while connection.valid(payload) and payload[0] >> 5 == version:
+                await connection.publish(payload)
+                payload = await client_reader.readexactly(length)
+            logger.warning(
+                f"{connection.peer} sent an invalid frame header "
+                f"{payload[:1].hex()}, disconnecting"
+            )
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            self.writers.discard(client_writer)
+            client_writer.close()
+            self.disconnected(connection)
+
+    async def ws_handler(self, websocket, path: str | None = None):
+        connection = self.connected(websocket.remote_address)
+        try:
+            async for message in websocket:
+                if isinstance(message, str):
+                    connection.counters["invalid"] += 1
+                    continue
+                if not connection.valid(message):
+                    continue
+                await connection.publish(message)
+        except ConnectionClosed:
+            pass
+        finally:
+            self.disconnected(connection)
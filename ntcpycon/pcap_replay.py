@@ -33,61 +33,44 @@ class WebSocketPayload:
         self.data = 0
 
         blob = self.payload
-        logger.debug(f"Working on a {len(blob)} payload")
+        debug = logger.isEnabledFor(logging.DEBUG)
 
-        first_byte, blob = blob[0], blob[1:]
-        logger.debug(
-            f"First byte has int value of {first_byte}.  Remaining length is {len(blob)}",
-        )
+        first_byte, second_byte, blob = blob[0], blob[1], blob[2:]
 
         self.fin = 1 if first_byte & 0b10000000 else 0
-        logger.debug(f"{self.fin=}")
-
         self.rsv1 = 1 if first_byte & 0b01000000 else 0
-        logger.debug(f"{self.rsv1=}")
-
         self.rsv2 = 1 if first_byte & 0b00100000 else 0
-        logger.debug(f"{self.rsv2=}")
-
         self.rsv3 = 1 if first_byte & 0b00010000 else 0
-        logger.debug(f"{self.rsv3=}")
-
         self.opcode = first_byte & 0b00001111
-        logger.debug(f"{self.opcode=}")
-
-        second_byte, blob = blob[0], blob[1:]
-        logger.debug(
-            f"Second byte has int value of {second_byte}.  Remaining length is {len(blob)}",
-        )
-
         self.mask = 1 if second_byte & 0b10000000 else 0
-        logger.debug(f"{self.mask=}")
-
         self.len = second_byte & 0b01111111
-        logger.debug(f"{self.len=}")
 
         if self.len == 126:
-            logger.debug(f"Length is 126.  Reading length from next two bytes")
             length, blob = blob[:2], blob[2:]
             self.len = int.from_bytes(length, byteorder="big")
 
         if self.len == 127:
-            logger.debug(f"Length is 127.  Reading length from next four bytes")
             length, blob = blob[:4], blob[4:]
             self.len = int.from_bytes(length, byteorder="big")
 
-        if self.mask:
-            self.key, blob = blob[:4], blob[4:]
+        if debug:
             logger.debug(
-                f"Mask is {self.key!r}.  Remaining length of data is {len(blob)}",
+                f"{len(self.payload)} byte payload: {self.fin=} {self.rsv1=} "
+                f"{self.rsv2=} {self.rsv3=} {self.opcode=} {self.mask=} {self.len=}"
             )
+
+        if self.mask:
+            self.key, blob = blob[:4], blob[4:]
+            if debug:
+                logger.debug(
+                    f"Mask is {self.key!r}.  Remaining length of data is {len(blob)}",
+                )
         else:
             self.data = blob
             return
 
         # Line the key up with the length of the data
         key = (self.key * (1 + (len(blob) // len(self.key))))[: len(blob)]
-        logger.debug(f"Key length is {len(key)}")
 
         # XOR the bytes together
         self.data = bytes([b ^ k for b, k in zip(blob, key)])
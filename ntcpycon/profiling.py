@@ -0,0 +1,256 @@
+"""
+Live profiling.
+
+The "profile" control command (SIGUSR2 by default) runs cProfile on the
+connector while it is streaming, no restart needed:
+
+    profile             start, or stop if already profiling
+    profile start
+    profile stop        stop and write the stats to a .prof file
+    profile status
+
+Read the stats with `python -m pstats <file>` or any cProfile viewer.  If
+`summary_interval` is configured, the hottest functions of each pipeline
+stage (see STAGES) are also logged every interval while profiling.
+
+Nothing is hooked in until profiling starts, so it costs nothing when off.
+cProfile only sees the thread that starts it, which is the event loop
+thread.  Time the loop spends waiting on the EDLink executor thread shows
+up as select/epoll time in the "builtin" stage.
+"""
+from __future__ import annotations
+
+import asyncio
+import atexit
+import cProfile
+import datetime
+import functools
+import logging
+import os
+import pathlib
+import pstats
+import time
+
+import ntcpycon.control
+
+CONTROL = ntcpycon.control.CONTROL
+
+logger = logging.getLogger(__name__)
+logger.addHandler(logging.NullHandler())
+
+DEFAULT_DIRECTORY = "profiles"
+
+# functions listed per stage in a summary
+SUMMARY_TOP = 5
+
+# pipeline stage of each ntcpycon module.  Anything else is "loop" for
+# asyncio, "builtin" for C functions such as the select() the loop idles
+# in, or "other"
+STAGES = {
+    "receive": (
+        "edlink",
+        "edrecord",
+        "edsim",
+        "edwindow",
+        "nestrisocr",
+        "passthrough",
+        "pcap_replay",
+    ),
+    "encode": ("binaryframe", "gymmem", "pacer"),
+    "send": (
+        "delta_archive",
+        "file_handler",
+        "frame_store",
+        "gzip_members",
+        "replay_buffer",
+        "websockets",
+        "ws_sender",
+    ),
+}
+
+STAGE_BY_MODULE = {
+    module: stage for stage, modules in STAGES.items() for module in modules
+}
+
+
+@functools.lru_cache(maxsize=None)
+def stage_of(filename: str) -> str:
+    if filename == "~":
+        return "builtin"
+    path = pathlib.PurePath(filename)
+    if "ntcpycon" in path.parts[:-1]:
+        return STAGE_BY_MODULE.get(path.stem, "other")
+    if "websockets" in path.parts[:-1]:
+        return "send"
+    if "asyncio" in path.parts[:-1] or path.name == "selectors.py":
+        return "loop"
+    return "other"
+
+
+def stage_summary(stats: pstats.Stats, top: int = SUMMARY_TOP) -> list[str]:
+    """
+    One line per stage: its share of the profiled time and its hottest
+    functions by own time
+    """
+    by_stage: dict[str, list[tuple[float, str]]] = {}
+    total = 0.0
+    for (filename, line, name), (_, calls, own, _, _) in stats.stats.items():
+        total += own
+        where = f"{pathlib.PurePath(filename).name}:{line}" if line else "builtin"
+        by_stage.setdefault(stage_of(filename), []).append(
+            (own, f"{name} ({where}) {own * 1000:.1f}ms/{calls}")
+        )
+    lines = []
+    for stage, functions in sorted(
+        by_stage.items(), key=lambda item: -sum(own for own, _ in item[1])
+    ):
+        stage_total = sum(own for own, _ in functions)
+        hottest = ", ".join(text for _, text in sorted(functions, reverse=True)[:top])
+        share = stage_total / total if total else 0.0
+        lines.append(f"{stage} {stage_total:.3f}s {share:.0%}: {hottest}")
+    return lines
+
+
+class Profiler:
+    def __init__(self):
+        self.directory = DEFAULT_DIRECTORY
+        self.summary_interval: float | None = None
+        self.top = SUMMARY_TOP
+        self.profile: cProfile.Profile | None = None
+        self.stats: pstats.Stats | None = None
+        self.started_at = 0.0
+        self.files = 0
+        self._collected_at = 0.0
+        self._summary_task: asyncio.Task | None = None
+
+    def __repr__(self):
+        directory = self.directory
+        summary_interval = self.summary_interval
+        return f"{type(self).__name__}({directory=}, {summary_interval=})"
+
+    @property
+    def running(self) -> bool:
+        return self.profile is not None
+
+    def configure(
+        self,
+        directory: str = DEFAULT_DIRECTORY,
+        summary_interval: float | None = None,
+        top: int = SUMMARY_TOP,
+    ):
+        self.directory = directory
+        self.summary_interval = summary_interval
+        self.top = top
+
+    def install(self):
+        CONTROL.register(
+            "profile", self.command, "profile [start|stop|status] profiles the loop"
+        )
+        atexit.register(self.close)
+
+    def start(self) -> str:
+        if self.running:
+            return "error: already profiling"
+        self.stats = pstats.Stats()
+        self.started_at = self._collected_at = time.monotonic()
+        self.profile = cProfile.Profile()
+        self.profile.enable()
+        if self.summary_interval:
+            self._summary_task = asyncio.ensure_future(self.summarize())
+        logger.info("Profiling started")
+        return "profiling"
+
+    def collect(self, restart: bool = True) -> pstats.Stats:
+        """
+        Stats since the last collect, which are also added to the totals.
+        With restart, profiling carries on with a fresh profile
+        """
+        self.profile.disable()
+        stats = pstats.Stats(self.profile)
+        self.stats.add(stats)
+        self._collected_at = time.monotonic()
+        self.profile = None
+        if restart:
+            self.profile = cProfile.Profile()
+            self.profile.enable()
+        return stats
+
+    def log_summary(self, stats: pstats.Stats, seconds: float):
+        logger.info(f"Profile of the last {seconds:.1f}s by stage")
+        for line in stage_summary(stats, self.top):
+            logger.info(f"  {line}")
+
+    async def summarize(self):
+        while True:
+            await asyncio.sleep(self.summary_interval)
+            since = self._collected_at
+            self.log_summary(self.collect(), time.monotonic() - since)
+
+    def finish(self) -> pstats.Stats:
+        if self._summary_task:
+            self._summary_task.cancel()
+            self._summary_task = None
+        since = self._collected_at
+        last = self.collect(restart=False)
+        if self.summary_interval:
+            self.log_summary(last, time.monotonic() - since)
+        return self.stats
+
+    def profile_filename(self) -> str:
+        """
+        Creates and returns an unused stats filename
+        """
+        if not os.path.isdir(self.directory):
+            os.makedirs(self.directory)
+        stamp = datetime.datetime.now().strftime("%Y%m%d-%H%M%S")
+        name = f"profile-{stamp}"
+        suffix = 0
+        while True:
+            filename = os.path.join(self.directory, f"{name}.prof")
+            try:
+                open(filename, "xb").close()
+                return filename
+            except FileExistsError:
+                suffix += 1
+                name = f"profile-{stamp}-{suffix}"
+
+    async def stop(self) -> str:
+        if not self.running:
+            return "error: not profiling"
+        seconds = time.monotonic() - self.started_at
+        stats = self.finish()
+        filename = self.profile_filename()
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(None, stats.dump_stats, filename)
+        self.files += 1
+        logger.info(f"Wrote {seconds:.1f}s of profile to {filename}")
+        return filename
+
+    def status(self) -> str:
+        if not self.running:
+            return f"not profiling, {self.files} profiles written"
+        return f"profiling for {time.monotonic() - self.started_at:.1f}s"
+
+    async def command(self, args: list[str]) -> str:
+        action = args[0] if args else ("stop" if self.running else "start")
+        if action == "start":
+            return self.start()
+        if action == "stop":
+            return await self.stop()
+        if action == "status":
+            return self.status()
+        return f"error: unknown profile action {action!r}"
+
+    def close(self):
+        """
+        Keep a profile that was still running at exit
+        """
+        if not self.running:
+            return
+        stats = self.finish()
+        filename = self.profile_filename()
+        stats.dump_stats(filename)
+        logger.info(f"Wrote profile to {filename}")
+
+
+PROFILER = Profiler()
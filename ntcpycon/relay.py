@@ -0,0 +1,214 @@
+"""
+Local spectator relay.
+
+SpectatorRelay is a sender that runs a websocket server and rebroadcasts
+every frame to any number of viewers: overlays, commentator screens,
+backup NTC instances.  Each frame is framed for the websocket once and
+the same bytes are written to every viewer's transport, like
+websockets.broadcast but without framing it again per viewer.  There is
+no per-viewer queue or task, and compression is off so no viewer needs
+its own encoding.
+
+A viewer can ask for a lower rate by connecting with a query string, e.g.
+ws://127.0.0.1:3360/?fps=30.  Viewers asking for the same rate share a
+tier, which decides once per frame whether that frame is sent to them.
+
+A viewer that doesn't keep up piles up data in its write buffer; once that
+passes buffer_limit bytes it is disconnected (close code 1008) rather than
+being allowed to grow memory without bound.  New viewers get the latest
+frame straight away.
+"""
+from __future__ import annotations
+
+import asyncio
+import logging
+import time
+import urllib.parse
+
+from websockets.exceptions import ConnectionClosed
+from websockets.frames import Frame, Opcode
+from websockets.server import serve
+
+import ntcpycon.abstract
+import ntcpycon.gymmem
+import ntcpycon.trace
+
+Sender = ntcpycon.abstract.Sender
+NTSC_FRAME_RATE = ntcpycon.gymmem.NTSC_FRAME_RATE
+TRACER = ntcpycon.trace.TRACER
+
+logger = logging.getLogger(__name__)
+logger.addHandler(logging.NullHandler())
+
+# bytes waiting to go to one viewer before it is disconnected
+BUFFER_LIMIT = 65536
+
+MAX_SUBSCRIBERS = 1000
+
+# a downsampled tier takes a frame up to half a source frame early, so
+# arrival jitter doesn't turn 30 fps into an uneven 20-30
+DOWNSAMPLE_SLACK = 0.5 / NTSC_FRAME_RATE
+
+# seconds between relay reports
+REPORT_INTERVAL = 60
+
+
+class Tier:
+    """
+    Viewers that asked for the same frame rate.  fps None is every frame
+    """
+
+    def __init__(self, fps: float | None):
+        self.fps = fps
+        self.interval = 1 / fps if fps else 0.0
+        self.subscribers: set = set()
+        self.due = 0.0
+        self.frames = 0
+
+    def __repr__(self):
+        fps = self.fps
+        subscribers = len(self.subscribers)
+        return f"{type(self).__name__}({fps=}, {subscribers=})"
+
+    def take(self, now: float) -> bool:
+        """
+        Whether this tier gets the frame arriving now
+        """
+        if not self.interval:
+            return True
+        if now + DOWNSAMPLE_SLACK < self.due:
+            return False
+        self.due += self.interval
+        if self.due <= now:
+            # behind after a gap or a stall.  Start over rather than burst
+            self.due = now + self.interval
+        return True
+
+
+def requested_fps(path: str) -> float | None:
+    """
+    fps from a viewer's request path, None for every frame
+    """
+    query = urllib.parse.parse_qs(urllib.parse.urlsplit(path).query)
+    try:
+        fps = float(query["fps"][0])
+    except (KeyError, ValueError):
+        return None
+    if not 0 < fps < NTSC_FRAME_RATE:
+        return None
+    return round(fps, 1)
+
+
+class SpectatorRelay(Sender):
+    def __init__(
+        self,
+        port: int = 3360,
+        host: str | None = "127.0.0.1",
+        buffer_limit: int = BUFFER_LIMIT,
+        max_subscribers: int = MAX_SUBSCRIBERS,
+    ):
+        self.port = port
+        self.host = host
+        self.buffer_limit = buffer_limit
+        self.max_subscribers = max_subscribers
+        self.queue = asyncio.Queue()
+        self.tiers: dict[float | None, Tier] = {}
+        self.last: bytes | None = None
+        self.subscribers = 0
+        self.evicted = 0
+        self.rejected = 0
+        self.frames = 0
+        self.deliveries = 0
+        self._report_at = time.monotonic() + REPORT_INTERVAL
+
+    def __repr__(self):
+        port = self.port
+        host = self.host
+        buffer_limit = self.buffer_limit
+        return f"{type(self).__name__}({port=}, {host=}, {buffer_limit=})"
+
+    def tier(self, fps: float | None) -> Tier:
+        if (tier := self.tiers.get(fps)) is None:
+            tier = self.tiers[fps] = Tier(fps)
+        return tier
+
+    async def handler(self, websocket, path: str | None = None):
+        if self.subscribers >= self.max_subscribers:
+            self.rejected += 1
+            await websocket.close(1013, "too many viewers")
+            return
+        tier = self.tier(requested_fps(path or websocket.path))
+        self.subscribers += 1
+        tier.subscribers.add(websocket)
+        logger.debug(f"Viewer {websocket.remote_address} joined {tier!r}")
+        try:
+            if self.last:
+                await websocket.send(self.last)
+            # viewers have nothing to say, but reading lets a close through
+            async for _ in websocket:
+                pass
+        except ConnectionClosed:
+            pass
+        finally:
+            self.subscribers -= 1
+            tier.subscribers.discard(websocket)
+
+    def evict(self, tier: Tier, slow: list):
+        for websocket in slow:
+            tier.subscribers.discard(websocket)
+            self.evicted += 1
+            logger.warning(f"Disconnecting slow viewer {websocket.remote_address}")
+            asyncio.ensure_future(websocket.close(1008, "too slow"))
+
+    def publish(self, message: bytes, now: float | None = None):
+        self.last = message
+        self.frames += 1
+        now = time.monotonic() if now is None else now
+        data = None
+        for tier in self.tiers.values():
+            if not tier.subscribers or not tier.take(now):
+                continue
+            if data is None:
+                # no extensions are negotiated, so the frame is the same for all
+                data = Frame(Opcode.BINARY, message).serialize(mask=False)
+            slow = []
+            for websocket in tier.subscribers:
+                if not websocket.open:
+                    continue
+                transport = websocket.transport
+                transport.write(data)
+                if transport.get_write_buffer_size() > self.buffer_limit:
+                    slow.append(websocket)
+            tier.frames += 1
+            self.deliveries += len(tier.subscribers)
+            if slow:
+                self.evict(tier, slow)
+        if TRACER.enabled:
+            TRACER.sent(message)
+        self.delivered()
+        if now >= self._report_at:
+            self._report_at = now + REPORT_INTERVAL
+            self.report()
+
+    def report(self):
+        tiers = ", ".join(
+            f"{tier.fps or 'all'} fps: {len(tier.subscribers)}"
+            for tier in self.tiers.values()
+            if tier.subscribers
+        )
+        logger.info(
+            f"Relay on {self.port}: {self.subscribers} viewers ({tiers or 'none'}), "
+            f"{self.frames} frames, {self.deliveries} deliveries, "
+            f"{self.evicted} evicted, {self.rejected} rejected"
+        )
+
+    async def send(self):
+        async with serve(self.handler, self.host, self.port, compression=None):
+            logger.info(f"Relaying frames to viewers on port {self.port}")
+            while True:
+                message = await self.queue.get()
+                if not message:
+                    logger.info("Empty message received.  Stopping.")
+                    break
+                self.publish(message)
+        self.report()
@@ -0,0 +1,398 @@
+"""
+Live config reload.
+
+Supervisor runs the receiver and senders described by the config file and
+applies changes to it without a restart, on the "reload" control command
+(SIGHUP by default) or, with reload: watch: true, when the file changes.
+
+Senders are matched by their settings, so an unchanged sender keeps its
+queue, connection and state.  Queues of added and removed senders are
+added to and removed from the list the running receiver already holds, so
+the receiver keeps streaming.  The receiver, and the ocr_server route
+senders that belong to it, are only restarted when the receiver section
+changes.  A config that fails to load leaves everything as it was.
+
+New senders are prepared (websockets connected) concurrently before they
+get frames, and at startup the receiver waits for them, so the first
+frames aren't queued behind TLS handshakes.  Senders that aren't ready
+within their timeout are handled by the startup policy.
+"""
+from __future__ import annotations
+
+import asyncio
+import json
+import logging
+import os
+import time
+
+import ntcpycon.abstract
+import ntcpycon.config
+import ntcpycon.control
+
+Receiver = ntcpycon.abstract.Receiver
+Sender = ntcpycon.abstract.Sender
+CONTROL = ntcpycon.control.CONTROL
+
+logger = logging.getLogger(__name__)
+logger.addHandler(logging.NullHandler())
+
+# seconds between checks of the config file when watching it
+WATCH_INTERVAL = 1.0
+
+# seconds a removed sender gets to drain its queue before it is cancelled
+STOP_TIMEOUT = 2.0
+
+# settings that are only read at startup
+RESTART_SECTIONS = ("trace", "control", "reload", "profile")
+
+# seconds a sender gets to become ready, unless it has its own ready_timeout
+READY_TIMEOUT = 10.0
+
+# senders not ready in time are started anyway and connect in the
+# background, left out until the next reload, or stop the connector from
+# starting.  exit only applies at startup, reloads skip instead.  A sender
+# that fails while running is left out too, unless the policy is exit or it
+# was the last one
+STARTUP_POLICIES = ("degrade", "skip", "exit")
+
+
+def sender_key(kind: str, spec: dict) -> str:
+    return f"{kind} {json.dumps(spec, sort_keys=True, default=str)}"
+
+
+async def prepare_senders(
+    senders: list[Sender],
+    timeout: float = READY_TIMEOUT,
+    policy: str = "degrade",
+) -> list[Sender]:
+    """
+    Readiness barrier.  Prepares the senders concurrently, each within its
+    ready_timeout or timeout, and returns the ones to start
+    """
+    if not senders:
+        return []
+    started = time.monotonic()
+
+    async def prepare(sender: Sender) -> bool:
+        sender.started_at = started
+        limit = sender.ready_timeout or timeout
+        try:
+            await asyncio.wait_for(sender.prepare(), limit)
+        except asyncio.TimeoutError:
+            logger.warning(f"{sender!r} not ready after {limit}s")
+            return False
+        except Exception as exc:
+            logger.warning(f"{sender!r} not ready: {type(exc).__name__}: {exc!s}")
+            return False
+        return True
+
+    ready = await asyncio.gather(*(prepare(sender) for sender in senders))
+    logger.info(
+        f"{sum(ready)} of {len(senders)} senders ready in "
+        f"{(time.monotonic() - started) * 1000:.0f}ms"
+    )
+    if all(ready):
+        return senders
+    if policy == "exit":
+        raise SystemExit("Not all senders were ready at startup")
+    if policy == "skip":
+        return [sender for sender, ok in zip(senders, ready) if ok]
+    return senders
+
+
+class Supervisor:
+    def __init__(self, config_file: str, config: dict):
+        self.config_file = config_file
+        self.config = config
+        self.queues: list[asyncio.Queue] = []
+        self.senders: dict[str, tuple[Sender, asyncio.Task]] = {}
+        self.receiver: Receiver | None = None
+        self.receiver_task: asyncio.Task | None = None
+        self.receiver_dict: dict | None = None
+        self.route_senders: list[tuple[Sender, asyncio.Task]] = []
+        self.routes: list = []
+        self.reloads = 0
+        self.ready_timeout = READY_TIMEOUT
+        self.policy = "degrade"
+        self.launched = time.monotonic()
+        reload_dict = config.get("reload") or {}
+        self.watch = reload_dict.get("watch", False)
+        self.interval = reload_dict.get("interval", WATCH_INTERVAL)
+        self._mtime = self.mtime()
+        self._stopping: set[asyncio.Task] = set()
+        self._lock: asyncio.Lock | None = None
+        self._finished: asyncio.Event | None = None
+        self._failure: BaseException | None = None
+
+    def __repr__(self):
+        config_file = self.config_file
+        receiver = self.receiver
+        senders = [sender for sender, _ in self.senders.values()]
+        return f"{type(self).__name__}({config_file=}, {receiver=}, {senders=})"
+
+    def mtime(self) -> int | None:
+        try:
+            return os.stat(self.config_file).st_mtime_ns
+        except OSError:
+            return None
+
+    def start(self, runner: Sender | Receiver) -> asyncio.Task:
+        if isinstance(runner, Receiver):
+            task = asyncio.create_task(runner.receive())
+        else:
+            task = asyncio.create_task(runner.send())
+        task.add_done_callback(self.task_done)
+        return task
+
+    def task_done(self, task: asyncio.Task):
+        if task in self._stopping:
+            self._stopping.discard(task)
+        elif not task.cancelled() and (exc := task.exception()):
+            if task is self.receiver_task or not self.drop_failed(task, exc):
+                self._failure = exc
+                self._finished.set()
+                return
+        if not self._lock.locked() and not self.running():
+            self._finished.set()
+
+    def drop_failed(self, task: asyncio.Task, exc: BaseException) -> bool:
+        """
+        Takes a failed sender out so the rest keep streaming.  False if it
+        was the last sender or the startup policy is exit
+        """
+        if self.policy == "exit":
+            return False
+        others = [
+            running
+            for running in self.tasks()
+            if running is not task
+            and running is not self.receiver_task
+            and not running.done()
+        ]
+        if not others:
+            return False
+        for key, (sender, sender_task) in self.senders.items():
+            if sender_task is task:
+                del self.senders[key]
+                break
+        else:
+            for running in self.route_senders:
+                if running[1] is task:
+                    sender = running[0]
+                    self.route_senders.remove(running)
+                    break
+            else:
+                return False
+        if sender.queue in self.queues:
+            self.queues.remove(sender.queue)
+        for route in self.routes:
+            if sender.queue in route.queues:
+                route.queues.remove(sender.queue)
+        logger.error(
+            f"{sender!r} failed and is left out until the next reload: "
+            f"{type(exc).__name__}: {exc!s}"
+        )
+        return True
+
+    def tasks(self) -> list[asyncio.Task]:
+        tasks = [task for _, task in self.senders.values()]
+        tasks.extend(task for _, task in self.route_senders)
+        if self.receiver_task:
+            tasks.append(self.receiver_task)
+        return tasks
+
+    def running(self) -> bool:
+        return any(not task.done() for task in self.tasks())
+
+    async def stop_sender(self, sender: Sender, task: asyncio.Task):
+        self._stopping.add(task)
+        if sender.queue in self.queues:
+            self.queues.remove(sender.queue)
+        await sender.queue.put(None)
+        try:
+            await asyncio.wait_for(asyncio.shield(task), STOP_TIMEOUT)
+        except asyncio.TimeoutError:
+            task.cancel()
+        except Exception as exc:
+            logger.warning(f"{sender!r} failed while stopping: {exc!s}")
+        logger.info(f"Stopped {sender!r}")
+
+    async def stop_receiver(self):
+        if not self.receiver_task:
+            return
+        task = self.receiver_task
+        self._stopping.add(task)
+        task.cancel()
+        try:
+            await task
+        except asyncio.CancelledError:
+            pass
+        except Exception as exc:
+            logger.warning(f"{self.receiver!r} failed while stopping: {exc!s}")
+        logger.info(f"Stopped {self.receiver!r}")
+        self.receiver = None
+        self.receiver_task = None
+        self.receiver_dict = None
+        self.routes = []
+        stopping, self.route_senders = self.route_senders, []
+        await asyncio.gather(*(self.stop_sender(*running) for running in stopping))
+
+    async def start_receiver(self, receiver_dict: dict):
+        """
+        Builds and starts the receiver once its route senders are ready,
+        returning False if the receiver section is unusable
+        """
+        try:
+            routes, route_senders = ntcpycon.config.get_ocr_routes(
+                (receiver_dict.get("ocr_server") or {}).get("routes", {})
+            )
+            receiver = ntcpycon.config.get_receiver(self.queues, receiver_dict, routes)
+        except SystemExit as exc:
+            logger.error(f"Unable to start receiver: {exc!s}")
+            return False
+        ready = await prepare_senders(route_senders, self.ready_timeout, self.policy)
+        for sender in route_senders:
+            if sender in ready:
+                continue
+            logger.warning(f"Leaving out {sender!r}")
+            for route in routes:
+                if sender.queue in route.queues:
+                    route.queues.remove(sender.queue)
+        self.routes = routes
+        self.route_senders = [(sender, self.start(sender)) for sender in ready]
+        self.receiver = receiver
+        self.receiver_dict = receiver_dict
+        self.receiver_task = self.start(receiver)
+        logger.info(
+            f"Started {receiver!r} "
+            f"{(time.monotonic() - self.launched) * 1000:.0f}ms after launch"
+        )
+        return True
+
+    def set_startup(self, config: dict):
+        startup = config.get("startup") or {}
+        policy = startup.get("policy", "degrade")
+        if policy not in STARTUP_POLICIES:
+            raise SystemExit(
+                f"startup policy must be one of: {', '.join(STARTUP_POLICIES)}"
+            )
+        timeout = startup.get("timeout", READY_TIMEOUT)
+        if not isinstance(timeout, (int, float)) or timeout <= 0:
+            raise SystemExit("startup timeout must be a positive number of seconds")
+        if policy == "exit" and self.receiver_task is not None:
+            # already running, don't stop over a sender added by a reload
+            policy = "skip"
+        self.ready_timeout = timeout
+        self.policy = policy
+
+    async def apply(self, config: dict):
+        """
+        Brings the running senders and receiver in line with config
+        """
+        started = time.perf_counter()
+        senders_dict = config.get("senders") or {}
+        receiver_dict = config.get("receiver") or {}
+        specs = {
+            sender_key(kind, spec): (kind, spec)
+            for kind, spec in ntcpycon.config.sender_specs(senders_dict)
+        }
+        has_routes = bool((receiver_dict.get("ocr_server") or {}).get("routes"))
+        if not specs and not has_routes:
+            raise SystemExit("At least one sender must be specified in config file")
+
+        self.set_startup(config)
+
+        # build everything new before touching what's running
+        added = {}
+        for key, (kind, spec) in specs.items():
+            if key not in self.senders:
+                added[key] = ntcpycon.config.get_sender(kind, spec)
+        removed = [key for key in self.senders if key not in specs]
+
+        ready = await prepare_senders(
+            list(added.values()), self.ready_timeout, self.policy
+        )
+        for key, sender in list(added.items()):
+            if sender not in ready:
+                logger.warning(f"Leaving out {sender!r} until the next reload")
+                del added[key]
+                continue
+            self.senders[key] = (sender, self.start(sender))
+            self.queues.append(sender.queue)
+            logger.info(f"Started {sender!r}")
+        await asyncio.gather(
+            *(self.stop_sender(*self.senders.pop(key)) for key in removed)
+        )
+
+        if receiver_dict != self.receiver_dict:
+            previous = self.receiver_dict
+            switch_started = time.perf_counter()
+            await self.stop_receiver()
+            if not await self.start_receiver(receiver_dict) and previous is not None:
+                logger.warning("Restarting the previous receiver")
+                await self.start_receiver(previous)
+            if self.receiver_task is None:
+                raise SystemExit("At least one receiver must be specified")
+            if previous is not None:
+                logger.info(
+                    f"Switched receiver in {(time.perf_counter() - switch_started) * 1000:.1f}ms"
+                )
+
+        ntcpycon.config.set_logging(config.get("debug", False))
+        for section in RESTART_SECTIONS:
+            if config.get(section) != self.config.get(section):
+                logger.warning(f"Changes to {section} take effect after a restart")
+        self.config = config
+        logger.info(
+            f"Applied config: {len(added)} senders added, {len(removed)} removed, "
+            f"in {(time.perf_counter() - started) * 1000:.1f}ms"
+        )
+
+    async def reload(self) -> str:
+        async with self._lock:
+            self._mtime = self.mtime()
+            try:
+                config = ntcpycon.config.load_config(self.config_file)
+                await self.apply(config)
+            except SystemExit as exc:
+                logger.error(f"Config not reloaded: {exc!s}")
+                return f"error: {exc!s}"
+            finally:
+                if not self.running():
+                    self._finished.set()
+            self.reloads += 1
+            return (
+                f"reloaded {self.config_file}: {len(self.senders)} senders, "
+                f"receiver {type(self.receiver).__name__}"
+            )
+
+    async def reload_command(self, args: list[str]) -> str:
+        return await self.reload()
+
+    async def watch_config(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            if (mtime := self.mtime()) is not None and mtime != self._mtime:
+                logger.info(f"{self.config_file} changed")
+                await self.reload()
+
+    async def run(self):
+        self.launched = time.monotonic()
+        self._lock = asyncio.Lock()
+        self._finished = asyncio.Event()
+        CONTROL.register("reload", self.reload_command, "re-read the config file")
+        control = asyncio.create_task(CONTROL.serve())
+        watcher = asyncio.create_task(self.watch_config()) if self.watch else None
+        try:
+            async with self._lock:
+                await self.apply(self.config)
+            await self._finished.wait()
+            if self._failure:
+                raise self._failure
+        finally:
+            if watcher:
+                watcher.cancel()
+            control.cancel()
+            CONTROL.unregister("reload")
+            for task in self.tasks():
+                task.cancel()
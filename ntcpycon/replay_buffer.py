@@ -0,0 +1,190 @@
+"""
+Instant replay.
+
+ReplayBuffer keeps the last few minutes of version 3 frames in a ring
+allocated up front, so memory use is fixed however long it runs.  The
+"clip" control command (SIGUSR1 by default) writes part of the ring to a
+.bframes file that FileReceiver and analytics can read:
+
+    clip            everything buffered
+    clip 120        the last 120 seconds
+    clip game       the current game
+"""
+from __future__ import annotations
+
+import array
+import asyncio
+import datetime
+import gzip
+import logging
+import os
+import time
+
+import ntcpycon.abstract
+import ntcpycon.binaryframe
+import ntcpycon.control
+import ntcpycon.file_handler
+import ntcpycon.gymmem
+import ntcpycon.gzip_members
+
+Sender = ntcpycon.abstract.Sender
+BinaryFrame3 = ntcpycon.binaryframe.BinaryFrame3
+CONTROL = ntcpycon.control.CONTROL
+NTSC_FRAME_RATE = ntcpycon.gymmem.NTSC_FRAME_RATE
+MEMBERS_SUFFIX = ntcpycon.gzip_members.MEMBERS_SUFFIX
+record_member = ntcpycon.gzip_members.record_member
+
+logger = logging.getLogger(__name__)
+logger.addHandler(logging.NullHandler())
+
+FRAME_SIZE = ntcpycon.file_handler.FRAME_SIZE_BY_VERSION[BinaryFrame3.VERSION]
+
+
+class ReplayBuffer(Sender):
+    def __init__(
+        self,
+        minutes: float = 5,
+        directory: str = ".",
+        prefix: str = "clip",
+        rate: float = NTSC_FRAME_RATE,
+    ):
+        self.minutes = minutes
+        self.directory = directory
+        self.prefix = prefix
+        self.capacity = max(1, int(minutes * 60 * rate))
+        self.queue = asyncio.Queue()
+        self.frames = bytearray(self.capacity * FRAME_SIZE)
+        self.received_at = array.array("d", bytes(8 * self.capacity))
+        self.written = 0
+        self.skipped = 0
+        self.clips = 0
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        logger.info(
+            f"Replay buffer holds {self.capacity} frames in {len(self.frames)} bytes"
+        )
+
+    def __repr__(self):
+        minutes = self.minutes
+        directory = self.directory
+        return f"{type(self).__name__}({minutes=}, {directory=})"
+
+    def __len__(self) -> int:
+        return min(self.written, self.capacity)
+
+    def add(self, frame: bytes, received_at: float | None = None):
+        if len(frame) != FRAME_SIZE or frame[0] >> 5 != BinaryFrame3.VERSION:
+            self.skipped += 1
+            return
+        slot = self.written % self.capacity
+        self.frames[slot * FRAME_SIZE : (slot + 1) * FRAME_SIZE] = frame
+        self.received_at[slot] = (
+            time.monotonic() if received_at is None else received_at
+        )
+        self.written += 1
+
+    def _slot(self, age: int) -> int:
+        """
+        Ring position of the frame `age` frames before the newest
+        """
+        return (self.written - 1 - age) % self.capacity
+
+    def _count_since(self, since: float) -> int:
+        count = 0
+        while count < len(self) and self.received_at[self._slot(count)] >= since:
+            count += 1
+        return count
+
+    def _count_game(self) -> int:
+        newest = self._slot(0) * FRAME_SIZE
+        game_id = self.frames[newest + 1 : newest + 3]
+        count = 0
+        while count < len(self):
+            offset = self._slot(count) * FRAME_SIZE
+            if self.frames[offset + 1 : offset + 3] != game_id:
+                break
+            count += 1
+        return count
+
+    def snapshot(self, seconds: float | None = None, game: bool = False) -> bytes:
+        """
+        Copy of the newest frames, oldest first
+        """
+        if not len(self):
+            return b""
+        if game:
+            count = self._count_game()
+        elif seconds is not None:
+            count = self._count_since(time.monotonic() - seconds)
+        else:
+            count = len(self)
+        start = (self.written - count) % self.capacity
+        end = start + count
+        if end <= self.capacity:
+            return bytes(self.frames[start * FRAME_SIZE : end * FRAME_SIZE])
+        wrapped = end - self.capacity
+        return bytes(self.frames[start * FRAME_SIZE :]) + bytes(
+            self.frames[: wrapped * FRAME_SIZE]
+        )
+
+    def clip_filename(self) -> str:
+        """
+        Creates and returns an unused clip filename
+        """
+        stamp = datetime.datetime.now().strftime("%Y%m%d-%H%M%S")
+        name = f"{self.prefix}-{stamp}"
+        suffix = 0
+        while True:
+            filename = os.path.join(self.directory, f"{name}.bframes")
+            try:
+                open(filename, "xb").close()
+                return filename
+            except FileExistsError:
+                suffix += 1
+                name = f"{self.prefix}-{stamp}-{suffix}"
+
+    @staticmethod
+    def write_clip(filename: str, data: bytes):
+        compressed = gzip.compress(data)
+        with open(filename, "wb") as file:
+            file.write(compressed)
+        open(filename + MEMBERS_SUFFIX, "wb")
+        record_member(filename, 0)
+
+    async def dump(self, seconds: float | None = None, game: bool = False) -> str:
+        # the copy is a memcpy on the loop; compressing and writing are not
+        data = self.snapshot(seconds, game)
+        if not data:
+            return ""
+        filename = self.clip_filename()
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(None, self.write_clip, filename, data)
+        self.clips += 1
+        logger.info(f"Wrote {len(data) // FRAME_SIZE} frames to {filename}")
+        return filename
+
+    async def clip_command(self, args: list[str]) -> str:
+        seconds = None
+        game = False
+        if args and args[0] == "game":
+            game = True
+        elif args:
+            seconds = float(args[0])
+        if not (filename := await self.dump(seconds, game)):
+            return "error: nothing buffered"
+        return filename
+
+    async def send(self):
+        CONTROL.register(
+            "clip", self.clip_command, "clip [seconds|game] saves the replay buffer"
+        )
+        try:
+            while True:
+                msg = await self.queue.get()
+                if not msg:
+                    logger.info("Empty message received.  Breaking")
+                    break
+                self.add(msg)
+                self.delivered()
+        finally:
+            CONTROL.unregister("clip")
@@ -0,0 +1,182 @@
+"""
+Temporal stabilization of NESTrisOCR readings.
+
+OCR misreads a digit or the preview for a frame now and then.  Each
+flicker makes a frame differ from the last one sent, costs a send and
+shows as a glitch on stream.  OCRStabilizer holds each field at its
+current value until a new reading has persisted, at the cost of `latency`
+frames of delay on real changes to that field:
+
+majority    the most common reading in the last 2 * latency + 1, so a new
+            value wins after latency + 1 readings even if a flicker
+            interrupts it
+hysteresis  a new value is taken after latency + 1 identical readings in
+            a row
+
+Stabilized fields are score, lines, level, the piece stats and preview.
+The playfield isn't, as line clear animations change it every frame.  A
+new game id starts every field over.
+"""
+from __future__ import annotations
+
+import collections
+import logging
+import typing
+
+if typing.TYPE_CHECKING:
+    from .binaryframe import BinaryFrame3
+
+logger = logging.getLogger(__name__)
+logger.addHandler(logging.NullHandler())
+
+METHODS = ("majority", "hysteresis")
+
+# configurable groups and the BinaryFrame3 attributes in them
+FIELDS = {
+    "score": ("score",),
+    "lines": ("lines",),
+    "level": ("level",),
+    "stats": ("t", "j", "z", "o", "s", "l", "i"),
+    "preview": ("preview",),
+}
+
+DEFAULT_LATENCY = 2
+
+
+class Majority:
+    def __init__(self, latency: int):
+        self.size = 2 * latency + 1
+        self.window: collections.deque[int] = collections.deque()
+        self.counts: dict[int, int] = {}
+        self.value: int | None = None
+
+    def update(self, reading: int) -> int:
+        window = self.window
+        counts = self.counts
+        if len(window) == self.size:
+            dropped = window.popleft()
+            if counts[dropped] == 1:
+                del counts[dropped]
+            else:
+                counts[dropped] -= 1
+        window.append(reading)
+        counts[reading] = counts.get(reading, 0) + 1
+        if self.value is None:
+            self.value = reading
+        elif reading != self.value and counts[reading] > counts.get(self.value, 0):
+            self.value = reading
+        return self.value
+
+
+class Hysteresis:
+    def __init__(self, latency: int):
+        self.latency = latency
+        self.value: int | None = None
+        self.candidate: int | None = None
+        self.seen = 0
+
+    def update(self, reading: int) -> int:
+        if self.value is None or reading == self.value:
+            self.value = reading
+            self.candidate = None
+            return reading
+        if reading == self.candidate:
+            self.seen += 1
+        else:
+            self.candidate = reading
+            self.seen = 1
+        if self.seen > self.latency:
+            self.value = reading
+            self.candidate = None
+        return self.value
+
+
+FILTERS = {"majority": Majority, "hysteresis": Hysteresis}
+
+
+class OCRStabilizer:
+    """
+    Per connection stabilization state.  latency applies to every field
+    not given its own in fields; 0 turns a field off
+    """
+
+    def __init__(
+        self,
+        latency: int = DEFAULT_LATENCY,
+        method: str = "majority",
+        fields: dict[str, int] | None = None,
+    ):
+        if method not in FILTERS:
+            raise ValueError(f"Unknown stabilization method {method}")
+        if unknown := set(fields or {}) - set(FIELDS):
+            raise ValueError(f"Unknown stabilization fields {', '.join(unknown)}")
+        self.latency = latency
+        self.method = method
+        self.fields = dict(fields or {})
+        self._group_of = {
+            attribute: group
+            for group, attributes in FIELDS.items()
+            for attribute in attributes
+        }
+        self.latencies = {
+            attribute: self.fields.get(group, latency)
+            for attribute, group in self._group_of.items()
+            if self.fields.get(group, latency) > 0
+        }
+        self.game_id: int | None = None
+        # whether the last reading differed from the one before, i.e. would
+        # have been sent without stabilization
+        self.raw_changed = False
+        self._last_raw: list | None = None
+        self.filters: dict[str, Majority | Hysteresis] = {}
+        self.frames = 0
+        self.stabilized = 0
+        self.suppressed = 0
+        self.held = {group: 0 for group in FIELDS}
+        self.reset()
+
+    def __repr__(self):
+        latency = self.latency
+        method = self.method
+        fields = self.fields
+        return f"{type(self).__name__}({latency=}, {method=}, {fields=})"
+
+    def reset(self):
+        make = FILTERS[self.method]
+        self.filters = {
+            attribute: make(field_latency)
+            for attribute, field_latency in self.latencies.items()
+        }
+
+    def stabilize(self, frame: BinaryFrame3) -> bool:
+        """
+        Replaces flickering fields of frame in place.  Returns whether any
+        field was held back
+        """
+        self.frames += 1
+        raw = frame.compare_data
+        self.raw_changed = raw != self._last_raw
+        self._last_raw = raw
+        if frame.game_id != self.game_id:
+            self.game_id = frame.game_id
+            self.reset()
+        changed = False
+        for attribute, field_filter in self.filters.items():
+            reading = getattr(frame, attribute)
+            value = field_filter.update(reading)
+            if value != reading:
+                setattr(frame, attribute, value)
+                self.held[self._group_of[attribute]] += 1
+                changed = True
+        if changed:
+            self.stabilized += 1
+        return changed
+
+    def report(self) -> str:
+        held = ", ".join(
+            f"{group} {count}" for group, count in self.held.items() if count
+        )
+        return (
+            f"stabilized {self.stabilized} of {self.frames} frames "
+            f"({held or 'nothing held'}), suppressed {self.suppressed} sends"
+        )
@@ -0,0 +1,171 @@
+"""
+Hot path tracing.
+
+Tracing is off unless a `trace:` section is configured.  Call sites check
+TRACER.enabled before doing anything else, so the disabled cost is one
+attribute lookup per frame.  When enabled, 1 in `sample` frames is traced
+and each event is appended to a binary file:
+
+MAGIC, then per event:
+
+1   event id (see EVENTS)
+4   frame sequence number (little endian)
+8   time.perf_counter_ns() (little endian)
+2   payload size (little endian)
+
+Summarize a trace with `python -m ntcpycon.trace <file>`.
+"""
+from __future__ import annotations
+
+import atexit
+import collections
+import logging
+import struct
+import sys
+import time
+
+logger = logging.getLogger(__name__)
+logger.addHandler(logging.NullHandler())
+
+MAGIC = b"NTCT\x01"
+
+RECORD = struct.Struct("<BIQH")
+
+RECEIVED = 1
+ENCODED = 2
+QUEUED = 3
+SENT = 4
+
+EVENTS = {
+    RECEIVED: "received",
+    ENCODED: "encoded",
+    QUEUED: "queued",
+    SENT: "sent",
+}
+
+# payloads remembered for matching SENT events back to their frame.  Every
+# sender reports the same payload, so a tag stays until it is pushed out
+TAGS_MAX = 4096
+
+
+class Tracer:
+    def __init__(self):
+        self.enabled = False
+        self.sample = 1
+        self.filename: str | None = None
+        self.file = None
+        self.sequence = 0
+        self.sampled = False
+        self.records = 0
+        # id(payload) -> (payload, sequence)
+        self._tags: collections.OrderedDict = collections.OrderedDict()
+
+    def __repr__(self):
+        filename = self.filename
+        sample = self.sample
+        return f"{type(self).__name__}({filename=}, {sample=})"
+
+    def configure(self, filename: str, sample: int = 1):
+        self.filename = filename
+        self.sample = max(1, sample)
+        self.file = open(filename, "wb")
+        self.file.write(MAGIC)
+        self.enabled = True
+        atexit.register(self.close)
+        logger.info(f"Tracing 1 in {self.sample} frames to {filename}")
+
+    def frame(self):
+        """
+        Start of a new frame at the receiver
+        """
+        self.sequence = (self.sequence + 1) & 0xFFFFFFFF
+        self.sampled = not self.sequence % self.sample
+
+    def event(self, event: int, size: int = 0):
+        if not self.sampled:
+            return
+        self.file.write(
+            RECORD.pack(event, self.sequence, time.perf_counter_ns(), size & 0xFFFF)
+        )
+        self.records += 1
+
+    def queued(self, payload: bytes):
+        """
+        Remember the payload handed to the sender queues so senders can
+        report it as sent
+        """
+        if not self.sampled:
+            return
+        # holding the payload keeps its id from being reused by a later,
+        # unsampled frame while the tag exists
+        self._tags[id(payload)] = (payload, self.sequence)
+        if len(self._tags) > TAGS_MAX:
+            self._tags.popitem(last=False)
+        self.event(QUEUED, len(payload))
+
+    def sent(self, payload: bytes):
+        tag = self._tags.get(id(payload))
+        if tag is None or tag[0] is not payload:
+            return
+        sequence = tag[1]
+        self.file.write(
+            RECORD.pack(SENT, sequence, time.perf_counter_ns(), len(payload) & 0xFFFF)
+        )
+        self.records += 1
+
+    def close(self):
+        if not self.file:
+            return
+        self.enabled = False
+        self.file.close()
+        self.file = None
+        logger.info(f"Wrote {self.records} trace events to {self.filename}")
+
+
+TRACER = Tracer()
+
+
+def read_trace(filename: str) -> list[tuple[int, int, int, int]]:
+    with open(filename, "rb") as file:
+        if file.read(len(MAGIC)) != MAGIC:
+            raise ValueError(f"{filename} is not a trace file")
+        data = file.read()
+    usable = len(data) - len(data) % RECORD.size
+    return list(RECORD.iter_unpack(data[:usable]))
+
+
+def percentiles(values: list[float]) -> str:
+    ordered = sorted(values)
+    picks = []
+    for pct in (50, 90, 99):
+        picks.append(ordered[min(len(ordered) - 1, len(ordered) * pct // 100)])
+    return (
+        "  ".join(f"p{pct} {value:8.3f}ms" for pct, value in zip((50, 90, 99), picks))
+        + f"  max {ordered[-1]:8.3f}ms"
+    )
+
+
+def summarize(filename: str):
+    frames: dict[int, dict[int, list[int]]] = collections.defaultdict(
+        lambda: collections.defaultdict(list)
+    )
+    for event, sequence, when, _ in read_trace(filename):
+        frames[sequence][event].append(when)
+
+    stages = [(RECEIVED, ENCODED), (ENCODED, QUEUED), (QUEUED, SENT), (RECEIVED, SENT)]
+    print(f"{len(frames)} sampled frames")
+    for start, end in stages:
+        deltas = [
+            (min(events[end]) - events[start][0]) / 1e6
+            for events in frames.values()
+            if events.get(start) and events.get(end)
+        ]
+        if deltas:
+            name = f"{EVENTS[start]} -> {EVENTS[end]}"
+            print(f"{name:<22} {len(deltas):>7}  {percentiles(deltas)}")
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        sys.exit("python -m ntcpycon.trace <trace file>")
+    summarize(sys.argv[1])
@@ -2,41 +2,172 @@ import asyncio
 import itertools
 import logging
 import ssl
+import time
 
 from websockets.client import connect
+from websockets.exceptions import ConnectionClosed, WebSocketException
+from websockets.extensions.permessage_deflate import ClientPerMessageDeflateFactory
 
 import ntcpycon.abstract
+import ntcpycon.binaryframe
 import ntcpycon.pcap_replay
+import ntcpycon.trace
+
+frame_key = ntcpycon.binaryframe.frame_key
+TRACER = ntcpycon.trace.TRACER
 
 logger = logging.getLogger(__name__)
 logger.addHandler(logging.NullHandler())
 
 INFO_CYCLE = 50000
 
+# seconds between bandwidth reports
+REPORT_INTERVAL = 30
+
+PING_TIMEOUT = 10
+
+# weight of each new sample in the smoothed round trip time
+RTT_ALPHA = 0.2
+
+COMPRESSION = ("default", "deflate", "none")
+
+# seconds before the first reconnect attempt, doubling up to RECONNECT_MAX
+RECONNECT_DELAY = 1.0
+RECONNECT_MAX = 30.0
+
 
 class WSSender(ntcpycon.abstract.Sender):
-    def __init__(self, uri: str, no_verify=False):
+    def __init__(
+        self,
+        uri: str,
+        no_verify=False,
+        compression: str = "default",
+        compression_level: int = 6,
+        ping_interval: float | None = None,
+        adaptive: bool = False,
+        rtt_limit: float = 0.25,
+        buffer_limit: int = 16384,
+        ready_timeout: float | None = None,
+    ):
         self.uri = uri
         self.no_verify = no_verify
+        self.compression = compression
+        self.compression_level = compression_level
+        self.ping_interval = ping_interval
+        self.adaptive = adaptive
+        self.rtt_limit = rtt_limit
+        self.buffer_limit = buffer_limit
+        self.ready_timeout = ready_timeout
         self.queue = asyncio.Queue()
         self.connect_kwargs = (
             {"ssl": ssl._create_unverified_context()} if no_verify else {}
         )
+        if compression not in COMPRESSION:
+            raise ValueError(f"compression must be one of: {', '.join(COMPRESSION)}")
+        if compression == "none":
+            self.connect_kwargs["compression"] = None
+        elif compression == "deflate":
+            self.connect_kwargs["compression"] = None
+            self.connect_kwargs["extensions"] = [
+                ClientPerMessageDeflateFactory(
+                    client_max_window_bits=True,
+                    compress_settings={"level": compression_level},
+                ),
+            ]
+        if ping_interval:
+            # the rtt probe replaces the library's keepalive pings
+            self.connect_kwargs["ping_interval"] = None
         self.stopped = False
         self.masked_uri = "/".join(self.uri.split("/")[:-1]) + "/<hidden>"
+        self.websocket = None
+
+        self.rtt: float | None = None
+        self.bytes_sent = 0
+        self.dropped_keepalives = 0
+        self.coalesced = 0
+        self._last_key = b""
 
     def __repr__(self):
         uri = self.masked_uri
         no_verify = self.no_verify
-        return f"{type(self).__name__}({uri=}, {no_verify=})"
+        compression = self.compression
+        adaptive = self.adaptive
+        return (
+            f"{type(self).__name__}({uri=}, {no_verify=}, {compression=}, {adaptive=})"
+        )
 
     async def read_handler(self, websocket):
-        async for message in websocket:
-            logger.info(f"Received from websocket: {message}")
+        try:
+            async for message in websocket:
+                logger.info(f"Received from websocket: {message}")
+        except ConnectionClosed:
+            pass
+
+    async def rtt_probe(self, websocket):
+        while True:
+            await asyncio.sleep(self.ping_interval)
+            start = time.monotonic()
+            try:
+                pong = await websocket.ping()
+                await asyncio.wait_for(pong, PING_TIMEOUT)
+            except asyncio.TimeoutError:
+                logger.warning(f"No pong from {self.masked_uri} in {PING_TIMEOUT}s")
+                self.rtt = PING_TIMEOUT
+                continue
+            except ConnectionClosed:
+                break
+            sample = time.monotonic() - start
+            if self.rtt is None:
+                self.rtt = sample
+            else:
+                self.rtt += RTT_ALPHA * (sample - self.rtt)
+            logger.debug(f"RTT to {self.masked_uri}: {sample * 1000:.1f}ms")
 
-    async def write_handler(self, websocket):
+    def congested(self, websocket) -> bool:
+        if self.rtt is not None and self.rtt > self.rtt_limit:
+            return True
+        transport = websocket.transport
+        return transport is not None and (
+            transport.get_write_buffer_size() > self.buffer_limit
+        )
+
+    def shed(self, message: bytes) -> tuple[bytes | None, bool]:
+        """
+        Called while congested.  Drops keepalives first, then skips any
+        backlog to the newest queued frame.  Returns (message to send or
+        None, stop after sending)
+        """
+        if frame_key(message) == self._last_key:
+            self.dropped_keepalives += 1
+            return None, False
+        while not self.queue.empty():
+            newer = self.queue.get_nowait()
+            if not newer:
+                return message, True
+            message = newer
+            self.coalesced += 1
+        return message, False
+
+    def report(self, elapsed: float, frames: int, sent_bytes: int):
+        rtt = f"{self.rtt * 1000:.1f}ms" if self.rtt is not None else "n/a"
+        logger.info(
+            f"{self.masked_uri}: {sent_bytes / elapsed:.0f} payload bytes/s, "
+            f"{frames / elapsed:.1f} frames/s, rtt {rtt}, "
+            f"dropped keepalives {self.dropped_keepalives}, coalesced {self.coalesced}"
+        )
+
+    async def write_handler(self, websocket) -> bool:
+        """
+        Sends queued frames until told to stop, returning True, or until the
+        connection fails, returning False
+        """
+        stopped = False
         ticker = itertools.cycle(range(INFO_CYCLE))
         frame_count = 0
+        report_start = time.monotonic()
+        report_frames = frame_count
+        report_bytes = self.bytes_sent
+        debug = logger.isEnabledFor(logging.DEBUG)
         while True:
             if not next(ticker):
                 logger.info(
@@ -44,24 +175,93 @@ class WSSender(ntcpycon.abstract.Sender):
                 )
             if self.stopped:
                 logger.debug("Stopping")
+                stopped = True
                 break
             try:
                 message = await self.queue.get()
                 if not message:
                     logger.info("Empty message received.  Stopping.")
+                    stopped = True
                     break
-                else:
-                    logger.debug(f"Msg len: {len(message)} -> {self.masked_uri}")
+                stop = False
+                if self.adaptive and self.congested(websocket):
+                    message, stop = self.shed(message)
+                if message:
+                    if debug:
+                        logger.debug(f"Msg len: {len(message)} -> {self.masked_uri}")
                     await websocket.send(message)
+                    if TRACER.enabled:
+                        TRACER.sent(message)
+                    self.delivered()
                     frame_count += 1
+                    self.bytes_sent += len(message)
+                    if self.adaptive:
+                        self._last_key = frame_key(message)
+                if stop:
+                    logger.info("Empty message received.  Stopping.")
+                    stopped = True
+                    break
             except Exception as exc:
                 logger.error(f"{type(exc).__name__}: {exc!s}")
                 break
+            if (elapsed := time.monotonic() - report_start) >= REPORT_INTERVAL:
+                self.report(
+                    elapsed,
+                    frame_count - report_frames,
+                    self.bytes_sent - report_bytes,
+                )
+                report_start += elapsed
+                report_frames = frame_count
+                report_bytes = self.bytes_sent
         logger.info("while loop broken")
+        # lets read_handler and rtt_probe finish so send() returns
+        await websocket.close()
+        return stopped
 
-    async def send(self):
-        websocket = await connect(self.uri, **self.connect_kwargs)  # type: ignore
-        await asyncio.gather(
-            self.read_handler(websocket),
-            self.write_handler(websocket),
+    def discard_backlog(self) -> bool:
+        """
+        Drops frames queued while disconnected, which would only arrive
+        late.  Returns True if a stop was queued among them
+        """
+        while not self.queue.empty():
+            if not self.queue.get_nowait():
+                return True
+        return False
+
+    async def prepare(self):
+        started = time.monotonic()
+        self.websocket = await connect(self.uri, **self.connect_kwargs)  # type: ignore
+        logger.info(
+            f"Connected to {self.masked_uri} in {(time.monotonic() - started) * 1000:.0f}ms"
         )
+
+    async def send(self):
+        delay = RECONNECT_DELAY
+        while True:
+            # connected by prepare(), unless that didn't finish in time
+            websocket, self.websocket = self.websocket, None
+            if websocket is None:
+                try:
+                    websocket = await connect(self.uri, **self.connect_kwargs)  # type: ignore
+                except (OSError, asyncio.TimeoutError, WebSocketException) as exc:
+                    logger.warning(
+                        f"Unable to connect to {self.masked_uri}: "
+                        f"{type(exc).__name__}: {exc!s}.  Retrying in {delay:g}s"
+                    )
+                    await asyncio.sleep(delay)
+                    delay = min(RECONNECT_MAX, delay * 2)
+                    if self.discard_backlog():
+                        return
+                    continue
+                logger.info(f"Connected to {self.masked_uri}")
+            delay = RECONNECT_DELAY
+            write = asyncio.create_task(self.write_handler(websocket))
+            jobs = [self.read_handler(websocket), write]
+            if self.ping_interval:
+                jobs.append(self.rtt_probe(websocket))
+            await asyncio.gather(*jobs)
+            if write.result():
+                return
+            logger.warning(f"Lost connection to {self.masked_uri}, reconnecting")
+            if self.discard_backlog():
+                return
@@ -0,0 +1,51 @@
+import random
+
+import pytest
+
+import ntcpycon.analytics
+import ntcpycon.binaryframe
+import ntcpycon.frame_store
+
+
+def game_frames(seed: int = 1) -> list[bytes]:
+    rng = random.Random(seed)
+    frames = []
+    for game_id in (5, 6):
+        lines = 0
+        stats = [0] * 7
+        # starts just before the 28 bit elapsed counter wraps
+        elapsed = 2**28 - 500
+        for _ in range(3000):
+            frame = ntcpycon.binaryframe.BinaryFrame3()
+            frame.game_id = game_id
+            frame.elapsed = elapsed % 2**28
+            elapsed += 17
+            if rng.random() < 0.01:
+                lines += rng.choice([1, 2, 3, 4])
+            if rng.random() < 0.05:
+                stats[rng.randrange(7)] += 1
+            frame.t, frame.j, frame.z, frame.o, frame.s, frame.l, frame.i = stats
+            frame.lines = lines
+            frame.level = lines // 10
+            frame.score = lines * 100
+            frame.cur_piece_das = rng.randrange(17)
+            frames.append(frame.payload)
+    return frames
+
+
+def test_bulk_matches_per_frame(tmp_path, monkeypatch):
+    pytest.importorskip("numpy")
+    filename = str(tmp_path / "games.frames")
+    writer = ntcpycon.frame_store.FrameStoreWriter(filename, overwrite=True)
+    for payload in game_frames():
+        writer.write(payload)
+    writer.file.close()
+    writer.index.close()
+
+    bulk = ntcpycon.analytics.analyze_file(filename)
+    monkeypatch.setattr(ntcpycon.analytics, "np", None)
+    per_frame = ntcpycon.analytics.analyze_file(filename)
+
+    assert [game.game_id for game in bulk] == [5, 6]
+    assert bulk[0].level_transitions
+    assert bulk == per_frame
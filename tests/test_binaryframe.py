@@ -0,0 +1,40 @@
+import ntcpycon.binaryframe
+
+BinaryFrame3 = ntcpycon.binaryframe.BinaryFrame3
+frame_key = ntcpycon.binaryframe.frame_key
+
+
+def frame(**fields) -> BinaryFrame3:
+    result = BinaryFrame3()
+    result.game_id = 7
+    result.elapsed = 1000
+    result.lines = 123
+    result.score = 45678
+    for name, value in fields.items():
+        setattr(result, name, value)
+    return result
+
+
+def test_frame_key_ignores_elapsed():
+    base = frame().payload
+    assert frame_key(frame(elapsed=2**28 - 1).payload) == frame_key(base)
+    assert frame_key(frame(elapsed=0).payload) == frame_key(base)
+
+
+def test_frame_key_sees_everything_else():
+    base = frame_key(frame().payload)
+    # lines shares byte 6 with the low nibble of elapsed
+    assert frame_key(frame(lines=123 + 256).payload) != base
+    assert frame_key(frame(lines=124).payload) != base
+    assert frame_key(frame(game_id=8).payload) != base
+    assert frame_key(frame(score=45679).payload) != base
+    playfield = bytearray(50)
+    playfield[49] = 1
+    assert frame_key(frame(playfield=playfield).payload) != base
+
+
+def test_payload_round_trip():
+    original = frame(t=1, j=2, z=3, o=4, s=5, l=6, i=1023, preview=2, cur_piece=4)
+    decoded = BinaryFrame3.from_payload(original.payload)
+    assert decoded.compare_data == original.compare_data
+    assert decoded.elapsed == original.elapsed
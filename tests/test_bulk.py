@@ -0,0 +1,45 @@
+import random
+
+import pytest
+
+import ntcpycon.binaryframe
+import ntcpycon.bulk
+
+BinaryFrame3 = ntcpycon.binaryframe.BinaryFrame3
+
+
+def payloads(count: int = 200, seed: int = 1) -> list[bytes]:
+    # every bit pattern after the version byte is a valid frame
+    rng = random.Random(seed)
+    return [
+        bytes([BinaryFrame3.VERSION << 5]) + rng.randbytes(72) for _ in range(count)
+    ]
+
+
+def test_decode_matches_from_payload():
+    pytest.importorskip("numpy")
+    data = payloads()
+    decoded = ntcpycon.bulk.decode(ntcpycon.bulk.from_bytes(b"".join(data)))
+
+    assert len(decoded) == len(data)
+    for row, payload in zip(decoded, data):
+        frame = BinaryFrame3.from_payload(payload)
+        for name, _ in ntcpycon.bulk.FIELDS:
+            assert row[name] == getattr(frame, name), name
+        tiles = [
+            byte >> shift & 0b11 for byte in frame.playfield for shift in (6, 4, 2, 0)
+        ]
+        assert row["playfield"].tolist() == tiles
+
+
+def test_other_versions_are_skipped():
+    pytest.importorskip("numpy")
+    data = payloads(10)
+    # a version 1 frame between the version 3 ones
+    mixed = b"".join(data[:4]) + bytes([1 << 5]) + bytes(70) + b"".join(data[4:])
+    frames = ntcpycon.bulk.from_bytes(mixed)
+
+    assert frames.tolist() == [list(payload) for payload in data]
+    assert ntcpycon.bulk.column(frames, "score").tolist() == [
+        BinaryFrame3.from_payload(payload).score for payload in data
+    ]
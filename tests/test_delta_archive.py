@@ -0,0 +1,72 @@
+import os
+import random
+
+import ntcpycon.binaryframe
+import ntcpycon.delta_archive
+
+
+def frames(count: int = 500, seed: int = 1) -> list[bytes]:
+    rng = random.Random(seed)
+    frame = ntcpycon.binaryframe.BinaryFrame3()
+    frame.game_id = 3
+    result = []
+    elapsed = 1000
+    for index in range(count):
+        # long idle runs between changes, and a new game that restarts the clock
+        if rng.random() < 0.2:
+            frame.score = rng.randrange(1000000)
+            frame.lines = rng.randrange(300)
+            frame.cur_piece_das = rng.randrange(17)
+        if index == count // 2:
+            frame.game_id = 4
+            elapsed = 0
+        frame.elapsed = elapsed
+        elapsed += rng.choice([16, 17, 17, 33])
+        result.append(frame.payload)
+    return result
+
+
+def write_archive(filename: str, payloads: list[bytes], keyframe_interval: int):
+    writer = ntcpycon.delta_archive.DeltaArchiveWriter(
+        filename, overwrite=True, keyframe_interval=keyframe_interval
+    )
+    for payload in payloads:
+        writer.write(payload)
+    writer.close()
+
+
+def test_round_trip(tmp_path):
+    filename = str(tmp_path / "session.dframes")
+    payloads = frames()
+    write_archive(filename, payloads, keyframe_interval=64)
+
+    with ntcpycon.delta_archive.DeltaArchive(filename) as archive:
+        assert len(archive) == len(payloads)
+        assert len(archive.blocks) == 8
+        assert list(archive) == payloads
+
+
+def test_seek(tmp_path):
+    filename = str(tmp_path / "session.dframes")
+    payloads = frames()
+    write_archive(filename, payloads, keyframe_interval=64)
+
+    with ntcpycon.delta_archive.DeltaArchive(filename) as archive:
+        for index in (0, 63, 64, 250, 499, -1):
+            assert archive[index] == payloads[index]
+        assert list(archive.iter_from(100)) == payloads[100:]
+        assert list(archive.iter_from(len(payloads))) == []
+
+
+def test_scan_without_index(tmp_path):
+    filename = str(tmp_path / "session.dframes")
+    payloads = frames()
+    write_archive(filename, payloads, keyframe_interval=64)
+    os.remove(filename + ntcpycon.delta_archive.BLOCKS_SUFFIX)
+    # a block still being written is left out
+    with open(filename, "ab") as file:
+        file.write(ntcpycon.delta_archive.BLOCK_HEADER.pack(1000, 64) + b"partial")
+
+    with ntcpycon.delta_archive.DeltaArchive(filename) as archive:
+        assert list(archive.iter_from(300)) == payloads[300:]
+        assert list(archive) == payloads
@@ -0,0 +1,60 @@
+import ntcpycon.gymmem
+
+PlayfieldAssembler = ntcpycon.gymmem.PlayfieldAssembler
+
+
+def feed(assembler, first: int, count: int, skip: int | None = None) -> list[int]:
+    """
+    Frames first to first + count - 1 the way ed2ntc sends them, a chunk on
+    every odd frame.  Returns the frame counters that published a playfield
+    """
+    published = []
+    for frame in range(first, first + count):
+        frame_counter = frame & 0xFFFF
+        if frame_counter == skip:
+            continue
+        assembler.frame(frame_counter)
+        if not frame_counter & 1:
+            continue
+        vram_row = (frame >> 1) % 5 * 4
+        chunk = bytes([frame_counter & 0xFF]) * 40
+        if assembler.add_chunk(vram_row, chunk, frame_counter):
+            published.append(frame_counter)
+    return published
+
+
+def test_coherent_cycles_publish():
+    assembler = PlayfieldAssembler()
+    # the first cycle starts at vram row 0 on frame 1
+    assert feed(assembler, 1, 30) == [9, 19, 29]
+    assert not assembler.stale
+    assert assembler.stale_count == 0
+    assert assembler.assembly[160:] == bytes([9 + 20]) * 40
+
+
+def test_partial_first_cycle_is_held_back():
+    assembler = PlayfieldAssembler()
+    # joins at vram row 8, so rows 0 to 7 were never written
+    assert feed(assembler, 5, 5) == []
+    assert assembler.stale
+    assert assembler.stale_count == 1
+
+
+def test_gap_tears_the_cycle():
+    assembler = PlayfieldAssembler()
+    assert feed(assembler, 1, 10) == [9]
+    # frame 14 is dropped partway through the next cycle
+    assert feed(assembler, 11, 10, skip=14) == []
+    assert assembler.stale
+    assert assembler.stale_count == 1
+    # the next full cycle is coherent again
+    assert feed(assembler, 21, 10) == [29]
+    assert not assembler.stale
+    assert assembler.published == 2
+
+
+def test_frame_counter_wraps():
+    assembler = PlayfieldAssembler()
+    # a cycle from frame 0xFFFB to frame 3
+    assert feed(assembler, 0xFFFB, 10) == [3]
+    assert not assembler.stale
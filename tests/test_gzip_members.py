@@ -0,0 +1,63 @@
+import gzip
+import os
+import random
+
+import pytest
+
+import ntcpycon.gzip_members
+
+
+def write_members(filename: str, chunks: list[bytes], record: bool):
+    offset = 0
+    with open(filename, "wb") as file:
+        for index, chunk in enumerate(chunks):
+            if record:
+                ntcpycon.gzip_members.record_member(filename, offset)
+            # stored members keep the gzip magic in the data as it is
+            member = gzip.compress(chunk, compresslevel=0 if index % 2 else 9)
+            file.write(member)
+            offset += len(member)
+
+
+def chunks() -> list[bytes]:
+    rng = random.Random(1)
+    result = []
+    for index in range(40):
+        chunk = rng.randbytes(3000)
+        if index % 5 == 1:
+            chunk += ntcpycon.gzip_members.MAGIC + rng.randbytes(20)
+        result.append(chunk)
+    return result
+
+
+@pytest.mark.parametrize("record", [True, False])
+@pytest.mark.parametrize("workers", [1, 4])
+def test_read_archive(tmp_path, monkeypatch, record, workers):
+    # several regions per file, some starting at a false candidate
+    monkeypatch.setattr(ntcpycon.gzip_members, "TASK_BYTES", 8000)
+    filename = str(tmp_path / "frames.bframes")
+    data = chunks()
+    write_members(filename, data, record)
+
+    with open(filename, "rb") as file:
+        candidates = ntcpycon.gzip_members.scan_members(file.read())
+    assert len(candidates) > len(data)
+    assert ntcpycon.gzip_members.read_archive(filename, workers) == b"".join(data)
+
+
+def test_inconsistent_members_file(tmp_path):
+    filename = str(tmp_path / "frames.bframes")
+    data = chunks()
+    write_members(filename, data, record=False)
+    ntcpycon.gzip_members.record_member(filename, 100)
+
+    size = os.path.getsize(filename)
+    assert ntcpycon.gzip_members.recorded_members(filename, size) is None
+    assert ntcpycon.gzip_members.read_archive(filename) == b"".join(data)
+
+
+def test_not_gzip(tmp_path):
+    filename = tmp_path / "frames.bframes"
+    filename.write_bytes(b"not gzip")
+    with pytest.raises(ValueError):
+        ntcpycon.gzip_members.read_archive(str(filename))
@@ -1,12 +1,31 @@
 from ntcpycon import __version__
 
 import ntcpycon.abstract
+import ntcpycon.analytics
 import ntcpycon.nestrisocr
+import ntcpycon.benchmark
 import ntcpycon.binaryframe
+import ntcpycon.bulk
 import ntcpycon.config
+import ntcpycon.edrecord
+import ntcpycon.edsim
+import ntcpycon.edwindow
 import ntcpycon.connect
+import ntcpycon.control
+import ntcpycon.delta_archive
 import ntcpycon.file_handler
+import ntcpycon.frame_store
+import ntcpycon.gzip_members
+import ntcpycon.harness
+import ntcpycon.pacer
+import ntcpycon.passthrough
 import ntcpycon.pcap_replay
+import ntcpycon.profiling
+import ntcpycon.relay
+import ntcpycon.reload
+import ntcpycon.replay_buffer
+import ntcpycon.stabilize
+import ntcpycon.trace
 import ntcpycon.ws_sender
 
 
@@ -0,0 +1,55 @@
+import asyncio
+
+import ntcpycon.binaryframe
+import ntcpycon.passthrough
+
+PassthroughConnection = ntcpycon.passthrough.PassthroughConnection
+
+
+def payload(score: int = 0, elapsed: int = 0) -> bytes:
+    frame = ntcpycon.binaryframe.BinaryFrame3()
+    frame.score = score
+    frame.elapsed = elapsed
+    return frame.payload
+
+
+def test_valid_headers():
+    connection = PassthroughConnection("test", [])
+    assert connection.valid(payload())
+    # versions 1 and 2 have their own sizes
+    assert connection.valid(bytes([1 << 5]) + bytes(70))
+    assert connection.valid(bytes([2 << 5]) + bytes(71))
+    assert connection.counters["invalid"] == 0
+
+
+def test_invalid_headers():
+    connection = PassthroughConnection("test", [])
+    good = payload()
+    invalid = [
+        b"",
+        good[:-1],
+        good + b"\x00",
+        # unknown version
+        bytes([7 << 5]) + good[1:],
+        # version 2 header on a version 3 sized frame
+        bytes([2 << 5]) + good[1:],
+    ]
+    invalid += [bytes([good[0] | bit]) + good[1:] for bit in (1, 2, 4)]
+    for frame in invalid:
+        assert not connection.valid(frame), frame[:1].hex()
+    assert connection.counters["invalid"] == len(invalid)
+
+
+def test_publish_deduplicates_keepalives():
+    queue = asyncio.Queue()
+    connection = PassthroughConnection("test", [queue])
+
+    async def run():
+        await connection.publish(payload(elapsed=1))
+        # only the timestamp changed
+        await connection.publish(payload(elapsed=2))
+        await connection.publish(payload(score=100, elapsed=3))
+
+    asyncio.run(run())
+    assert queue.qsize() == 2
+    assert connection.counters["deduplicated"] == 1
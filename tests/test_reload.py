@@ -0,0 +1,54 @@
+import asyncio
+
+import yaml
+
+import ntcpycon.config
+import ntcpycon.reload
+import ntcpycon.ws_sender
+
+
+def write_config(path, senders: dict):
+    config = {"receiver": {"edlink": {"simulate": True}}, "senders": senders}
+    path.write_text(yaml.safe_dump(config))
+    return ntcpycon.config.load_config(str(path))
+
+
+def test_reload_isolates_failing_sender(tmp_path, monkeypatch):
+    async def fail(self):
+        raise ConnectionRefusedError("unreachable")
+
+    monkeypatch.setattr(ntcpycon.ws_sender.WSSender, "send", fail)
+    monkeypatch.setattr(ntcpycon.ws_sender.WSSender, "prepare", fail)
+    config_file = tmp_path / "config.yml"
+    local_file = {"filename": str(tmp_path / "out.bframes"), "overwrite": True}
+
+    async def run():
+        config = write_config(config_file, {"local_file": local_file})
+        supervisor = ntcpycon.reload.Supervisor(str(config_file), config)
+        task = asyncio.create_task(supervisor.run())
+        await asyncio.sleep(0.2)
+        receiver_task = supervisor.receiver_task
+        (file_sender, file_task), *_ = supervisor.senders.values()
+
+        write_config(
+            config_file,
+            {
+                "local_file": local_file,
+                "websockets": [{"uri": "ws://127.0.0.1:9/ws/room/producer/x"}],
+            },
+        )
+        assert (await supervisor.reload()).startswith("reloaded")
+        await asyncio.sleep(0.2)
+
+        assert not task.done()
+        assert supervisor.receiver_task is receiver_task
+        assert not receiver_task.done()
+        assert list(supervisor.senders.values()) == [(file_sender, file_task)]
+        assert supervisor.queues == [file_sender.queue]
+        task.cancel()
+        try:
+            await task
+        except asyncio.CancelledError:
+            pass
+
+    asyncio.run(run())
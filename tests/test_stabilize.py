@@ -0,0 +1,53 @@
+import pytest
+
+import ntcpycon.binaryframe
+import ntcpycon.stabilize
+
+
+def run(filter_, readings: list[int]) -> list[int]:
+    return [filter_.update(reading) for reading in readings]
+
+
+def test_majority():
+    majority = ntcpycon.stabilize.Majority(latency=2)
+    # a single flicker is held back
+    assert run(majority, [5, 5, 5, 9, 5]) == [5, 5, 5, 5, 5]
+    # a new value wins on its third reading, even with a flicker between
+    assert run(majority, [7, 7, 5, 7]) == [5, 5, 5, 7]
+
+
+def test_hysteresis():
+    hysteresis = ntcpycon.stabilize.Hysteresis(latency=2)
+    assert run(hysteresis, [5, 9, 5]) == [5, 5, 5]
+    # an interrupted run starts over
+    assert run(hysteresis, [7, 7, 5, 7, 7]) == [5, 5, 5, 5, 5]
+    assert run(hysteresis, [7]) == [7]
+
+
+def frame(game_id: int, score: int, lines: int) -> ntcpycon.binaryframe.BinaryFrame3:
+    result = ntcpycon.binaryframe.BinaryFrame3()
+    result.game_id = game_id
+    result.score = score
+    result.lines = lines
+    return result
+
+
+@pytest.mark.parametrize("method", ntcpycon.stabilize.METHODS)
+def test_stabilizer(method):
+    # lines isn't stabilized
+    stabilizer = ntcpycon.stabilize.OCRStabilizer(
+        latency=1, method=method, fields={"lines": 0}
+    )
+    first = frame(1, 100, 1)
+    assert not stabilizer.stabilize(first)
+    flicker = frame(1, 800, 2)
+    assert stabilizer.stabilize(flicker)
+    assert (flicker.score, flicker.lines) == (100, 2)
+    assert stabilizer.held["score"] == 1
+    assert not stabilizer.stabilize(frame(1, 100, 2))
+
+    # a new game takes its first readings as they are
+    new_game = frame(2, 0, 0)
+    assert not stabilizer.stabilize(new_game)
+    assert new_game.score == 0
+    assert stabilizer.stabilized == 1